@@ -1,11 +1,25 @@
 import os
 import sqlite3
-import pandas as pd
+from datetime import datetime
 from functools import wraps
-from flask import Flask, render_template, request, redirect, url_for, session, flash, g
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Flask, Response, render_template, request, redirect, url_for, session, flash, g, make_response, jsonify, abort
+from markupsafe import Markup
+from werkzeug.security import generate_password_hash
+import archive
+import backtest
+import betslip
+import board_cache
 import database
+import events
+import exposure
+import goal_model
+import history
+import ingestion
+import jobs
+import metrics
 import odds_calculator
+import passwords
+import wallet
 
 app = Flask(__name__)
 app.config.from_mapping(
@@ -19,6 +33,40 @@ except OSError:
     pass
 
 database.init_app(app)
+metrics.init_app(app)
+passwords.init_app(app)
+events.init_app(app)
+odds_calculator.init_app(app)
+goal_model.init_app(app)
+exposure.init_app(app)
+jobs.init_app(app)
+archive.init_app(app)
+backtest.init_app(app)
+
+# Cuotas vigentes de un partido que todavía admite apuestas.
+CURRENT_ODDS_SQL = """
+    SELECT o.odds_id, o.odds_home, o.odds_draw, o.odds_away
+    FROM matches m JOIN odds o ON o.odds_id = m.current_odds_id
+    WHERE m.match_id = ? AND m.status = 'SCHEDULED'
+"""
+
+def enqueue_job(kind, payload, description, dedupe_key=None, lock_key=None):
+    """
+    Encola un trabajo en segundo plano (ver jobs.py) y avisa con un flash de su
+    número y estado. Con JOBS_RUN_INLINE se ejecuta aquí mismo. Devuelve (trabajo, creado).
+    """
+    db = database.get_db()
+    with db:
+        job, created = jobs.enqueue(db, kind, payload, dedupe_key, lock_key, g.user['user_id'])
+    if created and app.config['JOBS_RUN_INLINE']:
+        job = jobs.run_now(db, job['job_id'])
+    if not created:
+        flash(f"{description}: ya existe el trabajo #{job['job_id']} ({jobs.STATUS_LABELS[job['status']]}).", 'warning')
+    elif job['status'] == 'FAILED':
+        flash(f"{description}: el trabajo #{job['job_id']} falló: {job['error']}", 'danger')
+    else:
+        flash(f"{description}: trabajo #{job['job_id']} {jobs.STATUS_LABELS[job['status']]}.", 'info')
+    return job, created
 
 def login_required(view):
     @wraps(view)
@@ -42,9 +90,21 @@ def load_logged_in_user():
     user_id = session.get('user_id')
     g.user = None
     if user_id is not None:
-        db = database.get_db()
+        db = database.get_read_db()
         g.user = db.execute('SELECT * FROM users WHERE user_id = ?', (user_id,)).fetchone()
 
+def too_many_attempts(template):
+    flash('Demasiados intentos. Espera un minuto antes de volver a intentarlo.', 'danger')
+    response = make_response(render_template(template), 429)
+    response.headers['Retry-After'] = str(app.config['LOGIN_ATTEMPT_WINDOW'])
+    return response
+
+def hashing_busy(template):
+    flash('El servidor está ocupado. Inténtalo de nuevo en unos segundos.', 'warning')
+    response = make_response(render_template(template), 503)
+    response.headers['Retry-After'] = '5'
+    return response
+
 @app.route('/register', methods=('GET', 'POST'))
 def register():
     if request.method == 'POST':
@@ -54,8 +114,14 @@ def register():
         if not username or not email or not password:
             error = 'Todos los campos son requeridos.'
         if error is None:
+            if not passwords.allow_attempt(request.remote_addr):
+                return too_many_attempts('register.html')
             try:
-                db.execute("INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)", (username, email, generate_password_hash(password)))
+                password_hash = passwords.hash_password(password)
+            except passwords.HashingBusy:
+                return hashing_busy('register.html')
+            try:
+                db.execute("INSERT INTO users (username, email, password_hash) VALUES (?, ?, ?)", (username, email, password_hash))
                 db.commit()
                 user = db.execute('SELECT user_id FROM users WHERE username = ?', (username,)).fetchone()
                 db.execute("INSERT INTO transactions (user_id, transaction_type, amount) VALUES (?, ?, ?)", (user['user_id'], 'INITIAL', 1000.00))
@@ -72,12 +138,19 @@ def register():
 def login():
     if request.method == 'POST':
         email, password = request.form['email'], request.form['password']
+        # Los límites se comprueban antes de tocar la base o calcular el hash.
+        if not passwords.allow_attempt(request.remote_addr, email):
+            return too_many_attempts('login.html')
         db = database.get_db()
         error = None
         user = db.execute('SELECT * FROM users WHERE email = ?', (email,)).fetchone()
-        if user is None or not check_password_hash(user['password_hash'], password):
-            error = 'Email o contraseña incorrectos.'
+        try:
+            if user is None or not passwords.check_password(user['password_hash'], password):
+                error = 'Email o contraseña incorrectos.'
+        except passwords.HashingBusy:
+            return hashing_busy('login.html')
         if error is None:
+            passwords.login_succeeded(email)
             session.clear()
             session['user_id'] = user['user_id']
             flash('Has iniciado sesión correctamente.', 'success')
@@ -93,65 +166,161 @@ def logout():
 
 @app.route('/')
 def index():
-    db = database.get_db()
-    matches = db.execute("SELECT m.match_id, m.match_datetime, o.odds_home, o.odds_draw, o.odds_away, ht.team_name as home_team, at.team_name as away_team FROM matches m JOIN odds o ON m.match_id = o.match_id JOIN teams ht ON m.home_team_id = ht.team_id JOIN teams at ON m.away_team_id = at.team_id WHERE m.status = 'SCHEDULED' ORDER BY m.match_datetime ASC").fetchall()
-    return render_template('index.html', matches=matches)
+    db = database.get_read_db()
+    version, updated_at = board_cache.get_version(db)
+    # Con mensajes flash pendientes la página no es reutilizable.
+    cacheable = not session.get('_flashes')
+    # La barra de navegación muestra el balance: un cambio de balance también invalida la página.
+    etag = f"board-{version}-{g.user['user_id']}-{g.user['token_balance']!r}" if g.user else f'board-{version}-0'
+
+    if cacheable and request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        matches, board = board_cache.get_board_fragment(db, version, lambda matches: render_template('_board.html', matches=matches))
+        response = make_response(render_template('index.html', matches=matches, board=Markup(board)))
+
+    if not cacheable:
+        response.cache_control.no_store = True
+        return response
+    response.set_etag(etag)
+    response.last_modified = updated_at
+    response.cache_control.no_cache = True
+    if g.user:
+        response.cache_control.private = True
+    else:
+        response.cache_control.public = True
+    return response.make_conditional(request)
+
+@app.route('/board')
+def board():
+    """Fragmento del tablero; lo piden las páginas abiertas al recibir un evento `board`."""
+    db = database.get_read_db()
+    version, updated_at = board_cache.get_version(db)
+    etag = f'board-fragment-{version}'
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        _, fragment = board_cache.get_board_fragment(db, version, lambda matches: render_template('_board.html', matches=matches))
+        response = make_response(fragment)
+    response.set_etag(etag)
+    response.last_modified = updated_at
+    response.cache_control.no_cache = True
+    response.cache_control.public = True
+    return response
+
+@app.route('/events')
+def event_stream():
+    """Stream SSE con los cambios del tablero y, con sesión, los del balance y las apuestas del usuario."""
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID', ''))
+    except ValueError:
+        last_event_id = None
+    stream = events.stream(g.user['user_id'] if g.user else None, last_event_id)
+    if stream is None:
+        response = make_response('Demasiados clientes conectados.', 503)
+        response.retry_after = 30
+        return response
+    return Response(stream, mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def history_db(archived):
+    """Conexión de lectura para el historial; con `archived` adjunta la base de archivo (None si aún no existe)."""
+    db = database.get_read_db()
+    if archived and not archive.attach(db, app.config['ARCHIVE_DATABASE']):
+        return None
+    return db
 
 @app.route('/profile')
 @login_required
 def profile():
-    db = database.get_db()
-    if g.user:
-        g.user = db.execute('SELECT * FROM users WHERE user_id = ?', (g.user['user_id'],)).fetchone()
-    bets = db.execute("SELECT b.*, m.match_datetime, ht.team_name as home_team, at.team_name as away_team FROM bets b JOIN matches m ON b.match_id = m.match_id JOIN teams ht ON m.home_team_id = ht.team_id JOIN teams at ON m.away_team_id = at.team_id WHERE b.user_id = ? ORDER BY b.created_at DESC", (g.user['user_id'],)).fetchall()
-    
-    combo_bets_rows = db.execute("SELECT combo_bet_id, total_wager, potential_payout, status, created_at FROM combo_bets WHERE user_id = ? ORDER BY created_at DESC", (g.user['user_id'],)).fetchall()
-    
-    combo_bets = [dict(row) for row in combo_bets_rows]
-    
-    for combo in combo_bets:
-        combo_selections = db.execute(
-            """
-            SELECT b.*, m.match_datetime, ht.team_name as home_team, at.team_name as away_team
-            FROM bets b
-            JOIN matches m ON b.match_id = m.match_id
-            JOIN teams ht ON m.home_team_id = ht.team_id
-            JOIN teams at ON m.away_team_id = at.team_id
-            WHERE b.combo_bet_id = ?
-            ORDER BY m.match_datetime ASC
-            """, (combo['combo_bet_id'],)).fetchall()
-        combo['selections'] = combo_selections
-
-    return render_template('profile.html', bets=bets, combo_bets=combo_bets)
+    archived = request.args.get('archived') == '1'
+    db = history_db(archived)
+    bets, next_bets, combo_bets, next_combos = [], None, [], None
+    try:
+        if db is not None:
+            bets, next_bets = history.get_bets_page(db, g.user['user_id'], request.args.get('bets_before'), archived=archived)
+            combo_bets, next_combos = history.get_combo_bets_page(db, g.user['user_id'], request.args.get('combos_before'), archived=archived)
+    except ValueError:
+        abort(400)
+    totals = archive.get_totals(database.get_read_db(), g.user['user_id'])
+    return render_template('profile.html', bets=bets, combo_bets=combo_bets, next_bets=next_bets, next_combos=next_combos,
+                           archived=archived, archive_totals=totals)
+
+@app.route('/api/profile/bets')
+@login_required
+def api_profile_bets():
+    archived = request.args.get('archived') == '1'
+    db = history_db(archived)
+    if db is None:
+        return jsonify(items=[], next_cursor=None)
+    try:
+        limit = history.parse_limit(request.args.get('limit'))
+        bets, next_cursor = history.get_bets_page(db, g.user['user_id'], request.args.get('before'), limit, archived)
+    except ValueError:
+        abort(400)
+    return jsonify(items=bets, next_cursor=next_cursor)
+
+@app.route('/api/profile/combo_bets')
+@login_required
+def api_profile_combo_bets():
+    archived = request.args.get('archived') == '1'
+    db = history_db(archived)
+    if db is None:
+        return jsonify(items=[], next_cursor=None)
+    try:
+        limit = history.parse_limit(request.args.get('limit'))
+        combos, next_cursor = history.get_combo_bets_page(db, g.user['user_id'], request.args.get('before'), limit, archived)
+    except ValueError:
+        abort(400)
+    return jsonify(items=combos, next_cursor=next_cursor)
+
+@app.route('/api/ratings')
+def api_ratings():
+    """Ratings Elo de todos los equipos tras los partidos completados hasta `as_of` (fecha o fecha y hora)."""
+    try:
+        as_of = datetime.fromisoformat(request.args['as_of'])
+    except (KeyError, ValueError):
+        return jsonify(error='as_of debe ser una fecha ISO (YYYY-MM-DD o YYYY-MM-DD HH:MM:SS).'), 400
+    if len(request.args['as_of']) == 10:
+        # Solo fecha: incluye los partidos de ese día.
+        as_of = as_of.replace(hour=23, minute=59, second=59)
+    as_of = as_of.strftime(ingestion.DATETIME_FORMAT)
+    db = database.get_read_db()
+    ratings = odds_calculator.get_ratings_as_of(db, as_of)
+    teams = db.execute("SELECT team_id, team_name FROM teams ORDER BY team_name").fetchall()
+    return jsonify(as_of=as_of, ratings=[{'team_id': team['team_id'], 'team_name': team['team_name'], 'elo_rating': ratings[team['team_id']]}
+                                         for team in teams])
 
 @app.route('/bet/<int:match_id>', methods=('POST',))
 @login_required
 def bet(match_id):
     wager_amount, bet_type = float(request.form['wager_amount']), request.form['bet_type']
-    db = database.get_db()
-    match = db.execute('SELECT * FROM matches WHERE match_id = ?', (match_id,)).fetchone()
-    if match is None or match['status'] != 'SCHEDULED':
-        flash('No se puede apostar en este partido.', 'danger')
+    if wager_amount <= 0:
+        flash('El monto de la apuesta debe ser positivo.', 'danger')
         return redirect(url_for('index'))
-    if g.user['token_balance'] < wager_amount:
-        flash('No tienes suficientes tokens.', 'danger')
+    if bet_type not in betslip.BET_TYPES:
+        flash('Tipo de apuesta no válido.', 'danger')
         return redirect(url_for('index'))
-    match_odds = db.execute('SELECT * FROM odds WHERE match_id = ?', (match_id,)).fetchone()
-    if bet_type == 'HOME_WIN':
-        odds = match_odds['odds_home']
-    elif bet_type == 'DRAW':
-        odds = match_odds['odds_draw']
-    else:
-        odds = match_odds['odds_away']
-    potential_payout = wager_amount * odds
+    db = database.get_db()
     try:
         with db:
-            cursor = db.execute("INSERT INTO bets (user_id, match_id, bet_type, wager_amount, odds_at_placement, potential_payout) VALUES (?, ?, ?, ?, ?, ?)", (g.user['user_id'], match_id, bet_type, wager_amount, odds, potential_payout))
+            # El débito va primero: toma el lock de escritura, así que una liquidación
+            # o cancelación no puede cerrar el partido entre la lectura de las cuotas y el INSERT.
+            if not wallet.debit(db, g.user['user_id'], wager_amount):
+                flash('No tienes suficientes tokens.', 'danger')
+                return redirect(url_for('index'))
+            match_odds = db.execute(CURRENT_ODDS_SQL, (match_id,)).fetchone()
+            if match_odds is None:
+                raise betslip.MatchClosed()
+            odds = match_odds[betslip.ODDS_COLUMNS[bet_type]]
+            potential_payout = wager_amount * odds
+            cursor = db.execute("INSERT INTO bets (user_id, match_id, bet_type, wager_amount, odds_at_placement, potential_payout, odds_id) VALUES (?, ?, ?, ?, ?, ?, ?)", (g.user['user_id'], match_id, bet_type, wager_amount, odds, potential_payout, match_odds['odds_id']))
             bet_id = cursor.lastrowid
             db.execute("INSERT INTO transactions (user_id, bet_id, transaction_type, amount) VALUES (?, ?, ?, ?)", (g.user['user_id'], bet_id, 'BET_PLACED', -wager_amount))
-            new_balance = g.user['token_balance'] - wager_amount
-            db.execute("UPDATE users SET token_balance = ? WHERE user_id = ?", (new_balance, g.user['user_id']))
+            exposure.add_bet(db, match_id, bet_type, wager_amount, potential_payout)
         flash('Apuesta realizada con éxito.', 'success')
+    except betslip.MatchClosed:
+        # El `with` ya deshizo el débito.
+        flash('No se puede apostar en este partido.', 'danger')
     except sqlite3.Error as e:
         flash(f'Error al realizar la apuesta: {e}', 'danger')
     return redirect(url_for('index'))
@@ -166,6 +335,10 @@ def combo_bet():
         flash('Debes seleccionar al menos dos partidos para una apuesta combinada.', 'danger')
         return redirect(url_for('index'))
 
+    if wager <= 0:
+        flash('El monto de la apuesta debe ser positivo.', 'danger')
+        return redirect(url_for('index'))
+
     selected_matches = set()
     for selection in selections:
         match_id, _ = selection.split('-')
@@ -175,72 +348,75 @@ def combo_bet():
         selected_matches.add(match_id)
 
     db = database.get_db()
-    
-    if g.user['token_balance'] < wager:
-        flash('No tienes suficientes tokens para esta apuesta combinada.', 'danger')
-        return redirect(url_for('index'))
-    
-    total_odds = 1.0
-    bets_to_insert = []
-    
-    combo_bet_id = None 
     try:
+        slip = betslip.parse_betslip({'combos': [{
+            'selections': [dict(zip(('match_id', 'bet_type'), selection.split('-'))) for selection in selections],
+            'wager': wager,
+        }]})
+        # Todo en una transacción: si algo falla no queda nada que deshacer a mano.
         with db:
-            cursor = db.execute("INSERT INTO combo_bets (user_id, total_wager, potential_payout) VALUES (?, ?, ?)",
-                                (g.user['user_id'], wager, 0))
-            combo_bet_id = cursor.lastrowid
-
-            for selection in selections:
-                match_id, bet_type = selection.split('-')
-                match_id = int(match_id)
-                
-                match_odds = db.execute("SELECT odds_home, odds_draw, odds_away FROM odds WHERE match_id = ?", (match_id,)).fetchone()
-                
-                if not match_odds:
-                    raise ValueError(f"Cuotas no encontradas para el partido {match_id}")
-
-                if bet_type == 'HOME_WIN':
-                    odds = match_odds['odds_home']
-                elif bet_type == 'DRAW':
-                    odds = match_odds['odds_draw']
-                else:
-                    odds = match_odds['odds_away']
-                
-                total_odds *= odds
-                bets_to_insert.append((g.user['user_id'], match_id, bet_type, wager, odds, wager * odds, combo_bet_id))
-
-            final_payout = wager * total_odds
-            
-            db.execute("UPDATE combo_bets SET potential_payout = ? WHERE combo_bet_id = ?",
-                       (final_payout, combo_bet_id))
-
-            for bet_data in bets_to_insert:
-                db.execute("INSERT INTO bets (user_id, match_id, bet_type, wager_amount, odds_at_placement, potential_payout, combo_bet_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                           bet_data)
-
-            new_balance = g.user['token_balance'] - wager
-            db.execute("UPDATE users SET token_balance = ? WHERE user_id = ?", (new_balance, g.user['user_id']))
-            db.execute("INSERT INTO transactions (user_id, transaction_type, amount, combo_bet_id) VALUES (?, ?, ?, ?)", (g.user['user_id'], 'COMBO_BET_PLACED', -wager, combo_bet_id))
+            placed = betslip.place_betslip(db, g.user['user_id'], slip)
+        combo = placed['combos'][0]
+        flash(f'Apuesta combinada realizada con éxito! Cuota total: {combo["total_odds"]:.2f}. Ganancia potencial: {combo["potential_payout"]:.2f}', 'success')
+    except betslip.InsufficientFunds:
+        flash('No tienes suficientes tokens para esta apuesta combinada.', 'danger')
+    except (ValueError, sqlite3.Error) as e:
+        flash(f'Error al realizar la apuesta combinada: {e}', 'danger')
 
-            flash(f'Apuesta combinada realizada con éxito! Cuota total: {total_odds:.2f}. Ganancia potencial: {final_payout:.2f}', 'success')
+    return redirect(url_for('index'))
 
-    except Exception as e:
-        flash(f'Error al realizar la apuesta combinada: {e}', 'danger')
+@app.route('/api/betslip', methods=['POST'])
+@login_required
+def api_betslip():
+    """Coloca varias apuestas simples y combinadas de un boleto JSON en una sola transacción."""
+    db = database.get_db()
+    try:
+        slip = betslip.parse_betslip(request.get_json(silent=True))
         with db:
-            if combo_bet_id:
-                db.execute("DELETE FROM combo_bets WHERE combo_bet_id = ?", (combo_bet_id,))
-                db.execute("DELETE FROM bets WHERE combo_bet_id = ?", (combo_bet_id,))
-            
-    return redirect(url_for('index'))
+            placed = betslip.place_betslip(db, g.user['user_id'], slip)
+    except betslip.InsufficientFunds as e:
+        return jsonify(error=str(e)), 409
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    except sqlite3.Error as e:
+        return jsonify(error=f'Error al realizar las apuestas: {e}'), 503
+    balance = db.execute("SELECT token_balance FROM users WHERE user_id = ?", (g.user['user_id'],)).fetchone()[0]
+    return jsonify(balance=balance, **placed), 201
 
 @app.route('/admin', methods=['GET'])
 @admin_required
 def admin():
     db = database.get_db()
     teams = db.execute("SELECT * FROM teams ORDER BY team_name").fetchall()
-    unsettled_matches = db.execute("SELECT m.match_id, ht.team_name as home_team, at.team_name as away_team FROM matches m JOIN odds o ON m.match_id = o.match_id JOIN teams ht ON m.home_team_id = ht.team_id JOIN teams at ON m.away_team_id = at.team_id WHERE m.status = 'SCHEDULED' ORDER BY m.match_datetime").fetchall()
+    unsettled_matches = db.execute("SELECT m.match_id, ht.team_name as home_team, at.team_name as away_team FROM matches m JOIN odds o ON o.odds_id = m.current_odds_id JOIN teams ht ON m.home_team_id = ht.team_id JOIN teams at ON m.away_team_id = at.team_id WHERE m.status = 'SCHEDULED' ORDER BY m.match_datetime").fetchall()
     users = db.execute("SELECT * FROM users ORDER BY username").fetchall()
-    return render_template('admin.html', teams=teams, unsettled_matches=unsettled_matches, users=users)
+    return render_template('admin.html', teams=teams, unsettled_matches=unsettled_matches, users=users,
+                           exposure=exposure.get_exposure(db), outcomes=exposure.OUTCOMES,
+                           recent_jobs=jobs.recent_jobs(db), job_labels=jobs.LABELS)
+
+@app.route('/admin/jobs/<int:job_id>')
+@admin_required
+def admin_job(job_id):
+    job = jobs.get_job(database.get_db(), job_id)
+    if job is None:
+        abort(404)
+    return jsonify(job)
+
+@app.route('/admin/metrics')
+@admin_required
+def admin_metrics():
+    return render_template('admin_metrics.html', **metrics.snapshot())
+
+@app.route('/metrics')
+def prometheus_metrics():
+    # Para Prometheus: sesión de administrador o `Authorization: Bearer <METRICS_TOKEN>`.
+    token = app.config['METRICS_TOKEN']
+    is_admin = g.user is not None and g.user['is_admin']
+    if not is_admin and not (token and request.headers.get('Authorization') == f'Bearer {token}'):
+        abort(403)
+    response = make_response(metrics.render_prometheus())
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    return response
 
 @app.route('/admin-actions', methods=['POST'])
 @admin_required
@@ -260,65 +436,33 @@ def admin_actions():
         
     elif action == 'add_match':
         home_team_id, away_team_id = request.form['home_team_id'], request.form['away_team_id']
-        match_datetime = request.form['match_datetime']
-        
-        existing_match = db.execute("SELECT 1 FROM matches WHERE home_team_id = ? AND away_team_id = ? AND match_datetime = ? AND status IN ('SCHEDULED', 'COMPLETED')", (home_team_id, away_team_id, match_datetime)).fetchone()
+        try:
+            match_datetime = ingestion.normalize_match_datetime(request.form['match_datetime'])
+        except ValueError:
+            match_datetime = None
         
-        if existing_match:
+        if match_datetime is None:
+            flash('La fecha del partido no es válida.', 'danger')
+        elif db.execute("SELECT 1 FROM matches WHERE home_team_id = ? AND away_team_id = ? AND match_datetime = ? AND status IN ('SCHEDULED', 'COMPLETED')", (home_team_id, away_team_id, match_datetime)).fetchone():
             flash('Error: Ya existe un partido con los mismos equipos y fecha programado o completado.', 'danger')
         elif home_team_id == away_team_id:
             flash('Un equipo no puede jugar contra sí mismo.', 'danger')
         else:
-            try:
-                with db:
-                    cursor = db.execute("INSERT INTO matches (home_team_id, away_team_id, match_datetime) VALUES (?, ?, ?)", (home_team_id, away_team_id, match_datetime))
-                    new_match_id = cursor.lastrowid
-                    odds_calculator.generate_and_store_odds(db, new_match_id, int(home_team_id), int(away_team_id))
-                flash('Partido programado y cuotas calculadas.', 'success')
-            except Exception as e:
-                flash(f'Ocurrió un error inesperado al agregar el partido: {e}', 'danger')
+            # Las cuotas se calculan en el worker; el partido aparece en el tablero al terminar.
+            enqueue_job('add_match', {'home_team_id': int(home_team_id), 'away_team_id': int(away_team_id), 'match_datetime': match_datetime},
+                        'Programar partido', dedupe_key=f'add_match:{home_team_id}:{away_team_id}:{match_datetime}')
         
+    # Liquidar y cancelar comparten `dedupe_key`: un partido tiene un solo desenlace,
+    # y aunque dos administradores lo pidan a la vez solo se encola un trabajo.
     elif action == 'settle_match':
-        match_id, home_score, away_score = request.form['match_id'], int(request.form['home_score']), int(request.form['away_score'])
-        try:
-            with db:
-                db.execute("UPDATE matches SET home_score = ?, away_score = ?, status = 'COMPLETED' WHERE match_id = ?", (home_score, away_score, match_id))
-                active_bets = db.execute("SELECT * FROM bets WHERE match_id = ? AND status = 'ACTIVE'", (match_id,)).fetchall()
-                if home_score > away_score:
-                    match_result = 'HOME_WIN'
-                elif home_score < away_score:
-                    match_result = 'AWAY_WIN'
-                else:
-                    match_result = 'DRAW'
-                for bet in active_bets:
-                    if bet['bet_type'] == match_result:
-                        new_status, payout = 'WON', bet['potential_payout']
-                        user = db.execute("SELECT token_balance FROM users WHERE user_id = ?", (bet['user_id'],)).fetchone()
-                        new_balance = user['token_balance'] + payout
-                        db.execute("UPDATE users SET token_balance = ? WHERE user_id = ?", (new_balance, bet['user_id']))
-                        db.execute("INSERT INTO transactions (user_id, bet_id, transaction_type, amount) VALUES (?, ?, ?, ?)", (bet['user_id'], bet['bet_id'], 'WINNINGS', payout))
-                    else:
-                        new_status = 'LOST'
-                    db.execute("UPDATE bets SET status = ? WHERE bet_id = ?", (new_status, bet['bet_id']))
-            flash(f'Partido {match_id} liquidado.', 'success')
-        except sqlite3.Error as e:
-            flash(f'Error al liquidar: {e}', 'danger')
+        match_id, home_score, away_score = int(request.form['match_id']), int(request.form['home_score']), int(request.form['away_score'])
+        enqueue_job('settle_match', {'match_id': match_id, 'home_score': home_score, 'away_score': away_score},
+                    f'Liquidar el partido {match_id}', dedupe_key=f'match:{match_id}:result', lock_key=f'match:{match_id}')
         
     elif action == 'cancel_match':
-        match_id = request.form['match_id']
-        try:
-            with db:
-                bets_to_refund = db.execute("SELECT * FROM bets WHERE match_id = ? AND status = 'ACTIVE'", (match_id,)).fetchall()
-                for bet in bets_to_refund:
-                    user = db.execute("SELECT token_balance FROM users WHERE user_id = ?", (bet['user_id'],)).fetchone()
-                    new_balance = user['token_balance'] + bet['wager_amount']
-                    db.execute("UPDATE users SET token_balance = ? WHERE user_id = ?", (new_balance, bet['user_id']))
-                    db.execute("INSERT INTO transactions (user_id, bet_id, transaction_type, amount) VALUES (?, ?, ?, ?)", (bet['user_id'], bet['bet_id'], 'BET_REFUND', bet['wager_amount']))
-                    db.execute("UPDATE bets SET status = 'CANCELLED' WHERE bet_id = ?", (bet['bet_id'],))
-                db.execute("UPDATE matches SET status = 'CANCELLED' WHERE match_id = ?", (match_id,))
-            flash(f'Partido {match_id} ha sido cancelado y las apuestas devueltas.', 'info')
-        except sqlite3.Error as e:
-            flash(f'Error al cancelar el partido: {e}', 'danger')
+        match_id = int(request.form['match_id'])
+        enqueue_job('cancel_match', {'match_id': match_id}, f'Cancelar el partido {match_id}',
+                    dedupe_key=f'match:{match_id}:result', lock_key=f'match:{match_id}')
         
     elif action == 'add_tokens':
         user_id = request.form['user_id']
@@ -326,12 +470,11 @@ def admin_actions():
         
         try:
             with db:
-                user = db.execute("SELECT * FROM users WHERE user_id = ?", (user_id,)).fetchone()
-                if user:
-                    new_balance = user['token_balance'] + amount
-                    db.execute("UPDATE users SET token_balance = ? WHERE user_id = ?", (new_balance, user_id))
+                if wallet.credit(db, user_id, amount):
                     db.execute("INSERT INTO transactions (user_id, transaction_type, amount) VALUES (?, ?, ?)", (user_id, 'ADMIN_ADD', amount))
-                    flash(f'Se han añadido {amount} tokens a {user["username"]}. Nuevo balance: {new_balance}.', 'success')
+                    events.publish_balance(db, user_id)
+                    user = db.execute("SELECT username, token_balance FROM users WHERE user_id = ?", (user_id,)).fetchone()
+                    flash(f'Se han añadido {amount} tokens a {user["username"]}. Nuevo balance: {user["token_balance"]}.', 'success')
                 else:
                     flash('Usuario no encontrado.', 'danger')
         except Exception as e:
@@ -343,15 +486,13 @@ def admin_actions():
         
         try:
             with db:
-                user = db.execute("SELECT * FROM users WHERE user_id = ?", (user_id,)).fetchone()
-                if user:
-                    new_balance = user['token_balance'] - amount
-                    if new_balance < 0:
-                        flash('El balance del usuario no puede ser negativo.', 'danger')
-                    else:
-                        db.execute("UPDATE users SET token_balance = ? WHERE user_id = ?", (new_balance, user_id))
-                        db.execute("INSERT INTO transactions (user_id, transaction_type, amount) VALUES (?, ?, ?)", (user_id, 'ADMIN_SUBTRACT', -amount))
-                        flash(f'Se han quitado {amount} tokens a {user["username"]}. Nuevo balance: {new_balance}.', 'success')
+                if wallet.debit(db, user_id, amount):
+                    db.execute("INSERT INTO transactions (user_id, transaction_type, amount) VALUES (?, ?, ?)", (user_id, 'ADMIN_SUBTRACT', -amount))
+                    events.publish_balance(db, user_id)
+                    user = db.execute("SELECT username, token_balance FROM users WHERE user_id = ?", (user_id,)).fetchone()
+                    flash(f'Se han quitado {amount} tokens a {user["username"]}. Nuevo balance: {user["token_balance"]}.', 'success')
+                elif db.execute("SELECT 1 FROM users WHERE user_id = ?", (user_id,)).fetchone():
+                    flash('El balance del usuario no puede ser negativo.', 'danger')
                 else:
                     flash('Usuario no encontrado.', 'danger')
         except Exception as e:
@@ -373,37 +514,17 @@ def upload_results():
         return redirect(url_for('admin'))
 
     if file and file.filename.endswith('.csv'):
+        on_duplicate = 'update' if request.form.get('on_duplicate') == 'update' else 'skip'
         try:
-            df = pd.read_csv(file)
-            db = database.get_db()
-            
-            if df.empty:
-                flash("El archivo CSV está vacío.", 'danger')
-                return redirect(url_for('admin'))
-
-            with db:
-                all_teams = pd.concat([df['home_team_id'], df['away_team_id']]).unique()
-
-                for team_name in all_teams:
-                    try:
-                        db.execute("INSERT INTO teams (team_name) VALUES (?)", (team_name,))
-                    except sqlite3.IntegrityError:
-                        pass
-
-                team_mapping = {row['team_name']: row['team_id'] for row in db.execute("SELECT team_id, team_name FROM teams").fetchall()}
-
-                for index, row in df.iterrows():
-                    home_team_id = team_mapping.get(row['home_team_id'])
-                    away_team_id = team_mapping.get(row['away_team_id'])
-
-                    db.execute(
-                        "INSERT INTO matches (home_team_id, away_team_id, match_datetime, home_score, away_score, status) VALUES (?, ?, ?, ?, ?, ?)",
-                        (home_team_id, away_team_id, row['match_datetime'], row['home_score'], row['away_score'], 'COMPLETED')
-                    )
-
-            flash('Resultados cargados y guardados exitosamente. Ahora puedes programar partidos para generar cuotas dinámicas.', 'success')
-        except Exception as e:
-            flash(f'Ocurrió un error al procesar el archivo: {e}', 'danger')
+            # El worker lee el CSV desde disco; el nombre depende del contenido, así
+            # que subir dos veces el mismo archivo no lo carga dos veces.
+            path = jobs.save_upload(file.stream, app.config['JOBS_UPLOAD_FOLDER'], on_duplicate)
+            job, created = enqueue_job('ingest_results', {'path': path, 'filename': file.filename, 'on_duplicate': on_duplicate},
+                                       f'Cargar {file.filename}', dedupe_key=f'ingest_results:{os.path.basename(path)}', lock_key='results')
+            if not created and job['status'] == 'DONE' and os.path.exists(path):
+                os.remove(path)
+        except (OSError, sqlite3.Error) as e:
+            flash(f'Ocurrió un error al guardar el archivo: {e}', 'danger')
     else:
         flash('Tipo de archivo no válido. Por favor, sube un archivo CSV.', 'danger')
 
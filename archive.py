@@ -0,0 +1,207 @@
+import os
+import time
+from datetime import datetime, timedelta, timezone
+import click
+from flask import current_app
+import database
+
+DEFAULT_CONFIG = {
+    # Base aparte (se adjunta con ATTACH) para las apuestas ya liquidadas.
+    'ARCHIVE_DATABASE': 'apuestas_archive.sqlite',
+    'ARCHIVE_AFTER_DAYS': 90,
+    # Filas por lote: cada lote son dos transacciones cortas.
+    'ARCHIVE_BATCH_SIZE': 500,
+}
+
+ARCHIVE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS archive.bets (
+    bet_id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    match_id INTEGER NOT NULL,
+    bet_type TEXT NOT NULL,
+    wager_amount REAL NOT NULL,
+    odds_at_placement REAL NOT NULL,
+    potential_payout REAL NOT NULL,
+    status TEXT NOT NULL,
+    created_at TEXT,
+    combo_bet_id INTEGER,
+    odds_id INTEGER,
+    archived_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS archive.combo_bets (
+    combo_bet_id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    total_wager REAL NOT NULL,
+    potential_payout REAL NOT NULL,
+    status TEXT NOT NULL,
+    created_at TEXT,
+    archived_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS archive.transactions (
+    transaction_id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    bet_id INTEGER,
+    transaction_type TEXT NOT NULL,
+    amount REAL NOT NULL,
+    timestamp TEXT,
+    combo_bet_id INTEGER,
+    archived_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS archive.idx_bets_user_created ON bets (user_id, created_at);
+CREATE INDEX IF NOT EXISTS archive.idx_bets_combo_bet_id ON bets (combo_bet_id);
+CREATE INDEX IF NOT EXISTS archive.idx_combo_bets_user_created ON combo_bets (user_id, created_at);
+CREATE INDEX IF NOT EXISTS archive.idx_transactions_user_id ON transactions (user_id);
+"""
+
+BET_COLUMNS = 'bet_id, user_id, match_id, bet_type, wager_amount, odds_at_placement, potential_payout, status, created_at, combo_bet_id, odds_id'
+COMBO_COLUMNS = 'combo_bet_id, user_id, total_wager, potential_payout, status, created_at'
+TRANSACTION_COLUMNS = 'transaction_id, user_id, bet_id, transaction_type, amount, timestamp, combo_bet_id'
+
+SETTLED = "m.status IN ('COMPLETED', 'CANCELLED') AND m.match_datetime < ?"
+
+# Apuestas simples de partidos cerrados antes del corte, entrando por el índice de partidos.
+SINGLES_BATCH_SQL = f"""
+    SELECT b.bet_id FROM matches m JOIN bets b ON b.match_id = m.match_id
+    WHERE {SETTLED} AND b.combo_bet_id IS NULL
+    LIMIT ?
+"""
+
+# Combinadas resueltas cuyas selecciones son todas de partidos cerrados antes del corte.
+COMBOS_BATCH_SQL = f"""
+    SELECT DISTINCT b.combo_bet_id FROM matches m
+    JOIN bets b ON b.match_id = m.match_id
+    JOIN combo_bets c ON c.combo_bet_id = b.combo_bet_id
+    WHERE {SETTLED} AND b.combo_bet_id IS NOT NULL AND c.status != 'ACTIVE'
+    AND NOT EXISTS (
+        SELECT 1 FROM bets l JOIN matches lm ON lm.match_id = l.match_id
+        WHERE l.combo_bet_id = b.combo_bet_id
+        AND NOT (lm.status IN ('COMPLETED', 'CANCELLED') AND lm.match_datetime < ?)
+    )
+    LIMIT ?
+"""
+
+ADD_TOTALS_SQL = """
+    INSERT INTO user_archive_totals (user_id, {columns})
+    {select}
+    ON CONFLICT (user_id) DO UPDATE SET {updates}, updated_at = CURRENT_TIMESTAMP
+"""
+
+def attach(db, path, create=False):
+    """
+    Adjunta la base de archivo como `archive` si no lo está ya. Con `create` la
+    crea junto con sus tablas; sin él devuelve False si todavía no existe.
+    No puede llamarse con una transacción abierta.
+    """
+    path = os.path.abspath(path)
+    if not create and not os.path.exists(path):
+        return False
+    for row in db.execute('PRAGMA database_list').fetchall():
+        if row[1] == 'archive':
+            if row[2] == path:
+                break
+            db.execute('DETACH DATABASE archive')
+    else:
+        db.execute('ATTACH DATABASE ? AS archive', (path,))
+    if create:
+        db.execute('PRAGMA archive.journal_mode = WAL')
+        db.executescript(ARCHIVE_SCHEMA)
+    return True
+
+def _add_totals(db, columns, select, ids):
+    updates = ', '.join(f'{column} = {column} + excluded.{column}' for column in columns)
+    db.execute(ADD_TOTALS_SQL.format(columns=', '.join(columns), select=select, updates=updates), ids)
+
+def _move(db, ids, bets_where, transactions_where, combos=False):
+    """
+    Mueve un lote en dos transacciones cortas. La primera copia al archivo con
+    INSERT OR IGNORE; la segunda suma los totales y borra de la base viva. Con WAL
+    el commit de dos bases no es atómico, pero en este orden repetir un lote
+    interrumpido no duplica nada ni pierde filas.
+    """
+    placeholders = ', '.join('?' * len(ids))
+    bets_where = bets_where.format(placeholders=placeholders)
+    transactions_where = transactions_where.format(placeholders=placeholders)
+    combos_where = f'combo_bet_id IN ({placeholders})'
+
+    with db:
+        if combos:
+            db.execute(f"INSERT OR IGNORE INTO archive.combo_bets ({COMBO_COLUMNS}) SELECT {COMBO_COLUMNS} FROM main.combo_bets WHERE {combos_where}", ids)
+        db.execute(f"INSERT OR IGNORE INTO archive.bets ({BET_COLUMNS}) SELECT {BET_COLUMNS} FROM main.bets WHERE {bets_where}", ids)
+        db.execute(f"INSERT OR IGNORE INTO archive.transactions ({TRANSACTION_COLUMNS}) SELECT {TRANSACTION_COLUMNS} FROM main.transactions WHERE {transactions_where}", ids)
+
+    with db:
+        if combos:
+            _add_totals(db, ('combo_bets', 'total_wagered', 'total_won'),
+                        f"SELECT user_id, COUNT(*), SUM(total_wager), SUM(CASE WHEN status = 'WON' THEN potential_payout ELSE 0 END) "
+                        f"FROM main.combo_bets WHERE {combos_where} GROUP BY user_id", ids)
+        else:
+            _add_totals(db, ('bets', 'total_wagered', 'total_won'),
+                        f"SELECT user_id, COUNT(*), SUM(wager_amount), SUM(CASE WHEN status = 'WON' THEN potential_payout ELSE 0 END) "
+                        f"FROM main.bets WHERE {bets_where} GROUP BY user_id", ids)
+        _add_totals(db, ('transactions', 'ledger_amount'),
+                    f"SELECT user_id, COUNT(*), SUM(amount) FROM main.transactions WHERE {transactions_where} GROUP BY user_id", ids)
+        transactions = db.execute(f"DELETE FROM main.transactions WHERE {transactions_where}", ids).rowcount
+        bets = db.execute(f"DELETE FROM main.bets WHERE {bets_where}", ids).rowcount
+        if combos:
+            db.execute(f"DELETE FROM main.combo_bets WHERE {combos_where}", ids)
+    return bets, transactions
+
+def archive_settled(db, path, older_than_days, batch_size=DEFAULT_CONFIG['ARCHIVE_BATCH_SIZE'], pause=0.0):
+    """
+    Mueve al archivo las apuestas simples, las combinadas (con sus selecciones) y
+    sus movimientos de partidos liquidados o cancelados hace más de `older_than_days`
+    días, en lotes de `batch_size`. Entre lotes se suelta el lock de escritura
+    (y se espera `pause` segundos) para no frenar a las rutas.
+    Devuelve cuántas filas se movieron.
+    """
+    if db.in_transaction:
+        db.commit()
+    attach(db, path, create=True)
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=older_than_days)).strftime('%Y-%m-%d')
+    stats = {'bets': 0, 'combo_bets': 0, 'transactions': 0, 'batches': 0}
+
+    while True:
+        ids = [row[0] for row in db.execute(SINGLES_BATCH_SQL, (cutoff, batch_size)).fetchall()]
+        if not ids:
+            break
+        bets, transactions = _move(db, ids, 'bet_id IN ({placeholders})', 'bet_id IN ({placeholders})')
+        stats['bets'] += bets
+        stats['transactions'] += transactions
+        stats['batches'] += 1
+        time.sleep(pause)
+
+    while True:
+        ids = [row[0] for row in db.execute(COMBOS_BATCH_SQL, (cutoff, cutoff, batch_size)).fetchall()]
+        if not ids:
+            break
+        bets, transactions = _move(db, ids, 'combo_bet_id IN ({placeholders})', 'combo_bet_id IN ({placeholders})', combos=True)
+        stats['combo_bets'] += len(ids)
+        stats['bets'] += bets
+        stats['transactions'] += transactions
+        stats['batches'] += 1
+        time.sleep(pause)
+    return stats
+
+def get_totals(db, user_id):
+    """Totales archivados de un usuario, o None si no tiene nada archivado."""
+    row = db.execute("SELECT * FROM user_archive_totals WHERE user_id = ?", (user_id,)).fetchone()
+    return dict(row) if row else None
+
+@click.command('archive-settled')
+@click.option('--days', type=int, default=None, help='Antigüedad mínima del partido (por defecto ARCHIVE_AFTER_DAYS).')
+@click.option('--batch-size', type=int, default=None, help='Filas por lote (por defecto ARCHIVE_BATCH_SIZE).')
+@click.option('--pause', type=float, default=0.0, help='Segundos de espera entre lotes.')
+def archive_settled_command(days, batch_size, pause):
+    """Mueve las apuestas liquidadas antiguas a la base de archivo."""
+    config = current_app.config
+    days = config['ARCHIVE_AFTER_DAYS'] if days is None else days
+    started = time.perf_counter()
+    stats = archive_settled(database.get_db(), config['ARCHIVE_DATABASE'], days,
+                            batch_size or config['ARCHIVE_BATCH_SIZE'], pause)
+    click.echo(f"Archived {stats['bets']} bets, {stats['combo_bets']} combos and {stats['transactions']} transactions "
+               f"older than {days} days in {stats['batches']} batches ({time.perf_counter() - started:.2f}s).")
+
+def init_app(app):
+    for name, value in DEFAULT_CONFIG.items():
+        app.config.setdefault(name, value)
+    app.cli.add_command(archive_settled_command)
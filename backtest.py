@@ -0,0 +1,176 @@
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import click
+import database
+import odds_calculator
+
+# NumPy se importa dentro de las funciones para que registrar el comando no lo cargue.
+
+PARAMETERS = ('k_factor', 'home_advantage', 'draw_probability', 'margin')
+
+def load_history(db):
+    """
+    Carga los partidos completados en orden cronológico como arrays:
+    índices de equipo (0..n-1) y resultado (0 local, 1 empate, 2 visitante).
+    Usa la consulta de los ratings persistidos, así los partidos a la misma hora
+    se repiten en el mismo orden (por match_id) que en `team_elo_ratings`.
+    """
+    import numpy as np
+    rows = db.execute(odds_calculator.COMPLETED_MATCHES_SQL.format(where='')).fetchall()
+    team_ids = sorted({team_id for row in rows for team_id in (row['home_team_id'], row['away_team_id'])})
+    index = {team_id: i for i, team_id in enumerate(team_ids)}
+    home = np.array([index[row['home_team_id']] for row in rows], dtype=np.int64)
+    away = np.array([index[row['away_team_id']] for row in rows], dtype=np.int64)
+    home_score = np.array([row['home_score'] for row in rows], dtype=np.int64)
+    away_score = np.array([row['away_score'] for row in rows], dtype=np.int64)
+    outcome = np.where(home_score > away_score, 0, np.where(home_score == away_score, 1, 2))
+    return {'home': home, 'away': away, 'outcome': outcome, 'team_ids': team_ids}
+
+def disjoint_batches(home, away):
+    """
+    Parte la secuencia en tramos consecutivos en los que ningún equipo juega dos veces.
+    Dentro de un tramo los partidos no dependen entre sí y se aplican a la vez.
+    """
+    batches, start, seen = [], 0, set()
+    for i, (h, a) in enumerate(zip(home.tolist(), away.tolist())):
+        if h in seen or a in seen:
+            batches.append((start, i))
+            start, seen = i, set()
+        seen.update((h, a))
+    if start < len(home):
+        batches.append((start, len(home)))
+    return batches
+
+def replay_grid(history, grid, burn_in=0, batches=None):
+    """
+    Repite el historial para todas las combinaciones de `grid` a la vez.
+
+    `grid` es un dict de arrays de igual longitud G con las claves de PARAMETERS.
+    Los ratings son una matriz (G, equipos); cada tramo disjunto se procesa con
+    operaciones vectorizadas sobre todas las combinaciones y partidos del tramo.
+    Antes de aplicar cada resultado se puntúa la predicción (log-loss, Brier) y
+    el resultado de la casa con las cuotas que habría publicado, apostando 1 a
+    cada uno de los tres resultados. Los primeros `burn_in` partidos no puntúan.
+    """
+    import numpy as np
+    k = np.asarray(grid['k_factor'], dtype=float)[:, None]
+    home_advantage = np.asarray(grid['home_advantage'], dtype=float)[:, None]
+    prob_draw = np.asarray(grid['draw_probability'], dtype=float)[:, None]
+    margin = np.asarray(grid['margin'], dtype=float)[:, None]
+    size = k.shape[0]
+
+    home, away, outcome = history['home'], history['away'], history['outcome']
+    ratings = np.full((size, len(history['team_ids'])), odds_calculator.INITIAL_ELO)
+    log_loss = np.zeros(size)
+    brier = np.zeros(size)
+    house = np.zeros(size)
+    scored = 0
+    actual_score = np.array([1.0, 0.5, 0.0])
+
+    for start, end in (batches if batches is not None else disjoint_batches(home, away)):
+        h, a, o = home[start:end], away[start:end], outcome[start:end]
+        elo_home, elo_away = ratings[:, h], ratings[:, a]
+
+        first_scored = max(burn_in - start, 0)
+        if first_scored < end - start:
+            probabilities = odds_calculator.elo_probabilities(elo_home, elo_away, home_advantage, prob_draw)
+            probs = np.stack([probabilities['home_win'], np.broadcast_to(probabilities['draw'], elo_home.shape), probabilities['away_win']], axis=2)
+            probs, o_scored = probs[:, first_scored:], o[first_scored:]
+            columns = np.arange(len(o_scored))
+            p_actual = probs[:, columns, o_scored]
+            log_loss -= np.log(np.clip(p_actual, 1e-15, 1)).sum(axis=1)
+            brier += ((probs - np.eye(3)[o_scored]) ** 2).sum(axis=(1, 2))
+            house += (3 - 1 / (p_actual * (1 + margin))).sum(axis=1)
+            scored += len(o_scored)
+
+        delta = k * (actual_score[o] - odds_calculator.expected_home_score(elo_home, elo_away, home_advantage))
+        ratings[:, h] += delta
+        ratings[:, a] -= delta
+
+    scored = max(scored, 1)
+    return {
+        'log_loss': log_loss / scored,
+        'brier': brier / scored,
+        'house_margin': house / (3 * scored),
+        'ratings': ratings,
+    }
+
+def build_grid(values):
+    """Producto cartesiano de {parámetro: [valores]} como dict de arrays."""
+    import numpy as np
+    combos = list(itertools.product(*(values[name] for name in PARAMETERS)))
+    return {name: np.array([combo[i] for combo in combos], dtype=float) for i, name in enumerate(PARAMETERS)}
+
+def _replay_chunk(args):
+    history, grid, burn_in, batches = args
+    result = replay_grid(history, grid, burn_in, batches)
+    result.pop('ratings')
+    return result
+
+def run_backtest(history, values, burn_in=0, workers=1):
+    """
+    Evalúa todas las combinaciones de `values` y devuelve una lista de dicts
+    ordenada por log-loss. Con `workers` > 1 reparte la rejilla en un pool de procesos.
+    """
+    import numpy as np
+    grid = build_grid(values)
+    size = len(grid['k_factor'])
+    batches = disjoint_batches(history['home'], history['away'])
+    n_chunks = 1 if workers <= 1 else min(workers * 4, size)
+    chunks = [idx for idx in np.array_split(np.arange(size), n_chunks) if len(idx)]
+    tasks = [(history, {name: grid[name][idx] for name in PARAMETERS}, burn_in, batches) for idx in chunks]
+
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_replay_chunk, tasks))
+    else:
+        results = [_replay_chunk(task) for task in tasks]
+
+    metrics = {name: np.concatenate([result[name] for result in results]) for name in ('log_loss', 'brier', 'house_margin')}
+    rows = [
+        {**{name: float(grid[name][i]) for name in PARAMETERS}, **{name: float(metrics[name][i]) for name in metrics}}
+        for i in range(size)
+    ]
+    return sorted(rows, key=lambda row: row['log_loss'])
+
+def parse_values(text):
+    """Acepta '16,24,32' o un rango 'inicio:fin:paso' (fin incluido)."""
+    import numpy as np
+    if ':' in text:
+        start, stop, step = (float(part) for part in text.split(':'))
+        return list(np.round(np.arange(start, stop + step / 2, step), 10))
+    return [float(part) for part in text.split(',')]
+
+@click.command('backtest')
+@click.option('--k-factor', default=str(odds_calculator.K_FACTOR), help="Valores de K: '16,24,32' o '10:40:5'.")
+@click.option('--home-advantage', default=str(odds_calculator.HOME_ADVANTAGE))
+@click.option('--draw-probability', default=str(odds_calculator.DRAW_PROBABILITY))
+@click.option('--margin', default=str(odds_calculator.MARGIN))
+@click.option('--burn-in', default=0, help='Partidos iniciales que no puntúan.')
+@click.option('--workers', default=os.cpu_count() or 1, help='Procesos para repartir la rejilla.')
+@click.option('--top', default=10, help='Combinaciones a mostrar.')
+@click.option('--json', 'as_json', is_flag=True, help='Salida en JSON.')
+def backtest_command(k_factor, home_advantage, draw_probability, margin, burn_in, workers, top, as_json):
+    """Evalúa una rejilla de parámetros Elo sobre el historial completado."""
+    history = load_history(database.get_db())
+    if len(history['home']) == 0:
+        raise click.ClickException('No hay partidos completados.')
+    values = {
+        'k_factor': parse_values(k_factor),
+        'home_advantage': parse_values(home_advantage),
+        'draw_probability': parse_values(draw_probability),
+        'margin': parse_values(margin),
+    }
+    rows = run_backtest(history, values, burn_in, workers)[:top]
+    if as_json:
+        click.echo(json.dumps(rows, indent=2))
+        return
+    click.echo(f"{'K':>6} {'home_adv':>9} {'p_draw':>7} {'margin':>7} {'log_loss':>9} {'brier':>7} {'house':>7}")
+    for row in rows:
+        click.echo(f"{row['k_factor']:>6g} {row['home_advantage']:>9g} {row['draw_probability']:>7g} {row['margin']:>7g} "
+                   f"{row['log_loss']:>9.4f} {row['brier']:>7.4f} {row['house_margin']:>7.2%}")
+
+def init_app(app):
+    app.cli.add_command(backtest_command)
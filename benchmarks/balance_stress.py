@@ -0,0 +1,111 @@
+"""
+Prueba de estrés del débito condicional: muchos hilos apuestan (simples,
+combinadas y boletos de `/api/betslip`) con los mismos pocos usuarios mientras
+un administrador suma y quita tokens. Al terminar comprueba que, para cada
+usuario, el balance es igual a la suma de sus transacciones y nunca es negativo.
+Sale con código 1 si no.
+
+    python -m benchmarks.balance_stress --threads 16 --requests 200
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.common import report
+from app import app
+import database
+import odds_calculator
+import wallet
+
+def prepare(path, n_users, initial_balance):
+    app.config.update(DATABASE=path)
+    with app.app_context():
+        database.init_db()
+        db = database.get_db()
+        db.executemany("INSERT INTO teams (team_name) VALUES (?)", [(f'Equipo {i}',) for i in range(8)])
+        for i in range(4):
+            match_id = db.execute("INSERT INTO matches (home_team_id, away_team_id, match_datetime) VALUES (?, ?, '2030-01-01 10:00')",
+                                  (2 * i + 1, 2 * i + 2)).lastrowid
+            odds_calculator.store_odds(db, match_id, {'odds_home': 2.0, 'odds_draw': 3.2, 'odds_away': 3.8})
+        for i in range(n_users):
+            user_id = db.execute("INSERT INTO users (username, email, password_hash, token_balance) VALUES (?, ?, 'x', ?)",
+                                 (f'user{i}', f'user{i}@bench', initial_balance)).lastrowid
+            db.execute("INSERT INTO transactions (user_id, transaction_type, amount) VALUES (?, 'INITIAL', ?)", (user_id, initial_balance))
+        db.commit()
+        match_ids = [row[0] for row in db.execute("SELECT match_id FROM matches")]
+        user_ids = [row[0] for row in db.execute("SELECT user_id FROM users WHERE is_admin = 0")]
+    database.close_pooled_connections()
+    return match_ids, user_ids
+
+def check_invariant():
+    """Devuelve los usuarios cuyo balance no cuadra con sus transacciones."""
+    with app.app_context():
+        mismatches = wallet.ledger_mismatches(database.get_db())
+    database.close_pooled_connections()
+    return mismatches
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=200, help='Peticiones por hilo.')
+    parser.add_argument('--users', type=int, default=3)
+    parser.add_argument('--initial-balance', type=float, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        match_ids, user_ids = prepare(os.path.join(workdir, 'stress.sqlite'), args.users, args.initial_balance)
+
+        def bettor(seed):
+            rng = random.Random(seed)
+            client = app.test_client()
+            with client.session_transaction() as session:
+                session['user_id'] = rng.choice(user_ids)
+            for _ in range(args.requests):
+                roll = rng.random()
+                if roll < 0.6:
+                    client.post(f'/bet/{rng.choice(match_ids)}', data={'wager_amount': rng.randint(1, 40), 'bet_type': 'HOME_WIN'})
+                elif roll < 0.8:
+                    first, second = rng.sample(match_ids, 2)
+                    client.post('/api/betslip', json={
+                        'singles': [{'match_id': match_id, 'bet_type': 'DRAW', 'wager': rng.randint(1, 10)} for match_id in match_ids],
+                        'combos': [{'selections': [{'match_id': first, 'bet_type': 'HOME_WIN'}, {'match_id': second, 'bet_type': 'DRAW'}], 'wager': rng.randint(1, 20)}],
+                    })
+                else:
+                    first, second = rng.sample(match_ids, 2)
+                    client.post('/combo_bet', data={'selection': [f'{first}-DRAW', f'{second}-AWAY_WIN'], 'combo_wager': rng.randint(1, 40)})
+            database.close_pooled_connections()
+
+        def admin(seed):
+            rng = random.Random(seed)
+            client = app.test_client()
+            with client.session_transaction() as session:
+                session['user_id'] = 1
+            for _ in range(args.requests):
+                action = rng.choice(('add_tokens', 'subtract_tokens'))
+                client.post('/admin-actions', data={'action': action, 'user_id': rng.choice(user_ids), 'amount': rng.randint(1, 60)})
+            database.close_pooled_connections()
+
+        threads = [threading.Thread(target=bettor, args=(i,)) for i in range(args.threads)]
+        threads.append(threading.Thread(target=admin, args=(-1,)))
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        mismatches = check_invariant()
+        report('balance_stress', threads=args.threads, requests=len(threads) * args.requests,
+               seconds=round(elapsed, 3), requests_per_sec=round(len(threads) * args.requests / elapsed, 1),
+               mismatched_users=len(mismatches))
+        if mismatches:
+            for row in mismatches:
+                print(f"user {row['user_id']}: balance {row['token_balance']} != ledger {row['ledger']}", file=sys.stderr)
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
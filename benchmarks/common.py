@@ -0,0 +1,40 @@
+import json
+import os
+import sqlite3
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import database
+
+def scratch_db(path):
+    """Crea una base de datos vacía con `schema.sql` y las migraciones en `path` y devuelve la conexión."""
+    if os.path.exists(path):
+        os.remove(path)
+    db = sqlite3.connect(path)
+    db.row_factory = sqlite3.Row
+    with open(os.path.join(ROOT, 'schema.sql'), encoding='utf8') as f:
+        db.executescript(f.read())
+    database.migrate_db(db)
+    return db
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def latency_summary(values, seconds):
+    """Peticiones, throughput y p50/p99 en ms de una lista de latencias en segundos."""
+    return {
+        'requests': len(values),
+        'throughput': round(len(values) / seconds, 1) if seconds else None,
+        'p50_ms': round(percentile(values, 0.50) * 1000, 2) if values else None,
+        'p99_ms': round(percentile(values, 0.99) * 1000, 2) if values else None,
+    }
+
+def report(name, **fields):
+    """Imprime un resultado de benchmark como una línea JSON."""
+    print(json.dumps({'benchmark': name, **fields}, sort_keys=True))
@@ -0,0 +1,119 @@
+"""
+Carga concurrente sobre la aplicación Flask: lectores del tablero (`/`) y
+escritores que apuestan (`/bet/<id>`) desde varios hilos. Compara el perfil de
+conexión anterior (una conexión por petición, journal DELETE) con el actual
+(WAL, conexiones reutilizadas, lectura en conexión de solo lectura) y reporta
+errores de lock y latencias p50/p99.
+
+    python -m benchmarks.concurrency --threads 16 --seconds 10
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+from benchmarks.common import latency_summary, report
+from flask import got_request_exception, message_flashed
+from werkzeug.security import generate_password_hash
+from app import app
+import database
+import odds_calculator
+
+PROFILES = {
+    'legacy': {
+        'DATABASE_JOURNAL_MODE': 'DELETE',
+        'DATABASE_SYNCHRONOUS': 'FULL',
+        'DATABASE_CACHE_SIZE': None,
+        'DATABASE_MMAP_SIZE': None,
+        'DATABASE_REUSE_CONNECTIONS': False,
+    },
+    'tuned': dict(database.DEFAULT_CONFIG),
+}
+
+def prepare(path, profile, n_users, n_matches):
+    app.config.update(DATABASE=path, **PROFILES[profile])
+    with app.app_context():
+        database.init_db()
+        db = database.get_db()
+        db.executemany("INSERT INTO teams (team_name) VALUES (?)", [(f'Equipo {i}',) for i in range(2 * n_matches)])
+        for i in range(n_matches):
+            match_id = db.execute("INSERT INTO matches (home_team_id, away_team_id, match_datetime) VALUES (?, ?, ?)",
+                                  (2 * i + 1, 2 * i + 2, f'2030-01-01 10:{i:02d}:00')).lastrowid
+            odds_calculator.store_odds(db, match_id, {'odds_home': 2.0, 'odds_draw': 3.2, 'odds_away': 3.8})
+        password_hash = generate_password_hash('x')
+        db.executemany("INSERT INTO users (username, email, password_hash, token_balance) VALUES (?, ?, ?, 1000000)",
+                       [(f'user{i}', f'user{i}@bench', password_hash) for i in range(n_users)])
+        db.commit()
+        match_ids = [row[0] for row in db.execute("SELECT match_id FROM matches")]
+        user_ids = [row[0] for row in db.execute("SELECT user_id FROM users WHERE is_admin = 0")]
+    database.close_pooled_connections()
+    return match_ids, user_ids
+
+def run(profile, n_threads, seconds, write_ratio, workdir):
+    match_ids, user_ids = prepare(os.path.join(workdir, f'{profile}.sqlite'), profile, n_threads, 20)
+    latencies = {'index': [], 'bet': []}
+    errors = {'lock_errors': 0, 'server_errors': 0}
+    lock = threading.Lock()
+
+    def on_flash(sender, message, category, **extra):
+        if 'locked' in message:
+            with lock:
+                errors['lock_errors'] += 1
+
+    def on_exception(sender, exception, **extra):
+        with lock:
+            errors['server_errors'] += 1
+            if 'locked' in str(exception):
+                errors['lock_errors'] += 1
+
+    def worker(user_id, seed):
+        rng = random.Random(seed)
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['user_id'] = user_id
+        deadline = time.perf_counter() + seconds
+        local = {'index': [], 'bet': []}
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            if rng.random() < write_ratio:
+                client.post(f'/bet/{rng.choice(match_ids)}', data={'wager_amount': 1, 'bet_type': 'DRAW'})
+                local['bet'].append(time.perf_counter() - started)
+            else:
+                client.get('/')
+                local['index'].append(time.perf_counter() - started)
+        database.close_pooled_connections()
+        with lock:
+            for name, values in local.items():
+                latencies[name].extend(values)
+
+    app.config['PROPAGATE_EXCEPTIONS'] = False
+    with message_flashed.connected_to(on_flash, app), got_request_exception.connected_to(on_exception, app):
+        threads = [threading.Thread(target=worker, args=(user_id, i)) for i, user_id in enumerate(user_ids)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    for name, values in latencies.items():
+        report('concurrency', profile=profile, endpoint=name, threads=n_threads, **latency_summary(values, seconds), **errors)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--write-ratio', type=float, default=0.3)
+    parser.add_argument('--busy-timeout-ms', type=int, default=None,
+                        help='Sobrescribe DATABASE_BUSY_TIMEOUT_MS en ambos perfiles (menor = más errores visibles).')
+    parser.add_argument('--profile', choices=('legacy', 'tuned', 'both'), default='both')
+    args = parser.parse_args()
+    if args.busy_timeout_ms is not None:
+        for profile in PROFILES.values():
+            profile['DATABASE_BUSY_TIMEOUT_MS'] = args.busy_timeout_ms
+    with tempfile.TemporaryDirectory() as workdir:
+        for profile in (('legacy', 'tuned') if args.profile == 'both' else (args.profile,)):
+            run(profile, args.threads, args.seconds, args.write_ratio, workdir)
+
+if __name__ == '__main__':
+    main()
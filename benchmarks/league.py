@@ -0,0 +1,169 @@
+"""
+Generador de ligas sintéticas reproducibles, escritas directamente con SQL en
+una base vacía (con `schema.sql` y las migraciones aplicadas):
+
+- `teams` equipos con una fuerza oculta; cada temporada es una doble vuelta
+  con goles de Poisson según esa fuerza.
+- Cuotas Elo publicadas antes de cada partido, como haría la aplicación, y
+  `bets_per_match` apuestas simples ya liquidadas por partido jugado.
+- `scheduled` partidos programados con cuotas, `bets_per_match` apuestas
+  abiertas cada uno y una combinada de cada `combo_every` apuestas.
+- `users` usuarios cuyo balance cuadra con sus transacciones.
+
+    python -m benchmarks.league --teams 20 --seasons 5 --users 200 --bets-per-match 20 league.sqlite
+"""
+import argparse
+import math
+import random
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import report, scratch_db
+from betslip import BET_TYPES, ODDS_COLUMNS
+import board_cache
+import exposure
+import odds_calculator
+
+INITIAL_BALANCE = 1000000.0
+HOME_GOALS, AWAY_GOALS = 1.5, 1.1
+FIRST_SEASON = datetime(2015, 8, 1, 12, 0)
+FIRST_SCHEDULED = datetime(2030, 1, 1, 12, 0)
+
+def poisson(rng, lam):
+    """Muestra de Poisson (método de Knuth); basta para medias de goles pequeñas."""
+    limit, k, p = math.exp(-lam), 0, 1.0
+    while True:
+        p *= rng.random()
+        if p <= limit:
+            return k
+        k += 1
+
+def _odds(elo_ratings, home, away):
+    probabilities = odds_calculator.get_elo_based_probabilities(home, away, elo_ratings)
+    return odds_calculator.convert_to_odds(probabilities)
+
+def generate_league(db, teams=20, seasons=5, users=200, bets_per_match=20, scheduled=40, combo_every=5, seed=0):
+    """
+    Llena `db` (vacía) con una liga sintética y devuelve un resumen con los
+    tamaños generados y los ids útiles para un benchmark. No usa la aplicación
+    Flask; los ids se asignan aquí porque la base empieza vacía.
+    """
+    if db.execute("SELECT COUNT(*) FROM teams").fetchone()[0]:
+        raise ValueError('La base ya tiene equipos: generate_league necesita una base vacía.')
+    rng = random.Random(seed)
+    started = time.perf_counter()
+
+    team_ids = list(range(1, teams + 1))
+    strength = {team_id: rng.gauss(0, 0.3) for team_id in team_ids}
+    db.executemany("INSERT INTO teams (team_id, team_name) VALUES (?, ?)", [(team_id, f'Equipo {team_id}') for team_id in team_ids])
+    # user_id 1 es el administrador de `schema.sql`.
+    user_ids = list(range(2, users + 2))
+    db.executemany("INSERT INTO users (user_id, username, email, password_hash) VALUES (?, ?, ?, 'x')",
+                   [(user_id, f'user{user_id}', f'user{user_id}@bench') for user_id in user_ids])
+    transactions = [(user_id, None, None, 'INITIAL', INITIAL_BALANCE, '2015-01-01 00:00:00') for user_id in user_ids]
+
+    elo_ratings = {team_id: odds_calculator.INITIAL_ELO for team_id in team_ids}
+    matches, odds, bets = [], [], []
+
+    def add_match(home, away, kickoff, score=None):
+        match_id = len(matches) + 1
+        match_odds = _odds(elo_ratings, home, away)
+        odds.append((match_id, match_id, match_odds['odds_home'], match_odds['odds_draw'], match_odds['odds_away']))
+        status = 'SCHEDULED' if score is None else 'COMPLETED'
+        home_score, away_score = score or (None, None)
+        matches.append((match_id, home, away, kickoff.strftime('%Y-%m-%d %H:%M:%S'), home_score, away_score, status, match_id))
+        return match_id, match_odds
+
+    for season in range(seasons):
+        pairs = [(home, away) for home in team_ids for away in team_ids if home != away]
+        rng.shuffle(pairs)
+        start = FIRST_SEASON.replace(year=FIRST_SEASON.year + season)
+        for i, (home, away) in enumerate(pairs):
+            kickoff = start + timedelta(hours=4 * i)
+            home_score = poisson(rng, HOME_GOALS * math.exp(strength[home] - strength[away]))
+            away_score = poisson(rng, AWAY_GOALS * math.exp(strength[away] - strength[home]))
+            match_id, match_odds = add_match(home, away, kickoff, (home_score, away_score))
+            result = 'HOME_WIN' if home_score > away_score else 'AWAY_WIN' if away_score > home_score else 'DRAW'
+            placed_at = (kickoff - timedelta(hours=1)).strftime('%Y-%m-%d %H:%M:%S')
+            for _ in range(bets_per_match):
+                bet_id = len(bets) + 1
+                bet_type = rng.choice(BET_TYPES)
+                wager = float(rng.randint(1, 50))
+                price = match_odds[ODDS_COLUMNS[bet_type]]
+                status = 'WON' if bet_type == result else 'LOST'
+                bets.append((bet_id, rng.choice(user_ids), match_id, bet_type, wager, price, wager * price, status, placed_at, None, match_id))
+                transactions.append((bets[-1][1], bet_id, None, 'BET_PLACED', -wager, placed_at))
+                if status == 'WON':
+                    transactions.append((bets[-1][1], bet_id, None, 'WINNINGS', wager * price, kickoff.strftime('%Y-%m-%d %H:%M:%S')))
+            elo_ratings[home], elo_ratings[away] = odds_calculator.update_elo_pair(elo_ratings[home], elo_ratings[away], home_score, away_score)
+    completed = len(matches)
+
+    scheduled_ids, scheduled_odds = [], {}
+    for i in range(scheduled):
+        home, away = rng.sample(team_ids, 2)
+        match_id, match_odds = add_match(home, away, FIRST_SCHEDULED + timedelta(hours=2 * i))
+        scheduled_ids.append(match_id)
+        scheduled_odds[match_id] = match_odds
+
+    combos = []
+    placed_at = '2029-12-31 12:00:00'
+    for match_id in scheduled_ids:
+        for n in range(bets_per_match):
+            user_id = rng.choice(user_ids)
+            wager = float(rng.randint(1, 50))
+            if combo_every and n % combo_every == combo_every - 1 and len(scheduled_ids) > 1:
+                legs = [match_id] + rng.sample([other for other in scheduled_ids if other != match_id], 1)
+                combo_bet_id = len(combos) + 1
+                selections = [(leg, rng.choice(BET_TYPES)) for leg in legs]
+                total_odds = math.prod(scheduled_odds[leg][ODDS_COLUMNS[bet_type]] for leg, bet_type in selections)
+                combos.append((combo_bet_id, user_id, wager, wager * total_odds, placed_at))
+                for leg, bet_type in selections:
+                    price = scheduled_odds[leg][ODDS_COLUMNS[bet_type]]
+                    bets.append((len(bets) + 1, user_id, leg, bet_type, wager, price, wager * price, 'ACTIVE', placed_at, combo_bet_id, leg))
+                transactions.append((user_id, None, combo_bet_id, 'COMBO_BET_PLACED', -wager, placed_at))
+            else:
+                bet_type = rng.choice(BET_TYPES)
+                price = scheduled_odds[match_id][ODDS_COLUMNS[bet_type]]
+                bet_id = len(bets) + 1
+                bets.append((bet_id, user_id, match_id, bet_type, wager, price, wager * price, 'ACTIVE', placed_at, None, match_id))
+                transactions.append((user_id, bet_id, None, 'BET_PLACED', -wager, placed_at))
+
+    with db:
+        db.executemany("INSERT INTO matches (match_id, home_team_id, away_team_id, match_datetime, home_score, away_score, status, current_odds_id) "
+                       "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", matches)
+        db.executemany("INSERT INTO odds (odds_id, match_id, odds_home, odds_draw, odds_away) VALUES (?, ?, ?, ?, ?)", odds)
+        db.executemany("INSERT INTO combo_bets (combo_bet_id, user_id, total_wager, potential_payout, created_at) VALUES (?, ?, ?, ?, ?)", combos)
+        db.executemany("INSERT INTO bets (bet_id, user_id, match_id, bet_type, wager_amount, odds_at_placement, potential_payout, status, created_at, combo_bet_id, odds_id) "
+                       "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", bets)
+        db.executemany("INSERT INTO transactions (user_id, bet_id, combo_bet_id, transaction_type, amount, timestamp) VALUES (?, ?, ?, ?, ?, ?)", transactions)
+        db.execute("UPDATE users SET token_balance = (SELECT SUM(amount) FROM transactions t WHERE t.user_id = users.user_id) WHERE is_admin = 0")
+        exposure.rebuild(db)
+        board_cache.bump_version(db)
+    # Escribe también los snapshots por partido; da los mismos ratings que `elo_ratings`.
+    odds_calculator.rebuild_elo_ratings(db)
+    db.execute('ANALYZE')
+
+    return {
+        'teams': teams, 'seasons': seasons, 'users': users, 'bets_per_match': bets_per_match,
+        'completed_matches': completed, 'scheduled_matches': scheduled, 'bets': len(bets), 'combo_bets': len(combos),
+        'transactions': len(transactions), 'seed': seed, 'seconds': round(time.perf_counter() - started, 3),
+        'team_ids': team_ids, 'user_ids': user_ids, 'scheduled_ids': scheduled_ids,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('path')
+    parser.add_argument('--teams', type=int, default=20)
+    parser.add_argument('--seasons', type=int, default=5)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--bets-per-match', type=int, default=20)
+    parser.add_argument('--scheduled', type=int, default=40)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    db = scratch_db(args.path)
+    league = generate_league(db, args.teams, args.seasons, args.users, args.bets_per_match, args.scheduled, seed=args.seed)
+    db.close()
+    report('league', **{key: value for key, value in league.items() if not key.endswith('_ids')})
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,330 @@
+"""
+Prueba de carga reproducible sobre una liga sintética (`benchmarks.league`):
+la aplicación Flask se ejercita con su cliente de pruebas desde varios hilos en
+cinco escenarios, en este orden:
+
+- board: lectores del tablero (`/`).
+- bets: apuestas simples (`/bet/<id>`), combinadas (`/combo_bet`) y boletos
+  JSON (`/api/betslip`) de los usuarios de la liga.
+- settlement: el administrador encola la liquidación de `--settle` partidos
+  programados mientras los lectores siguen pidiendo `/`.
+- upload: el administrador sube CSV de resultados nuevos (`/admin/upload`).
+
+En settlement y upload la petición solo encola el trabajo; un hilo hace de
+`flask run-worker` y se reporta también la duración de cada trabajo
+(`<tipo>_job`).
+- elo: reconstrucción completa de los ratings y recálculo de las cuotas.
+
+Cada escenario y endpoint se imprime como una línea JSON con peticiones,
+throughput, p50/p99 y errores. `--output` guarda además los metadatos (commit,
+versiones, tamaño de la liga) y `--compare` compara con un resultado anterior.
+
+    python -m benchmarks.load_test --threads 8 --seconds 10 --output base.json
+    python -m benchmarks.load_test --threads 8 --seconds 10 --compare base.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import ROOT, latency_summary, report, scratch_db
+from benchmarks.league import generate_league
+from betslip import BET_TYPES
+from flask import got_request_exception, message_flashed
+from app import app
+import database
+import jobs
+import odds_calculator
+
+SCENARIOS = ('board', 'bets', 'settlement', 'upload', 'elo')
+ADMIN_ID = 1
+FIRST_UPLOAD = datetime(2029, 1, 1, 0, 0)
+
+class Errors:
+    """Cuenta los errores de la aplicación: excepciones, flashes 'danger' y respuestas 4xx/5xx."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def add(self):
+        with self.lock:
+            self.count += 1
+
+    def take(self):
+        with self.lock:
+            count, self.count = self.count, 0
+        return count
+
+    def on_flash(self, sender, message, category, **extra):
+        if category == 'danger':
+            self.add()
+
+    def on_exception(self, sender, exception, **extra):
+        self.add()
+
+def logged_client(user_id):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+    return client
+
+def timed(latencies, endpoint, request, errors):
+    started = time.perf_counter()
+    response = request()
+    latencies.setdefault(endpoint, []).append(time.perf_counter() - started)
+    if response.status_code >= 400:
+        errors.add()
+
+def start_clients(step, user_ids, n_threads, errors, seconds=None, stop=None, seed=0):
+    """
+    Lanza `n_threads` clientes que repiten `step(client, rng, latencias, errors)`
+    hasta que pasan `seconds` o se activa `stop`. `join_clients` espera a que
+    terminen y devuelve (latencias por endpoint, segundos).
+    """
+    latencies = {}
+    lock = threading.Lock()
+
+    def worker(i):
+        rng = random.Random(seed * 1000 + i)
+        client = logged_client(user_ids[i % len(user_ids)])
+        local = {}
+        deadline = time.perf_counter() + seconds if seconds else None
+        while not (stop is not None and stop.is_set()) and (deadline is None or time.perf_counter() < deadline):
+            step(client, rng, local, errors)
+        database.close_pooled_connections()
+        with lock:
+            for endpoint, values in local.items():
+                latencies.setdefault(endpoint, []).extend(values)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(n_threads)]
+    for thread in threads:
+        thread.start()
+    return threads, latencies, started
+
+def join_clients(threads, latencies, started):
+    for thread in threads:
+        thread.join()
+    return latencies, time.perf_counter() - started
+
+def start_worker(errors, stop):
+    """
+    Hilo que ejecuta la cola como `flask run-worker` hasta que se activa `stop`
+    y no quedan trabajos. Devuelve (hilo, latencias por tipo de trabajo).
+    """
+    latencies = {}
+
+    def work():
+        with app.app_context():
+            db = database.get_db()
+            worker = jobs.worker_name()
+            while True:
+                job = jobs.claim(db, worker)
+                if job is None:
+                    if stop.is_set():
+                        break
+                    time.sleep(0.01)
+                    continue
+                started = time.perf_counter()
+                job = jobs.run_job(db, job)
+                latencies.setdefault(f"{job['kind']}_job", []).append(time.perf_counter() - started)
+                if job['status'] != 'DONE':
+                    errors.add()
+        database.close_pooled_connections()
+
+    thread = threading.Thread(target=work)
+    thread.start()
+    return thread, latencies
+
+def read_board(client, rng, latencies, errors):
+    timed(latencies, 'index', lambda: client.get('/'), errors)
+
+def place_bets(scheduled_ids):
+    def step(client, rng, latencies, errors):
+        kind = rng.random()
+        if kind < 0.6:
+            timed(latencies, 'bet', lambda: client.post(
+                f'/bet/{rng.choice(scheduled_ids)}', data={'wager_amount': 1, 'bet_type': rng.choice(BET_TYPES)}), errors)
+        elif kind < 0.8:
+            legs = rng.sample(scheduled_ids, 2)
+            timed(latencies, 'combo_bet', lambda: client.post('/combo_bet', data={
+                'selection': [f'{leg}-{rng.choice(BET_TYPES)}' for leg in legs], 'combo_wager': 1}), errors)
+        else:
+            legs = rng.sample(scheduled_ids, 3)
+            slip = {
+                'singles': [{'match_id': leg, 'bet_type': rng.choice(BET_TYPES), 'wager': 1} for leg in legs],
+                'combos': [{'selections': [{'match_id': leg, 'bet_type': rng.choice(BET_TYPES)} for leg in legs[:2]], 'wager': 1}],
+            }
+            timed(latencies, 'betslip', lambda: client.post('/api/betslip', json=slip), errors)
+    return step
+
+def results_csv(rng, team_ids, rows, first_kickoff):
+    lines = ['home_team_id,away_team_id,match_datetime,home_score,away_score']
+    for i in range(rows):
+        home, away = rng.sample(team_ids, 2)
+        kickoff = (first_kickoff + timedelta(minutes=i)).strftime('%Y-%m-%d %H:%M:%S')
+        lines.append(f'Equipo {home},Equipo {away},{kickoff},{rng.randint(0, 4)},{rng.randint(0, 3)}')
+    return ('\n'.join(lines) + '\n').encode()
+
+def run_scenario(scenario, league, args, errors):
+    """Ejecuta un escenario y devuelve sus resultados, uno por endpoint."""
+    results = []
+
+    def add(endpoint, values, seconds, **extra):
+        results.append({'scenario': scenario, 'endpoint': endpoint, **latency_summary(values, seconds), **extra})
+
+    if scenario == 'board':
+        threads, latencies, started = start_clients(read_board, league['user_ids'], args.threads, errors, args.seconds, seed=args.seed)
+        latencies, seconds = join_clients(threads, latencies, started)
+        add('index', latencies.get('index', []), seconds, errors=errors.take())
+
+    elif scenario == 'bets':
+        step = place_bets(league['scheduled_ids'])
+        threads, latencies, started = start_clients(step, league['user_ids'], args.threads, errors, args.seconds, seed=args.seed)
+        latencies, seconds = join_clients(threads, latencies, started)
+        errors_seen = errors.take()
+        for endpoint in ('bet', 'combo_bet', 'betslip'):
+            add(endpoint, latencies.get(endpoint, []), seconds, errors=errors_seen)
+
+    elif scenario == 'settlement':
+        rng = random.Random(args.seed)
+        stop, worker_stop = threading.Event(), threading.Event()
+        threads, latencies, started = start_clients(read_board, league['user_ids'], args.threads, errors, stop=stop, seed=args.seed)
+        worker, job_latencies = start_worker(errors, worker_stop)
+        admin, settled = logged_client(ADMIN_ID), []
+        for match_id in league['scheduled_ids'][:args.settle]:
+            timed(latencies, 'settle_match', lambda: admin.post('/admin-actions', data={
+                'action': 'settle_match', 'match_id': match_id,
+                'home_score': rng.randint(0, 4), 'away_score': rng.randint(0, 3)}), errors)
+            settled.append(match_id)
+        # Los lectores siguen hasta que el worker termina de liquidar.
+        worker_stop.set()
+        worker.join()
+        stop.set()
+        latencies, seconds = join_clients(threads, latencies, started)
+        database.close_pooled_connections()
+        errors_seen = errors.take()
+        add('settle_match', latencies.get('settle_match', []), seconds, errors=errors_seen)
+        add('settle_match_job', job_latencies.get('settle_match_job', []), seconds, errors=errors_seen)
+        add('index', latencies.get('index', []), seconds, errors=errors_seen)
+        league['scheduled_ids'] = [match_id for match_id in league['scheduled_ids'] if match_id not in settled]
+
+    elif scenario == 'upload':
+        rng = random.Random(args.seed)
+        admin, latencies = logged_client(ADMIN_ID), {}
+        worker_stop = threading.Event()
+        started = time.perf_counter()
+        worker, job_latencies = start_worker(errors, worker_stop)
+        for i in range(args.uploads):
+            data = results_csv(rng, league['team_ids'], args.upload_rows, FIRST_UPLOAD + timedelta(days=30 * i))
+            timed(latencies, 'upload', lambda: admin.post('/admin/upload', data={'file': (io.BytesIO(data), 'resultados.csv')},
+                                                          content_type='multipart/form-data'), errors)
+        worker_stop.set()
+        worker.join()
+        seconds = time.perf_counter() - started
+        database.close_pooled_connections()
+        errors_seen = errors.take()
+        add('upload', latencies.get('upload', []), seconds, rows_per_upload=args.upload_rows, errors=errors_seen)
+        add('ingest_results_job', job_latencies.get('ingest_results_job', []), seconds, rows_per_upload=args.upload_rows, errors=errors_seen)
+
+    elif scenario == 'elo':
+        latencies = {}
+        started = time.perf_counter()
+        with app.app_context():
+            db = database.get_db()
+            for _ in range(args.repeat):
+                step_started = time.perf_counter()
+                odds_calculator.rebuild_elo_ratings(db)
+                latencies.setdefault('rebuild_elo', []).append(time.perf_counter() - step_started)
+                step_started = time.perf_counter()
+                with db:
+                    odds_calculator.reprice_scheduled_matches(db)
+                latencies.setdefault('reprice', []).append(time.perf_counter() - step_started)
+        seconds = time.perf_counter() - started
+        database.close_pooled_connections()
+        for endpoint in ('rebuild_elo', 'reprice'):
+            add(endpoint, latencies[endpoint], seconds, errors=0)
+
+    return results
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline_path):
+    """Una línea por escenario y endpoint con el cociente actual / base de p50, p99 y throughput."""
+    with open(baseline_path, encoding='utf8') as f:
+        baseline = {(row['scenario'], row['endpoint']): row for row in json.load(f)['results']}
+    for row in results:
+        base = baseline.get((row['scenario'], row['endpoint']))
+        if base is None:
+            continue
+        ratios = {}
+        for field in ('p50_ms', 'p99_ms', 'throughput'):
+            if row[field] is not None and base[field]:
+                ratios[f'{field}_ratio'] = round(row[field] / base[field], 3)
+        report('load_test_compare', scenario=row['scenario'], endpoint=row['endpoint'], **ratios)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='Escenarios separados por comas.')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10, help='Duración de board y bets.')
+    parser.add_argument('--settle', type=int, default=10, help='Partidos a liquidar en settlement.')
+    parser.add_argument('--uploads', type=int, default=3)
+    parser.add_argument('--upload-rows', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=3, help='Repeticiones de elo.')
+    parser.add_argument('--teams', type=int, default=20)
+    parser.add_argument('--seasons', type=int, default=5)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--bets-per-match', type=int, default=20)
+    parser.add_argument('--scheduled', type=int, default=40)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Guarda metadatos y resultados en este JSON.')
+    parser.add_argument('--compare', help='JSON de una ejecución anterior con --output.')
+    args = parser.parse_args()
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"escenarios desconocidos: {', '.join(sorted(unknown))}")
+
+    errors = Errors()
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'league.sqlite')
+        db = scratch_db(path)
+        league = generate_league(db, args.teams, args.seasons, args.users, args.bets_per_match, args.scheduled, seed=args.seed)
+        db.close()
+        app.config.update(DATABASE=path, ARCHIVE_DATABASE=os.path.join(workdir, 'archive.sqlite'),
+                          JOBS_UPLOAD_FOLDER=os.path.join(workdir, 'uploads'), PROPAGATE_EXCEPTIONS=False)
+        with message_flashed.connected_to(errors.on_flash, app), got_request_exception.connected_to(errors.on_exception, app):
+            for scenario in scenarios:
+                for row in run_scenario(scenario, league, args, errors):
+                    report('load_test', threads=args.threads, **row)
+                    results.append(row)
+        database.close_pooled_connections()
+
+    if args.output:
+        meta = {
+            'commit': git_commit(), 'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version,
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'league': {key: value for key, value in league.items() if not key.endswith('_ids')},
+            'args': vars(args),
+        }
+        with open(args.output, 'w', encoding='utf8') as f:
+            json.dump({'meta': meta, 'results': results}, f, indent=2, sort_keys=True)
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == '__main__':
+    main()
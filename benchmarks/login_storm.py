@@ -0,0 +1,132 @@
+"""
+Avalancha de logins al inicio de un partido: varios hilos hacen login con
+hashes pbkdf2 de 260000 iteraciones (como el admin de `schema.sql`) desde
+muchas IPs, mientras otros hilos piden el tablero (`/`) y apuestan. Compara el
+hash en el hilo de la petición (`inline`) con el pool acotado con cola limitada
+(`pool`) y reporta la latencia de las demás rutas y cuántos logins se rechazaron.
+
+    python -m benchmarks.login_storm --login-threads 16 --seconds 10
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+from benchmarks.common import percentile, report
+from werkzeug.security import generate_password_hash
+from app import app
+import database
+import odds_calculator
+import passwords
+
+PROFILES = {
+    'inline': {'PASSWORD_HASH_WORKERS': 0, 'LOGIN_ATTEMPTS_PER_IP': 10 ** 9, 'LOGIN_ATTEMPTS_PER_EMAIL': 10 ** 9},
+    'pool': dict(passwords.DEFAULT_CONFIG),
+}
+
+PASSWORD_METHOD = 'pbkdf2:sha256:260000'
+
+def prepare(path, n_users):
+    app.config.update(DATABASE=path)
+    with app.app_context():
+        database.init_db()
+        db = database.get_db()
+        db.executemany("INSERT INTO teams (team_name) VALUES (?)", [(f'Equipo {i}',) for i in range(20)])
+        for i in range(10):
+            match_id = db.execute("INSERT INTO matches (home_team_id, away_team_id, match_datetime) VALUES (?, ?, ?)",
+                                  (2 * i + 1, 2 * i + 2, f'2030-01-01 10:{i:02d}:00')).lastrowid
+            odds_calculator.store_odds(db, match_id, {'odds_home': 2.0, 'odds_draw': 3.2, 'odds_away': 3.8})
+        password_hash = generate_password_hash('secreto', method=PASSWORD_METHOD)
+        db.executemany("INSERT INTO users (username, email, password_hash, token_balance) VALUES (?, ?, ?, 1000000)",
+                       [(f'user{i}', f'user{i}@bench', password_hash) for i in range(n_users)])
+        db.commit()
+        match_ids = [row[0] for row in db.execute("SELECT match_id FROM matches")]
+        user_ids = [row[0] for row in db.execute("SELECT user_id FROM users WHERE is_admin = 0")]
+    database.close_pooled_connections()
+    return match_ids, user_ids
+
+def run(profile, login_threads, browse_threads, seconds, workdir):
+    app.config.update(PROFILES[profile])
+    passwords.limiter.clear()
+    match_ids, user_ids = prepare(os.path.join(workdir, f'{profile}.sqlite'), login_threads + browse_threads)
+    latencies = {'index': [], 'bet': [], 'login': []}
+    statuses = {}
+    lock = threading.Lock()
+
+    def login_worker(i):
+        client = app.test_client()
+        local, codes = [], {}
+        n = 0
+        while time.perf_counter() < deadline:
+            n += 1
+            started = time.perf_counter()
+            response = client.post('/login', data={'email': f'user{i}@bench', 'password': 'secreto'},
+                                   environ_base={'REMOTE_ADDR': f'10.0.{i}.{n % 250}'})
+            local.append(time.perf_counter() - started)
+            codes[response.status_code] = codes.get(response.status_code, 0) + 1
+        database.close_pooled_connections()
+        with lock:
+            latencies['login'].extend(local)
+            for code, count in codes.items():
+                statuses[code] = statuses.get(code, 0) + count
+
+    def browse_worker(user_id, seed):
+        rng = random.Random(seed)
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['user_id'] = user_id
+        local = {'index': [], 'bet': []}
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            if rng.random() < 0.3:
+                client.post(f'/bet/{rng.choice(match_ids)}', data={'wager_amount': 1, 'bet_type': 'DRAW'})
+                local['bet'].append(time.perf_counter() - started)
+            else:
+                client.get('/')
+                local['index'].append(time.perf_counter() - started)
+        database.close_pooled_connections()
+        with lock:
+            for name, values in local.items():
+                latencies[name].extend(values)
+
+    # El pool arranca sus procesos antes de medir, como haría un worker ya caliente.
+    if app.config['PASSWORD_HASH_WORKERS']:
+        with app.app_context():
+            passwords.check_password(generate_password_hash('x', method='pbkdf2:sha256:1'), 'x')
+    deadline = time.perf_counter() + seconds
+
+    threads = [threading.Thread(target=login_worker, args=(i,)) for i in range(login_threads)]
+    threads += [threading.Thread(target=browse_worker, args=(user_id, i)) for i, user_id in enumerate(user_ids[login_threads:])]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for name, values in latencies.items():
+        report('login_storm', profile=profile, endpoint=name, requests=len(values),
+               throughput=round(len(values) / seconds, 1),
+               p50_ms=round(percentile(values, 0.50) * 1000, 2) if values else None,
+               p99_ms=round(percentile(values, 0.99) * 1000, 2) if values else None,
+               **({'statuses': {str(code): count for code, count in sorted(statuses.items())}} if name == 'login' else {}))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--login-threads', type=int, default=16)
+    parser.add_argument('--browse-threads', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--hash-workers', type=int, default=None, help='Sobrescribe PASSWORD_HASH_WORKERS del perfil pool.')
+    parser.add_argument('--queue-limit', type=int, default=None, help='Sobrescribe PASSWORD_HASH_QUEUE_LIMIT del perfil pool.')
+    parser.add_argument('--profile', choices=('inline', 'pool', 'both'), default='both')
+    args = parser.parse_args()
+    if args.hash_workers is not None:
+        PROFILES['pool']['PASSWORD_HASH_WORKERS'] = args.hash_workers
+    if args.queue_limit is not None:
+        PROFILES['pool']['PASSWORD_HASH_QUEUE_LIMIT'] = args.queue_limit
+    with tempfile.TemporaryDirectory() as workdir:
+        for profile in (('inline', 'pool') if args.profile == 'both' else (args.profile,)):
+            run(profile, args.login_threads, args.browse_threads, args.seconds, workdir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Liquida un partido con muchas apuestas abiertas y compara el motor por conjuntos
+de `settlement.settle_match` con el bucle por apuesta anterior.
+
+    python -m benchmarks.settlement --bets 100000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from benchmarks.common import report, scratch_db
+import settlement
+
+def populate(db, n_users, n_bets, seed=0):
+    rng = random.Random(seed)
+    db.executemany("INSERT INTO teams (team_name) VALUES (?)", [('Local',), ('Visitante',)])
+    db.executemany("INSERT INTO users (username, email, password_hash) VALUES (?, ?, 'x')",
+                   [(f'u{i}', f'u{i}@bench') for i in range(n_users)])
+    match_id = db.execute("INSERT INTO matches (home_team_id, away_team_id, match_datetime) VALUES (1, 2, '2030-01-01 12:00')").lastrowid
+    user_ids = [row[0] for row in db.execute("SELECT user_id FROM users")]
+    bets = []
+    for _ in range(n_bets):
+        bet_type = rng.choice(('HOME_WIN', 'DRAW', 'AWAY_WIN'))
+        wager = rng.randint(1, 50)
+        bets.append((rng.choice(user_ids), match_id, bet_type, wager, 2.0, wager * 2.0))
+    db.executemany("INSERT INTO bets (user_id, match_id, bet_type, wager_amount, odds_at_placement, potential_payout) VALUES (?, ?, ?, ?, ?, ?)", bets)
+    db.commit()
+    return match_id
+
+def legacy_settle(db, match_id, home_score, away_score):
+    """Copia del bucle por apuesta que usaba `admin_actions` antes del motor por conjuntos."""
+    db.execute("UPDATE matches SET home_score = ?, away_score = ?, status = 'COMPLETED' WHERE match_id = ?", (home_score, away_score, match_id))
+    active_bets = db.execute("SELECT * FROM bets WHERE match_id = ? AND status = 'ACTIVE'", (match_id,)).fetchall()
+    match_result = settlement.match_result(home_score, away_score)
+    for bet in active_bets:
+        if bet['bet_type'] == match_result:
+            new_status, payout = 'WON', bet['potential_payout']
+            user = db.execute("SELECT token_balance FROM users WHERE user_id = ?", (bet['user_id'],)).fetchone()
+            db.execute("UPDATE users SET token_balance = ? WHERE user_id = ?", (user['token_balance'] + payout, bet['user_id']))
+            db.execute("INSERT INTO transactions (user_id, bet_id, transaction_type, amount) VALUES (?, ?, ?, ?)", (bet['user_id'], bet['bet_id'], 'WINNINGS', payout))
+        else:
+            new_status = 'LOST'
+        db.execute("UPDATE bets SET status = ? WHERE bet_id = ?", (new_status, bet['bet_id']))
+
+def run(engine, n_users, n_bets, workdir):
+    db = scratch_db(os.path.join(workdir, f'settle_{engine}.sqlite'))
+    match_id = populate(db, n_users, n_bets)
+    started = time.perf_counter()
+    with db:
+        if engine == 'legacy':
+            legacy_settle(db, match_id, 2, 1)
+        else:
+            settlement.settle_match(db, match_id, 2, 1)
+    elapsed = time.perf_counter() - started
+    balances = db.execute("SELECT SUM(token_balance) FROM users").fetchone()[0]
+    db.close()
+    report('settlement', engine=engine, bets=n_bets, users=n_users, seconds=round(elapsed, 4),
+           bets_per_sec=round(n_bets / elapsed), total_balance=round(balances, 2))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--bets', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--engine', choices=('set', 'legacy', 'both'), default='both')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as workdir:
+        for engine in (('legacy', 'set') if args.engine == 'both' else (args.engine,)):
+            run(engine, args.users, args.bets, workdir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Arranque en frío de un worker: cada perfil corre en un proceso nuevo, mide el
+tiempo de `import app` y la memoria residente (RSS) tras importar, tras la
+primera petición a `/`, tras la primera carga de CSV y tras la primera
+generación de cuotas, y qué librerías pesadas hay cargadas en cada punto.
+
+`lazy` es la aplicación tal cual; `eager` importa antes NumPy, pandas y SciPy
+como hacía cada worker cuando `app.py` los importaba de forma indirecta.
+
+    python -m benchmarks.startup --repeat 3
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.common import ROOT, report
+
+HEAVY_MODULES = ('numpy', 'pandas', 'scipy')
+
+CHILD = r"""
+import io, json, os, sys, time
+sys.path.insert(0, {root!r})
+os.chdir({root!r})
+
+def rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+
+def stage(name, started):
+    print(json.dumps({{'stage': name, 'ms': round((time.perf_counter() - started) * 1000, 1), 'rss_mb': round(rss_mb(), 1),
+                      'heavy': [m for m in {heavy!r} if m in sys.modules]}}))
+
+started = time.perf_counter()
+if {eager!r}:
+    import numpy, pandas, scipy.optimize
+from app import app
+import database
+stage('import', started)
+
+# Los trabajos de la carga y de las cuotas corren en la misma petición, como antes de la cola.
+app.config.update(DATABASE={database!r}, PASSWORD_HASH_WORKERS=0, JOBS_RUN_INLINE=True,
+                  JOBS_UPLOAD_FOLDER=os.path.join(os.path.dirname({database!r}), 'uploads'))
+with app.app_context():
+    database.init_db()
+client = app.test_client()
+started = time.perf_counter()
+client.get('/')
+stage('first_request', started)
+
+with client.session_transaction() as session:
+    session['user_id'] = 1
+csv = b'home_team_id,away_team_id,match_datetime,home_score,away_score\nA,B,2020-01-01 10:00:00,1,0\nB,C,2020-01-02 10:00:00,2,2\n'
+started = time.perf_counter()
+client.post('/admin/upload', data={{'file': (io.BytesIO(csv), 'resultados.csv')}}, content_type='multipart/form-data')
+stage('first_upload', started)
+
+started = time.perf_counter()
+client.post('/admin-actions', data={{'action': 'add_match', 'home_team_id': 1, 'away_team_id': 2, 'match_datetime': '2031-01-01T10:00'}})
+stage('first_odds', started)
+"""
+
+def run_child(profile, workdir):
+    code = CHILD.format(root=ROOT, heavy=HEAVY_MODULES, eager=profile == 'eager', database=os.path.join(workdir, f'{profile}.sqlite'))
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+    return [json.loads(line) for line in output.splitlines() if line.startswith('{')]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=3, help='Procesos por perfil; se reporta la mediana.')
+    parser.add_argument('--profile', choices=('lazy', 'eager', 'both'), default='both')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as workdir:
+        for profile in (('eager', 'lazy') if args.profile == 'both' else (args.profile,)):
+            runs = [run_child(profile, workdir) for _ in range(args.repeat)]
+            for i, first in enumerate(runs[0]):
+                samples = sorted(run[i]['ms'] for run in runs)
+                rss = sorted(run[i]['rss_mb'] for run in runs)
+                report('startup', profile=profile, stage=first['stage'], ms=samples[len(samples) // 2],
+                       rss_mb=rss[len(rss) // 2], heavy_modules=first['heavy'])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+import math
+import exposure
+import wallet
+
+BET_TYPES = ('HOME_WIN', 'DRAW', 'AWAY_WIN')
+ODDS_COLUMNS = {'HOME_WIN': 'odds_home', 'DRAW': 'odds_draw', 'AWAY_WIN': 'odds_away'}
+MAX_ITEMS = 50
+# Selecciones por combinada; junto con MAX_ITEMS acota la lista IN de `place_betslip`.
+MAX_SELECTIONS = 20
+
+# Cuotas vigentes de todos los partidos del boleto que todavía admiten apuestas.
+CURRENT_ODDS_IN_SQL = """
+    SELECT m.match_id, o.odds_id, o.odds_home, o.odds_draw, o.odds_away
+    FROM matches m JOIN odds o ON o.odds_id = m.current_odds_id
+    WHERE m.status = 'SCHEDULED' AND m.match_id IN ({placeholders})
+"""
+
+INSERT_BET_SQL = """
+    INSERT INTO bets (user_id, match_id, bet_type, wager_amount, odds_at_placement, potential_payout, combo_bet_id, odds_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+class InsufficientFunds(ValueError):
+    pass
+
+class MatchClosed(ValueError):
+    """El partido ya no admite apuestas: se liquidó, se canceló o no existe."""
+
+def _wager(value):
+    try:
+        wager = float(value)
+    except (TypeError, ValueError):
+        raise ValueError('El monto de la apuesta debe ser un número.')
+    if not math.isfinite(wager) or wager <= 0:
+        raise ValueError('El monto de la apuesta debe ser positivo.')
+    return wager
+
+def _selection(item):
+    try:
+        match_id, bet_type = int(item['match_id']), item['bet_type']
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('Cada selección necesita match_id y bet_type.')
+    if bet_type not in BET_TYPES:
+        raise ValueError(f'Tipo de apuesta no válido: {bet_type}')
+    return match_id, bet_type
+
+def parse_betslip(payload):
+    """
+    Valida un boleto {'singles': [{match_id, bet_type, wager}], 'combos': [{selections: [{match_id, bet_type}], wager}]}
+    y lo devuelve normalizado. Lanza ValueError con el motivo si no es válido.
+    """
+    if not isinstance(payload, dict):
+        raise ValueError('El boleto debe ser un objeto JSON.')
+    singles, combos = payload.get('singles') or [], payload.get('combos') or []
+    if not isinstance(singles, list) or not isinstance(combos, list):
+        raise ValueError('singles y combos deben ser listas.')
+    if not singles and not combos:
+        raise ValueError('El boleto está vacío.')
+    if len(singles) + len(combos) > MAX_ITEMS:
+        raise ValueError(f'Como máximo {MAX_ITEMS} apuestas por boleto.')
+
+    slip = {'singles': [], 'combos': []}
+    for item in singles:
+        if not isinstance(item, dict):
+            raise ValueError('Cada apuesta simple debe ser un objeto.')
+        slip['singles'].append((*_selection(item), _wager(item.get('wager'))))
+    for item in combos:
+        if not isinstance(item, dict) or not isinstance(item.get('selections'), list):
+            raise ValueError('Cada combinada necesita una lista de selecciones.')
+        if len(item['selections']) > MAX_SELECTIONS:
+            raise ValueError(f'Como máximo {MAX_SELECTIONS} partidos por combinada.')
+        selections = [_selection(selection) for selection in item['selections']]
+        if len(selections) < 2:
+            raise ValueError('Una combinada necesita al menos dos partidos.')
+        if len({match_id for match_id, _ in selections}) != len(selections):
+            raise ValueError('No puedes seleccionar más de una opción por partido en una apuesta combinada.')
+        slip['combos'].append((selections, _wager(item.get('wager'))))
+    return slip
+
+def place_betslip(db, user_id, slip):
+    """
+    Coloca todas las apuestas de un boleto ya validado con `parse_betslip`:
+    un único débito por el total, una consulta `IN` con las cuotas de todos los
+    partidos y `executemany` para combinadas, apuestas, movimientos y exposición.
+
+    Debe llamarse dentro de `with db:`. El débito va primero: toma el lock de
+    escritura, así que las cuotas leídas después no pueden cambiar hasta el commit.
+    Lanza InsufficientFunds, MatchClosed o ValueError (y el `with` deshace todo).
+    Devuelve un resumen con las apuestas colocadas.
+    """
+    total = sum(wager for _, _, wager in slip['singles']) + sum(wager for _, wager in slip['combos'])
+    if not wallet.debit(db, user_id, total):
+        raise InsufficientFunds('No tienes suficientes tokens.')
+
+    match_ids = sorted({match_id for match_id, _, _ in slip['singles']}
+                       | {match_id for selections, _ in slip['combos'] for match_id, _ in selections})
+    placeholders = ', '.join('?' * len(match_ids))
+    odds = {row['match_id']: row for row in db.execute(CURRENT_ODDS_IN_SQL.format(placeholders=placeholders), match_ids).fetchall()}
+    closed = [match_id for match_id in match_ids if match_id not in odds]
+    if closed:
+        raise MatchClosed(f"No se puede apostar en los partidos: {', '.join(map(str, closed))}")
+
+    def price(match_id, bet_type):
+        row = odds[match_id]
+        return row[ODDS_COLUMNS[bet_type]], row['odds_id']
+
+    # Los ids nuevos son mayores que el máximo actual y nadie más escribe hasta el commit.
+    last_bet_id = db.execute("SELECT COALESCE(MAX(bet_id), 0) FROM bets").fetchone()[0]
+    last_combo_id = db.execute("SELECT COALESCE(MAX(combo_bet_id), 0) FROM combo_bets").fetchone()[0]
+
+    combos = []
+    for selections, wager in slip['combos']:
+        legs = [(match_id, bet_type, *price(match_id, bet_type)) for match_id, bet_type in selections]
+        total_odds = math.prod(leg[2] for leg in legs)
+        combos.append({'legs': legs, 'wager': wager, 'total_odds': total_odds, 'potential_payout': wager * total_odds})
+    db.executemany("INSERT INTO combo_bets (user_id, total_wager, potential_payout) VALUES (?, ?, ?)",
+                   [(user_id, combo['wager'], combo['potential_payout']) for combo in combos])
+    combo_ids = [row[0] for row in db.execute(
+        "SELECT combo_bet_id FROM combo_bets WHERE combo_bet_id > ? AND user_id = ? ORDER BY combo_bet_id", (last_combo_id, user_id))]
+    for combo, combo_bet_id in zip(combos, combo_ids):
+        combo['combo_bet_id'] = combo_bet_id
+
+    singles = []
+    for match_id, bet_type, wager in slip['singles']:
+        odds_at_placement, odds_id = price(match_id, bet_type)
+        singles.append((user_id, match_id, bet_type, wager, odds_at_placement, wager * odds_at_placement, None, odds_id))
+    # En las selecciones de una combinada `wager_amount` es el monto de toda la combinada
+    # (como siempre lo guardó la aplicación): los totales por apuesta filtran `combo_bet_id IS NULL`.
+    legs = [(user_id, match_id, bet_type, combo['wager'], leg_odds, combo['wager'] * leg_odds, combo['combo_bet_id'], odds_id)
+            for combo in combos for match_id, bet_type, leg_odds, odds_id in combo['legs']]
+    db.executemany(INSERT_BET_SQL, singles + legs)
+
+    db.execute(
+        """
+        INSERT INTO transactions (user_id, bet_id, transaction_type, amount)
+        SELECT user_id, bet_id, 'BET_PLACED', -wager_amount FROM bets
+        WHERE bet_id > ? AND user_id = ? AND combo_bet_id IS NULL
+        """, (last_bet_id, user_id))
+    db.execute(
+        """
+        INSERT INTO transactions (user_id, combo_bet_id, transaction_type, amount)
+        SELECT user_id, combo_bet_id, 'COMBO_BET_PLACED', -total_wager FROM combo_bets
+        WHERE combo_bet_id > ? AND user_id = ?
+        """, (last_combo_id, user_id))
+
+    exposure.add_bets(db, [(match_id, bet_type, wager, payout) for _, match_id, bet_type, wager, _, payout, _, _ in singles])
+    exposure.add_combos(db, [([(match_id, bet_type) for match_id, bet_type, _, _ in combo['legs']], combo['wager'], combo['potential_payout'])
+                             for combo in combos])
+
+    return {
+        'total_wager': total,
+        'singles': [{'match_id': match_id, 'bet_type': bet_type, 'wager': wager, 'odds': odds_at_placement, 'potential_payout': payout}
+                    for _, match_id, bet_type, wager, odds_at_placement, payout, _, _ in singles],
+        'combos': [{'combo_bet_id': combo['combo_bet_id'], 'wager': combo['wager'], 'total_odds': combo['total_odds'],
+                    'potential_payout': combo['potential_payout']} for combo in combos],
+    }
@@ -0,0 +1,65 @@
+import threading
+from datetime import datetime, timezone
+from flask import current_app
+import events
+
+BOARD = 'board'
+
+BOARD_SQL = """
+    SELECT m.match_id, m.match_datetime, o.odds_home, o.odds_draw, o.odds_away, ht.team_name as home_team, at.team_name as away_team
+    FROM matches m
+    JOIN odds o ON o.odds_id = m.current_odds_id
+    JOIN teams ht ON m.home_team_id = ht.team_id
+    JOIN teams at ON m.away_team_id = at.team_id
+    WHERE m.status = 'SCHEDULED'
+    ORDER BY m.match_datetime ASC
+"""
+
+# Caché por worker: {(nombre, base de datos): (versión, partidos, fragmento renderizado o None)}.
+_cache = {}
+_lock = threading.Lock()
+
+def bump_version(db, name=BOARD):
+    """
+    Invalida la caché de todos los workers y avisa a los clientes conectados por SSE.
+    Debe ir en la misma transacción que el cambio.
+    """
+    db.execute("UPDATE data_versions SET version = version + 1, updated_at = CURRENT_TIMESTAMP WHERE name = ?", (name,))
+    if name == BOARD:
+        events.publish_board(db)
+
+def get_version(db, name=BOARD):
+    """
+    Devuelve (versión, fecha de última modificación en UTC). La versión incluye la
+    fecha para no confundir dos bases recreadas que vuelvan a empezar en 0.
+    """
+    row = db.execute("SELECT version, updated_at FROM data_versions WHERE name = ?", (name,)).fetchone()
+    if row is None:
+        return '0', None
+    updated_at = datetime.strptime(row['updated_at'], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+    return f"{row['version']}-{int(updated_at.timestamp())}", updated_at
+
+def _key(name):
+    return name, current_app.config['DATABASE']
+
+def get_board(db, version):
+    """Partidos del tablero para `version`; solo consulta la base si la versión cambió."""
+    cached = _cache.get(_key(BOARD))
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    matches = db.execute(BOARD_SQL).fetchall()
+    with _lock:
+        _cache[_key(BOARD)] = (version, matches, None)
+    return matches
+
+def get_board_fragment(db, version, render):
+    """Partidos y fragmento HTML del tablero para `version`; `render(matches)` solo se llama si cambió."""
+    matches = get_board(db, version)
+    cached = _cache.get(_key(BOARD))
+    if cached is not None and cached[0] == version and cached[2] is not None:
+        return matches, cached[2]
+    fragment = render(matches)
+    with _lock:
+        if _cache.get(_key(BOARD), (None,))[0] == version:
+            _cache[_key(BOARD)] = (version, matches, fragment)
+    return matches, fragment
@@ -1,31 +1,187 @@
+import importlib.util
+import os
+import re
 import sqlite3
+import threading
+from urllib.parse import quote
 import click
 from flask import current_app, g
+import metrics
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+DEFAULT_CONFIG = {
+    # Tiempo que SQLite espera por un lock antes de lanzar "database is locked".
+    'DATABASE_BUSY_TIMEOUT_MS': 5000,
+    # WAL permite que los lectores no bloqueen al escritor ni al revés.
+    'DATABASE_JOURNAL_MODE': 'WAL',
+    # En WAL, NORMAL solo sincroniza en los checkpoints.
+    'DATABASE_SYNCHRONOUS': 'NORMAL',
+    # Negativo = KiB de caché de páginas por conexión.
+    'DATABASE_CACHE_SIZE': -16000,
+    'DATABASE_MMAP_SIZE': 64 * 1024 * 1024,
+    # Reutilizar una conexión por hilo del worker en lugar de abrir una por petición.
+    'DATABASE_REUSE_CONNECTIONS': True,
+    # Contar y cronometrar cada sentencia (ver metrics.InstrumentedConnection).
+    'DATABASE_INSTRUMENT': True,
+    # Si no es None, las sentencias que tarden al menos estos ms se registran con su plan.
+    'DATABASE_SLOW_QUERY_MS': None,
+}
+
+# Conexiones reutilizables de este hilo, por (ruta, solo_lectura).
+_local = threading.local()
+
+def _pool():
+    if not hasattr(_local, 'connections'):
+        _local.connections = {}
+    return _local.connections
+
+def connect(path, config=DEFAULT_CONFIG, readonly=False):
+    """Abre una conexión con los pragmas configurados. `config` puede ser `app.config`."""
+    def setting(name):
+        return config.get(name, DEFAULT_CONFIG[name])
+
+    factory = metrics.InstrumentedConnection if setting('DATABASE_INSTRUMENT') else sqlite3.Connection
+    if readonly:
+        db = sqlite3.connect(f'file:{quote(os.path.abspath(path))}?mode=ro', uri=True, factory=factory,
+                             detect_types=sqlite3.PARSE_DECLTYPES, timeout=setting('DATABASE_BUSY_TIMEOUT_MS') / 1000)
+        db.execute('PRAGMA query_only = ON')
+    else:
+        db = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES, timeout=setting('DATABASE_BUSY_TIMEOUT_MS') / 1000, factory=factory)
+        if setting('DATABASE_JOURNAL_MODE'):
+            db.execute(f"PRAGMA journal_mode = {setting('DATABASE_JOURNAL_MODE')}")
+    db.row_factory = sqlite3.Row
+    if setting('DATABASE_INSTRUMENT'):
+        db.slow_query_ms = setting('DATABASE_SLOW_QUERY_MS')
+    if setting('DATABASE_SYNCHRONOUS'):
+        db.execute(f"PRAGMA synchronous = {setting('DATABASE_SYNCHRONOUS')}")
+    if setting('DATABASE_CACHE_SIZE'):
+        db.execute(f"PRAGMA cache_size = {int(setting('DATABASE_CACHE_SIZE'))}")
+    if setting('DATABASE_MMAP_SIZE'):
+        db.execute(f"PRAGMA mmap_size = {int(setting('DATABASE_MMAP_SIZE'))}")
+    return db
+
+def _get_connection(readonly):
+    config = current_app.config
+    path = config['DATABASE']
+    if not config.get('DATABASE_REUSE_CONNECTIONS'):
+        return connect(path, config, readonly)
+    key = (path, readonly)
+    pool = _pool()
+    if key not in pool:
+        pool[key] = connect(path, config, readonly)
+    return pool[key]
 
 def get_db():
     if 'db' not in g:
-        g.db = sqlite3.connect(
-            current_app.config['DATABASE'],
-            detect_types=sqlite3.PARSE_DECLTYPES
-        )
-        g.db.row_factory = sqlite3.Row
+        g.db = _get_connection(readonly=False)
     return g.db
 
-def close_db(e=None):
-    db = g.pop('db', None)
-    if db is not None:
+def get_read_db():
+    """
+    Conexión de solo lectura para vistas que no escriben (`index`, `profile`).
+    Si la petición ya abrió la conexión de escritura, se usa esa para ver sus propios cambios.
+    """
+    if 'db' in g:
+        return g.db
+    if 'read_db' not in g:
+        g.read_db = _get_connection(readonly=True)
+    return g.read_db
+
+def _release(db):
+    if current_app.config.get('DATABASE_REUSE_CONNECTIONS'):
+        # La conexión vuelve al hilo; nunca debe quedar una transacción abierta.
+        if db.in_transaction:
+            db.rollback()
+    else:
         db.close()
 
+def close_db(e=None):
+    for name in ('db', 'read_db'):
+        db = g.pop(name, None)
+        if db is not None:
+            _release(db)
+
+def close_pooled_connections():
+    """Cierra las conexiones reutilizables de este hilo (p. ej. al cambiar de base de datos)."""
+    pool = _pool()
+    while pool:
+        pool.popitem()[1].close()
+
+def list_migrations(directory=MIGRATIONS_DIR):
+    """Devuelve [(versión, ruta)] de los ficheros `NNNN_nombre.sql` o `.py`, ordenados por versión."""
+    migrations = []
+    for name in os.listdir(directory):
+        match = re.match(r'(\d+)_.*\.(sql|py)$', name)
+        if match:
+            migrations.append((int(match.group(1)), os.path.join(directory, name)))
+    return sorted(migrations)
+
+def _run_python_migration(db, version, path):
+    """Ejecuta `upgrade(db)` del fichero dado en una transacción junto con la subida de versión."""
+    spec = importlib.util.spec_from_file_location(f'migration_{version:04d}', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    db.execute('BEGIN IMMEDIATE')
+    module.upgrade(db)
+    db.execute(f'PRAGMA user_version = {version}')
+    db.commit()
+
+def migrate_db(db, directory=MIGRATIONS_DIR):
+    """
+    Aplica, sin borrar datos, las migraciones con versión mayor que `PRAGMA user_version`.
+    Cada migración corre en su propia transacción junto con la subida de versión.
+    Las `.sql` son scripts; las `.py` definen `upgrade(db)`, que no hace commit,
+    para los pasos que necesitan código de la aplicación (p. ej. repetir el historial Elo).
+    Si una falla se deshace entera y se relanza el error. Devuelve la lista de versiones aplicadas.
+    """
+    current = db.execute('PRAGMA user_version').fetchone()[0]
+    applied = []
+    for version, path in list_migrations(directory):
+        if version <= current:
+            continue
+        try:
+            if path.endswith('.py'):
+                _run_python_migration(db, version, path)
+            else:
+                with open(path, encoding='utf8') as f:
+                    script = f.read()
+                db.executescript(f'BEGIN IMMEDIATE;\n{script}\nPRAGMA user_version = {version};\nCOMMIT;')
+        except Exception:
+            if db.in_transaction:
+                db.rollback()
+            raise
+        applied.append(version)
+    return applied
+
 def init_db():
     db = get_db()
     with current_app.open_resource('schema.sql') as f:
         db.executescript(f.read().decode('utf8'))
+    db.execute('PRAGMA user_version = 0')
+    migrate_db(db)
 
 @click.command('init-db')
 def init_db_command():
     init_db()
     click.echo('Initialized the database.')
 
+@click.command('migrate-db')
+def migrate_db_command():
+    """Aplica las migraciones pendientes sin borrar datos."""
+    try:
+        applied = migrate_db(get_db())
+    except ValueError as e:
+        # Una migración que no puede decidir sola (ver 0010) explica qué corregir.
+        raise click.ClickException(str(e))
+    if applied:
+        click.echo(f'Applied migrations: {", ".join(str(v) for v in applied)}.')
+    else:
+        click.echo('Database is up to date.')
+
 def init_app(app):
+    for name, value in DEFAULT_CONFIG.items():
+        app.config.setdefault(name, value)
     app.teardown_appcontext(close_db)
-    app.cli.add_command(init_db_command)
\ No newline at end of file
+    app.cli.add_command(init_db_command)
+    app.cli.add_command(migrate_db_command)
@@ -0,0 +1,229 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from flask import current_app
+import database
+
+DEFAULT_CONFIG = {
+    # Cada worker consulta `events` una vez por intervalo, tenga los clientes que tenga.
+    'EVENTS_POLL_INTERVAL': 1.0,
+    # Clientes SSE por worker; cada uno ocupa un hilo durante todo el stream, así que
+    # debe quedar muy por debajo de `--threads` (ver `procfile`) para no dejar sin hilos al resto.
+    'EVENTS_MAX_CLIENTS': 8,
+    # Al cerrar el stream el navegador reconecta con Last-Event-ID y no pierde eventos.
+    'EVENTS_STREAM_SECONDS': 300,
+    'EVENTS_KEEPALIVE_SECONDS': 15,
+}
+
+# Eventos que se conservan en la tabla y en memoria para reenviar tras una reconexión.
+RETENTION = 10000
+RECENT_EVENTS = 1000
+# Eventos pendientes por cliente; si un cliente lento los acumula, se le corta el stream.
+CLIENT_QUEUE_SIZE = 100
+RETRY_MS = 3000
+
+logger = logging.getLogger('apuestas.events')
+
+PUBLISH_SQL = "INSERT INTO events (user_id, event, data) VALUES (?, ?, ?)"
+
+# Un evento `account` por usuario con apuestas en el partido: su balance, el
+# resultado (NULL si se canceló), con el que la página deduce el estado de sus
+# apuestas simples en el partido, y el estado de sus combinadas con una selección
+# en él. No lista las apuestas una a una: el tamaño del evento depende de las
+# combinadas del usuario, no de cuántas apuestas simples tenga en el partido.
+ACCOUNT_EVENTS_SQL = """
+    WITH combos AS (
+        SELECT c.user_id, json_group_array(json_object('combo_bet_id', c.combo_bet_id, 'status', c.status,
+                                                       'potential_payout', c.potential_payout)) AS combos
+        FROM bets l
+        JOIN combo_bets c ON c.combo_bet_id = l.combo_bet_id
+        WHERE l.match_id = ? AND l.combo_bet_id IS NOT NULL
+        GROUP BY c.user_id
+    )
+    INSERT INTO events (user_id, event, data)
+    SELECT u.user_id, 'account', json_object('balance', u.token_balance, 'match_id', ?, 'result', ?,
+                                             'combos', json(COALESCE(combos.combos, '[]')))
+    FROM users u
+    LEFT JOIN combos ON combos.user_id = u.user_id
+    WHERE u.user_id IN (SELECT user_id FROM bets WHERE match_id = ?)
+"""
+
+BALANCE_EVENT_SQL = """
+    INSERT INTO events (user_id, event, data)
+    SELECT user_id, 'account', json_object('balance', token_balance) FROM users WHERE user_id = ?
+"""
+
+# Estado de un trabajo en segundo plano, para el administrador que lo encoló.
+JOB_EVENT_SQL = """
+    INSERT INTO events (user_id, event, data)
+    SELECT created_by, 'job', json_object('job_id', job_id, 'status', status, 'progress', json(progress),
+                                          'result', json(result), 'error', error)
+    FROM jobs WHERE job_id = ? AND created_by IS NOT NULL
+"""
+
+def publish(db, event, data, user_id=None):
+    """Publica un evento para `user_id` (o para todos). No hace commit: sale con la transacción del cambio."""
+    db.execute(PUBLISH_SQL, (user_id, event, json.dumps(data)))
+
+def publish_board(db):
+    """El tablero cambió. Aprovecha para recortar la tabla, que solo sirve para reconexiones."""
+    publish(db, 'board', {})
+    db.execute("DELETE FROM events WHERE event_id <= (SELECT MAX(event_id) FROM events) - ?", (RETENTION,))
+
+def publish_match_accounts(db, match_id, result):
+    """
+    Tras liquidar (`result` es el tipo de apuesta ganador) o cancelar (`result` None)
+    un partido: un evento por usuario afectado con su balance y sus combinadas.
+    """
+    db.execute(ACCOUNT_EVENTS_SQL, (match_id, match_id, result, match_id))
+
+def publish_balance(db, user_id):
+    db.execute(BALANCE_EVENT_SQL, (user_id,))
+
+def publish_job(db, job_id):
+    db.execute(JOB_EVENT_SQL, (job_id,))
+
+class Subscription:
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.queue = queue.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        self.closed = False
+
+    def wants(self, event):
+        return event['user_id'] is None or event['user_id'] == self.user_id
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.closed = True
+
+class Broker:
+    """
+    Reparte los eventos de una base a los clientes SSE de este proceso. Un hilo
+    lee los eventos nuevos con una sola consulta por intervalo y los copia a la
+    cola de cada cliente, así N clientes no son N consultas.
+    """
+    def __init__(self, path, config):
+        self.path = path
+        self.config = config
+        self._subscriptions = set()
+        self._recent = deque(maxlen=RECENT_EVENTS)
+        self._last_id = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self, user_id, last_event_id=None):
+        """
+        Registra un cliente y devuelve (suscripción, eventos pendientes desde
+        `last_event_id`), o (None, None) si el worker ya tiene el máximo de clientes.
+        """
+        with self._lock:
+            if self.full():
+                return None, None
+            subscription = Subscription(user_id)
+            self._subscriptions.add(subscription)
+            backlog = []
+            if last_event_id is not None:
+                backlog = [event for event in self._recent if event['event_id'] > last_event_id and subscription.wants(event)]
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='events-broker', daemon=True)
+                self._thread.start()
+        return subscription, backlog
+
+    def full(self):
+        return len(self._subscriptions) >= self.config['EVENTS_MAX_CLIENTS']
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def poll(self, db):
+        """Lee los eventos nuevos y los reparte. Devuelve cuántos leyó."""
+        if self._last_id is None:
+            self._last_id = db.execute("SELECT COALESCE(MAX(event_id), 0) FROM events").fetchone()[0]
+            return 0
+        rows = db.execute("SELECT event_id, user_id, event, data FROM events WHERE event_id > ? ORDER BY event_id LIMIT ?",
+                          (self._last_id, RECENT_EVENTS)).fetchall()
+        with self._lock:
+            for row in rows:
+                event = dict(row)
+                self._recent.append(event)
+                for subscription in self._subscriptions:
+                    if subscription.wants(event):
+                        subscription.put(event)
+            if rows:
+                self._last_id = rows[-1]['event_id']
+        return len(rows)
+
+    def _run(self):
+        db = database.connect(self.path, self.config, readonly=True)
+        while True:
+            time.sleep(self.config['EVENTS_POLL_INTERVAL'])
+            try:
+                self.poll(db)
+            except Exception:
+                logger.exception('Error leyendo eventos de %s', self.path)
+                db.close()
+                db = database.connect(self.path, self.config, readonly=True)
+
+_brokers = {}
+_brokers_pid = None
+_brokers_lock = threading.Lock()
+
+def get_broker():
+    """Broker de este proceso para la base actual; se crea al primer cliente, después del fork de gunicorn."""
+    global _brokers_pid
+    config = current_app.config
+    with _brokers_lock:
+        if _brokers_pid != os.getpid():
+            _brokers.clear()
+            _brokers_pid = os.getpid()
+        broker = _brokers.get(config['DATABASE'])
+        if broker is None:
+            broker = _brokers[config['DATABASE']] = Broker(config['DATABASE'], dict(config))
+    return broker
+
+def format_event(event):
+    return f"id: {event['event_id']}\nevent: {event['event']}\ndata: {event['data']}\n\n"
+
+def stream(user_id, last_event_id=None):
+    """
+    Generador con el stream SSE de un cliente, o None si el worker está lleno.
+    No usa el contexto de la petición: sigue vivo después de que Flask la cierre.
+    """
+    config = current_app.config
+    broker = get_broker()
+    if broker.full():
+        return None
+    stream_seconds, keepalive = config['EVENTS_STREAM_SECONDS'], config['EVENTS_KEEPALIVE_SECONDS']
+
+    def generate():
+        # La suscripción se crea al empezar a enviar: si el cliente se va antes, no queda colgada.
+        subscription, backlog = broker.subscribe(user_id, last_event_id)
+        if subscription is None:
+            yield f'retry: {RETRY_MS * 10}\n\n'
+            return
+        deadline = time.monotonic() + stream_seconds
+        try:
+            yield f'retry: {RETRY_MS}\n\n'
+            for event in backlog:
+                yield format_event(event)
+            while not subscription.closed and time.monotonic() < deadline:
+                try:
+                    event = subscription.queue.get(timeout=keepalive)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+                else:
+                    yield format_event(event)
+        finally:
+            broker.unsubscribe(subscription)
+    return generate()
+
+def init_app(app):
+    for name, value in DEFAULT_CONFIG.items():
+        app.config.setdefault(name, value)
@@ -0,0 +1,133 @@
+import click
+import database
+
+OUTCOMES = ('HOME_WIN', 'DRAW', 'AWAY_WIN')
+
+ADD_SQL = """
+    INSERT INTO match_exposure (match_id, bet_type, bet_count, total_stake, total_potential_payout, combo_count, combo_stake, combo_potential_payout)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (match_id, bet_type) DO UPDATE SET
+        bet_count = bet_count + excluded.bet_count,
+        total_stake = total_stake + excluded.total_stake,
+        total_potential_payout = total_potential_payout + excluded.total_potential_payout,
+        combo_count = combo_count + excluded.combo_count,
+        combo_stake = combo_stake + excluded.combo_stake,
+        combo_potential_payout = combo_potential_payout + excluded.combo_potential_payout
+"""
+
+# Agregado desde `bets` de las apuestas vivas: simples ACTIVE y selecciones ACTIVE
+# de combinadas que siguen ACTIVE. `{where}` acota los partidos.
+AGGREGATE_SQL = """
+    SELECT b.match_id, b.bet_type,
+           SUM(b.combo_bet_id IS NULL) AS bet_count,
+           SUM(CASE WHEN b.combo_bet_id IS NULL THEN b.wager_amount ELSE 0 END) AS total_stake,
+           SUM(CASE WHEN b.combo_bet_id IS NULL THEN b.potential_payout ELSE 0 END) AS total_potential_payout,
+           SUM(b.combo_bet_id IS NOT NULL) AS combo_count,
+           SUM(CASE WHEN b.combo_bet_id IS NOT NULL THEN c.total_wager ELSE 0 END) AS combo_stake,
+           SUM(CASE WHEN b.combo_bet_id IS NOT NULL THEN c.potential_payout ELSE 0 END) AS combo_potential_payout
+    FROM bets b
+    LEFT JOIN combo_bets c ON c.combo_bet_id = b.combo_bet_id
+    WHERE b.status = 'ACTIVE' AND (b.combo_bet_id IS NULL OR c.status = 'ACTIVE') {where}
+    GROUP BY b.match_id, b.bet_type
+"""
+
+COLUMNS = ('match_id', 'bet_type', 'bet_count', 'total_stake', 'total_potential_payout', 'combo_count', 'combo_stake', 'combo_potential_payout')
+
+# Partidos con selecciones vivas de las combinadas que tienen una selección en el partido dado.
+COMBO_LEG_MATCHES_SQL = """
+    SELECT DISTINCT l.match_id FROM bets l
+    WHERE l.combo_bet_id IN (SELECT combo_bet_id FROM bets WHERE match_id = ? AND combo_bet_id IS NOT NULL)
+    AND l.status = 'ACTIVE'
+"""
+
+def add_bets(db, bets):
+    """Suma apuestas simples `(match_id, bet_type, stake, potential_payout)` a la exposición. No hace commit."""
+    db.executemany(ADD_SQL, [(match_id, bet_type, 1, stake, payout, 0, 0, 0) for match_id, bet_type, stake, payout in bets])
+
+def add_bet(db, match_id, bet_type, stake, potential_payout):
+    add_bets(db, [(match_id, bet_type, stake, potential_payout)])
+
+def add_combos(db, combos):
+    """
+    Suma combinadas `(selecciones, stake, potential_payout)` a la exposición de cada
+    selección `(match_id, bet_type)`. No hace commit.
+    """
+    db.executemany(ADD_SQL, [(match_id, bet_type, 0, 0, 0, 1, stake, payout)
+                             for legs, stake, payout in combos for match_id, bet_type in legs])
+
+def add_combo(db, legs, stake, potential_payout):
+    add_combos(db, [(legs, stake, potential_payout)])
+
+def refresh(db, match_ids):
+    """
+    Recalcula desde `bets` la exposición de los partidos dados. Cada partido se
+    agrega por el índice de match_id, así que no recorre la tabla entera.
+    No hace commit.
+    """
+    match_ids = list(set(match_ids))
+    if not match_ids:
+        return
+    placeholders = ', '.join('?' * len(match_ids))
+    db.execute(f"DELETE FROM match_exposure WHERE match_id IN ({placeholders})", match_ids)
+    db.execute(
+        f"INSERT INTO match_exposure ({', '.join(COLUMNS)}) "
+        + AGGREGATE_SQL.format(where=f'AND b.match_id IN ({placeholders})'),
+        match_ids)
+
+def refresh_after_result(db, match_id):
+    """
+    Tras liquidar o cancelar un partido: su exposición desaparece, y las
+    combinadas que tenían una selección en él pueden haber perdido o cambiado de
+    pago, así que se recalculan los partidos de sus otras selecciones.
+    """
+    match_ids = [row[0] for row in db.execute(COMBO_LEG_MATCHES_SQL, (match_id,)).fetchall()]
+    refresh(db, [match_id] + match_ids)
+
+def get_exposure(db):
+    """
+    Exposición de todos los partidos abiertos: {match_id: {'outcomes': {bet_type: fila},
+    'total_stake': ..., 'worst_case': ...}}. `worst_case` es lo máximo que la casa
+    pagaría en simples menos lo ya apostado en simples.
+    """
+    exposure = {}
+    for row in db.execute("SELECT * FROM match_exposure").fetchall():
+        match = exposure.setdefault(row['match_id'], {'outcomes': {}, 'total_stake': 0.0, 'worst_case': 0.0})
+        match['outcomes'][row['bet_type']] = dict(row)
+        match['total_stake'] += row['total_stake']
+    for match in exposure.values():
+        match['worst_case'] = max(row['total_potential_payout'] for row in match['outcomes'].values()) - match['total_stake']
+    return exposure
+
+def find_drift(db, tolerance=1e-6):
+    """Compara `match_exposure` con el agregado completo desde `bets`; devuelve las claves que no cuadran."""
+    stored = {(row['match_id'], row['bet_type']): row for row in db.execute("SELECT * FROM match_exposure").fetchall()}
+    expected = {(row['match_id'], row['bet_type']): row for row in db.execute(AGGREGATE_SQL.format(where='')).fetchall()}
+    drift = []
+    for key in set(stored) | set(expected):
+        a, b = stored.get(key), expected.get(key)
+        if a is None or b is None or any(abs(a[column] - b[column]) > tolerance for column in COLUMNS[2:]):
+            drift.append(key)
+    return sorted(drift)
+
+def rebuild(db):
+    """Reconstruye `match_exposure` entera desde `bets`. No hace commit."""
+    db.execute("DELETE FROM match_exposure")
+    db.execute(f"INSERT INTO match_exposure ({', '.join(COLUMNS)}) " + AGGREGATE_SQL.format(where=''))
+
+@click.command('rebuild-exposure')
+@click.option('--check', is_flag=True, help='Solo informa de las diferencias, sin escribir.')
+def rebuild_exposure_command(check):
+    """Reconcilia match_exposure con un agregado completo de bets."""
+    db = database.get_db()
+    drift = find_drift(db)
+    if check:
+        for match_id, bet_type in drift:
+            click.echo(f'Drift: match {match_id} {bet_type}')
+        click.echo(f'{len(drift)} exposure rows differ from bets.')
+        return
+    with db:
+        rebuild(db)
+    click.echo(f'Rebuilt match exposure ({len(drift)} rows corrected).')
+
+def init_app(app):
+    app.cli.add_command(rebuild_exposure_command)
@@ -0,0 +1,227 @@
+import time
+import click
+import database
+
+# NumPy y SciPy se importan dentro de las funciones: un worker web no los carga
+# hasta el primer ajuste o cálculo de cuotas con este motor.
+
+MAX_GOALS = 10
+INITIAL_HOME_ADVANTAGE = 0.25
+RHO_BOUNDS = (-0.3, 0.3)
+# Penalizaciones: la suma de ataques se fija en 0 (si no, ataque y defensa solo
+# están definidos salvo una constante) y un ridge pequeño estabiliza equipos con pocos partidos.
+SUM_PENALTY = 1.0
+RIDGE = 1e-4
+
+COMPLETED_SQL = "SELECT home_team_id, away_team_id, home_score, away_score FROM matches WHERE status = 'COMPLETED'"
+
+def load_matches(db):
+    """Partidos completados como arrays: índices de equipo, goles y la lista de team_ids."""
+    import numpy as np
+    rows = db.execute(COMPLETED_SQL).fetchall()
+    team_ids = sorted({team_id for row in rows for team_id in (row['home_team_id'], row['away_team_id'])})
+    index = {team_id: i for i, team_id in enumerate(team_ids)}
+    home_goals = np.array([row['home_score'] for row in rows], dtype=float)
+    away_goals = np.array([row['away_score'] for row in rows], dtype=float)
+    return {
+        'team_ids': team_ids,
+        'home': np.array([index[row['home_team_id']] for row in rows], dtype=np.int64),
+        'away': np.array([index[row['away_team_id']] for row in rows], dtype=np.int64),
+        'home_goals': home_goals,
+        'away_goals': away_goals,
+        # Marcadores bajos a los que se aplica la corrección tau de Dixon-Coles.
+        '00': (home_goals == 0) & (away_goals == 0),
+        '01': (home_goals == 0) & (away_goals == 1),
+        '10': (home_goals == 1) & (away_goals == 0),
+        '11': (home_goals == 1) & (away_goals == 1),
+    }
+
+def negative_log_likelihood(x, data):
+    """
+    Log-verosimilitud negativa media de Dixon-Coles y su gradiente analítico.
+    x = [ataques (n), defensas (n), ventaja local, rho]; los goles esperados son
+    exp(ataque_local + defensa_visitante + ventaja) y exp(ataque_visitante + defensa_local).
+    """
+    import numpy as np
+    n = len(data['team_ids'])
+    attack, defence, home_advantage, rho = x[:n], x[n:2 * n], x[2 * n], x[2 * n + 1]
+    home, away, home_goals, away_goals = data['home'], data['away'], data['home_goals'], data['away_goals']
+
+    log_lam = attack[home] + defence[away] + home_advantage
+    log_mu = attack[away] + defence[home]
+    lam, mu = np.exp(log_lam), np.exp(log_mu)
+
+    tau = np.ones_like(lam)
+    dtau_lam = np.zeros_like(lam)
+    dtau_mu = np.zeros_like(lam)
+    dtau_rho = np.zeros_like(lam)
+    m = data['00']
+    tau[m] = 1 - lam[m] * mu[m] * rho
+    dtau_lam[m] = dtau_mu[m] = -lam[m] * mu[m] * rho
+    dtau_rho[m] = -lam[m] * mu[m]
+    m = data['01']
+    tau[m] = 1 + lam[m] * rho
+    dtau_lam[m] = lam[m] * rho
+    dtau_rho[m] = lam[m]
+    m = data['10']
+    tau[m] = 1 + mu[m] * rho
+    dtau_mu[m] = mu[m] * rho
+    dtau_rho[m] = mu[m]
+    m = data['11']
+    tau[m] = 1 - rho
+    dtau_rho[m] = -1
+    tau = np.maximum(tau, 1e-10)
+
+    # Se omiten los log(goles!) porque no dependen de los parámetros.
+    log_likelihood = np.log(tau) + home_goals * log_lam - lam + away_goals * log_mu - mu
+    g_lam = home_goals - lam + dtau_lam / tau
+    g_mu = away_goals - mu + dtau_mu / tau
+
+    size = len(lam)
+    attack_sum = attack.sum()
+    value = -log_likelihood.sum() / size + SUM_PENALTY * attack_sum ** 2 + RIDGE * (attack @ attack + defence @ defence)
+    grad = np.empty_like(x)
+    grad[:n] = -(np.bincount(home, g_lam, n) + np.bincount(away, g_mu, n)) / size + 2 * SUM_PENALTY * attack_sum + 2 * RIDGE * attack
+    grad[n:2 * n] = -(np.bincount(away, g_lam, n) + np.bincount(home, g_mu, n)) / size + 2 * RIDGE * defence
+    grad[2 * n] = -g_lam.sum() / size
+    grad[2 * n + 1] = -(dtau_rho / tau).sum() / size
+    return value, grad
+
+def get_model(db):
+    """Devuelve los parámetros guardados ({'attack', 'defence', 'home_advantage', 'rho', ...}) o None si no hay ajuste."""
+    state = db.execute("SELECT * FROM goal_model_state WHERE id = 1").fetchone()
+    if state is None:
+        return None
+    model = dict(state)
+    model['attack'], model['defence'] = {}, {}
+    for row in db.execute("SELECT team_id, attack, defence FROM goal_model_params").fetchall():
+        model['attack'][row['team_id']] = row['attack']
+        model['defence'][row['team_id']] = row['defence']
+    return model
+
+def store_model(db, model):
+    """Guarda (insert o update) los parámetros ajustados. No hace commit."""
+    db.executemany(
+        "INSERT INTO goal_model_params (team_id, attack, defence) VALUES (?, ?, ?) "
+        "ON CONFLICT(team_id) DO UPDATE SET attack = excluded.attack, defence = excluded.defence",
+        [(team_id, model['attack'][team_id], model['defence'][team_id]) for team_id in model['attack']])
+    db.execute(
+        "INSERT INTO goal_model_state (id, home_advantage, rho, n_matches, log_likelihood, iterations, fitted_at) "
+        "VALUES (1, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP) "
+        "ON CONFLICT(id) DO UPDATE SET home_advantage = excluded.home_advantage, rho = excluded.rho, "
+        "n_matches = excluded.n_matches, log_likelihood = excluded.log_likelihood, "
+        "iterations = excluded.iterations, fitted_at = excluded.fitted_at",
+        (model['home_advantage'], model['rho'], model['n_matches'], model['log_likelihood'], model['iterations']))
+
+def fit(data, previous=None):
+    """
+    Ajusta ataques, defensas, ventaja local y rho con L-BFGS-B.
+    Si se pasa `previous` (un modelo guardado), arranca desde esa solución: tras
+    añadir unos pocos partidos el óptimo apenas se mueve y converge en pocas iteraciones.
+    """
+    import numpy as np
+    from scipy.optimize import minimize
+    team_ids = data['team_ids']
+    n = len(team_ids)
+    x0 = np.zeros(2 * n + 2)
+    x0[2 * n] = INITIAL_HOME_ADVANTAGE
+    if previous is not None:
+        x0[:n] = [previous['attack'].get(team_id, 0.0) for team_id in team_ids]
+        x0[n:2 * n] = [previous['defence'].get(team_id, 0.0) for team_id in team_ids]
+        x0[2 * n], x0[2 * n + 1] = previous['home_advantage'], previous['rho']
+
+    bounds = [(None, None)] * (2 * n + 1) + [RHO_BOUNDS]
+    result = minimize(negative_log_likelihood, x0, args=(data,), jac=True, method='L-BFGS-B', bounds=bounds)
+    x = result.x
+    return {
+        'attack': dict(zip(team_ids, x[:n].tolist())),
+        'defence': dict(zip(team_ids, x[n:2 * n].tolist())),
+        'home_advantage': float(x[2 * n]),
+        'rho': float(x[2 * n + 1]),
+        'n_matches': len(data['home']),
+        'log_likelihood': float(-result.fun * max(len(data['home']), 1)),
+        'iterations': int(result.nit),
+    }
+
+def fit_completed(db, cold=False):
+    """
+    Ajusta el modelo con todos los partidos completados, arrancando desde el
+    ajuste guardado salvo que `cold` sea True, sin guardarlo: solo lee, así que
+    puede ejecutarse fuera de una transacción de escritura.
+    Devuelve el modelo, o None si todavía no hay partidos completados.
+    """
+    data = load_matches(db)
+    if len(data['home']) == 0:
+        return None
+    return fit(data, None if cold else get_model(db))
+
+def refit(db, cold=False):
+    """Como `fit_completed`, y además guarda el modelo. No hace commit."""
+    model = fit_completed(db, cold)
+    if model is not None:
+        store_model(db, model)
+    return model
+
+def score_matrix(lam, mu, rho, max_goals=MAX_GOALS):
+    """
+    Matrices de probabilidad de marcador (n, max_goals + 1, max_goals + 1) para
+    arrays de goles esperados `lam` (local) y `mu` (visitante), con la corrección
+    de Dixon-Coles en 0-0, 0-1, 1-0 y 1-1.
+    """
+    import numpy as np
+    lam, mu = np.atleast_1d(lam).astype(float), np.atleast_1d(mu).astype(float)
+    goals = np.arange(max_goals + 1)
+    log_factorial = np.concatenate([[0.0], np.cumsum(np.log(goals[1:]))])
+    home = np.exp(goals * np.log(lam)[:, None] - lam[:, None] - log_factorial)
+    away = np.exp(goals * np.log(mu)[:, None] - mu[:, None] - log_factorial)
+    matrix = home[:, :, None] * away[:, None, :]
+    matrix[:, 0, 0] *= 1 - lam * mu * rho
+    matrix[:, 0, 1] *= 1 + lam * rho
+    matrix[:, 1, 0] *= 1 + mu * rho
+    matrix[:, 1, 1] *= 1 - rho
+    return matrix
+
+def outcome_probabilities(lam, mu, rho, max_goals=MAX_GOALS):
+    """Probabilidades 1X2 a partir de las matrices de marcador, renormalizadas por el truncamiento."""
+    import numpy as np
+    matrix = score_matrix(lam, mu, rho, max_goals)
+    home_win = np.tril(matrix, -1).sum(axis=(1, 2))
+    draw = np.trace(matrix, axis1=1, axis2=2)
+    away_win = np.triu(matrix, 1).sum(axis=(1, 2))
+    total = home_win + draw + away_win
+    return {'home_win': home_win / total, 'draw': draw / total, 'away_win': away_win / total}
+
+def get_goal_probabilities(db, home_team_ids, away_team_ids):
+    """
+    Probabilidades 1X2 de varios partidos con los parámetros guardados.
+    Un equipo sin partidos en el ajuste cuenta como medio (ataque y defensa 0).
+    Si aún no hay ajuste guardado hace uno en frío, una sola vez.
+    """
+    import numpy as np
+    model = get_model(db) or refit(db, cold=True)
+    if model is None:
+        raise ValueError('No hay partidos completados para ajustar el modelo de goles.')
+    attack, defence = model['attack'], model['defence']
+    home_attack = np.array([attack.get(team_id, 0.0) for team_id in home_team_ids])
+    home_defence = np.array([defence.get(team_id, 0.0) for team_id in home_team_ids])
+    away_attack = np.array([attack.get(team_id, 0.0) for team_id in away_team_ids])
+    away_defence = np.array([defence.get(team_id, 0.0) for team_id in away_team_ids])
+    lam = np.exp(home_attack + away_defence + model['home_advantage'])
+    mu = np.exp(away_attack + home_defence)
+    return outcome_probabilities(lam, mu, model['rho'])
+
+@click.command('fit-goal-model')
+@click.option('--cold', is_flag=True, help='Ajusta desde cero en lugar de desde el ajuste guardado.')
+def fit_goal_model_command(cold):
+    """Reajusta y guarda los parámetros del modelo de goles."""
+    db = database.get_db()
+    started = time.perf_counter()
+    with db:
+        model = refit(db, cold=cold)
+    if model is None:
+        raise click.ClickException('No completed matches to fit.')
+    click.echo(f"Fitted {len(model['attack'])} teams on {model['n_matches']} matches in {model['iterations']} iterations "
+               f"({time.perf_counter() - started:.2f}s): home advantage {model['home_advantage']:.3f}, rho {model['rho']:.3f}.")
+
+def init_app(app):
+    app.cli.add_command(fit_goal_model_command)
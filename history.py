@@ -0,0 +1,92 @@
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+BETS_PAGE_SQL = """
+    SELECT b.*, m.match_datetime, ht.team_name as home_team, at.team_name as away_team
+    FROM {bets} b
+    JOIN matches m ON b.match_id = m.match_id
+    JOIN teams ht ON m.home_team_id = ht.team_id
+    JOIN teams at ON m.away_team_id = at.team_id
+    WHERE b.user_id = ? AND b.combo_bet_id IS NULL {keyset}
+    ORDER BY b.created_at DESC, b.bet_id DESC
+    LIMIT ?
+"""
+
+COMBO_BETS_PAGE_SQL = """
+    SELECT combo_bet_id, total_wager, potential_payout, status, created_at
+    FROM {combo_bets}
+    WHERE user_id = ? {keyset}
+    ORDER BY created_at DESC, combo_bet_id DESC
+    LIMIT ?
+"""
+
+COMBO_SELECTIONS_SQL = """
+    SELECT b.*, m.match_datetime, ht.team_name as home_team, at.team_name as away_team
+    FROM {bets} b
+    JOIN matches m ON b.match_id = m.match_id
+    JOIN teams ht ON m.home_team_id = ht.team_id
+    JOIN teams at ON m.away_team_id = at.team_id
+    WHERE b.combo_bet_id IN ({placeholders})
+    ORDER BY b.combo_bet_id, m.match_datetime ASC
+"""
+
+def _tables(archived):
+    """Con `archived` las consultas leen de la base de archivo adjunta (ver `archive.attach`)."""
+    prefix = 'archive.' if archived else ''
+    return {'bets': f'{prefix}bets', 'combo_bets': f'{prefix}combo_bets'}
+
+def encode_cursor(created_at, row_id):
+    return f'{created_at}|{row_id}'
+
+def decode_cursor(cursor):
+    """Devuelve (created_at, id) o (None, None) para la primera página. Lanza ValueError si es inválido."""
+    if not cursor:
+        return None, None
+    created_at, row_id = cursor.rsplit('|', 1)
+    return created_at, int(row_id)
+
+def parse_limit(value):
+    """Tamaño de página pedido, acotado a 1..MAX_PAGE_SIZE (PAGE_SIZE si no se da). Lanza ValueError si no es un entero."""
+    if value is None:
+        return PAGE_SIZE
+    return max(1, min(int(value), MAX_PAGE_SIZE))
+
+def _keyset_query(db, sql, columns, user_id, cursor, limit, archived):
+    """Ejecuta `sql` desde `cursor` en adelante; el filtro por (created_at, id) usa el índice por usuario."""
+    created_at, row_id = decode_cursor(cursor)
+    # Se pide una fila de más para saber si hay página siguiente.
+    if created_at is None:
+        return db.execute(sql.format(keyset='', **_tables(archived)), (user_id, limit + 1)).fetchall()
+    keyset = f'AND ({columns}) < (?, ?)'
+    return db.execute(sql.format(keyset=keyset, **_tables(archived)), (user_id, created_at, row_id, limit + 1)).fetchall()
+
+def _page(rows, limit, id_column):
+    items = [dict(row) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = items[-1]
+        next_cursor = encode_cursor(last['created_at'], last[id_column])
+    return items, next_cursor
+
+def get_bets_page(db, user_id, cursor=None, limit=PAGE_SIZE, archived=False):
+    """Página de apuestas simples, de la más reciente a la más antigua. Devuelve (apuestas, siguiente cursor)."""
+    rows = _keyset_query(db, BETS_PAGE_SQL, 'b.created_at, b.bet_id', user_id, cursor, limit, archived)
+    return _page(rows, limit, 'bet_id')
+
+def attach_selections(db, combos, archived=False):
+    """Carga las selecciones de todas las combinadas dadas con una sola consulta."""
+    for combo in combos:
+        combo['selections'] = []
+    if not combos:
+        return combos
+    by_id = {combo['combo_bet_id']: combo for combo in combos}
+    placeholders = ', '.join('?' * len(by_id))
+    for row in db.execute(COMBO_SELECTIONS_SQL.format(placeholders=placeholders, **_tables(archived)), list(by_id)).fetchall():
+        by_id[row['combo_bet_id']]['selections'].append(dict(row))
+    return combos
+
+def get_combo_bets_page(db, user_id, cursor=None, limit=PAGE_SIZE, archived=False):
+    """Página de combinadas con sus selecciones. Devuelve (combinadas, siguiente cursor)."""
+    rows = _keyset_query(db, COMBO_BETS_PAGE_SQL, 'created_at, combo_bet_id', user_id, cursor, limit, archived)
+    combos, next_cursor = _page(rows, limit, 'combo_bet_id')
+    return attach_selections(db, combos, archived), next_cursor
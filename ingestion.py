@@ -0,0 +1,212 @@
+import csv
+import io
+import math
+import os
+import time
+from datetime import datetime
+import odds_calculator
+
+CHUNK_SIZE = 5000
+# 'csv' usa solo la biblioteca estándar; 'pandas' se importa al usarlo por primera vez.
+READERS = ('csv', 'pandas')
+REQUIRED_COLUMNS = ['home_team_id', 'away_team_id', 'match_datetime', 'home_score', 'away_score']
+# Formato de `matches.match_datetime`: las fechas se comparan y ordenan como texto
+# (repetición del Elo, ratings a una fecha, archivo), así que todas deben ir igual.
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+INSERT_SKIP_SQL = """
+    INSERT INTO matches (home_team_id, away_team_id, match_datetime, home_score, away_score, status)
+    VALUES (?, ?, ?, ?, ?, 'COMPLETED')
+    ON CONFLICT (home_team_id, away_team_id, match_datetime) DO NOTHING
+"""
+
+# Solo se corrigen resultados ya completados: un partido programado con apuestas
+# abiertas tiene que pasar por la liquidación, no por el CSV.
+INSERT_UPSERT_SQL = """
+    INSERT INTO matches (home_team_id, away_team_id, match_datetime, home_score, away_score, status)
+    VALUES (?, ?, ?, ?, ?, 'COMPLETED')
+    ON CONFLICT (home_team_id, away_team_id, match_datetime) DO UPDATE
+    SET home_score = excluded.home_score, away_score = excluded.away_score
+    WHERE matches.status = 'COMPLETED'
+"""
+
+def normalize_match_datetime(value):
+    """
+    Lleva una fecha ISO ('2024-05-01', '2024-05-01T18:30' del formulario,
+    '2024-05-01 18:30:00'...) a DATETIME_FORMAT. Lanza ValueError si no es una fecha.
+    """
+    try:
+        return datetime.fromisoformat(value.strip()).strftime(DATETIME_FORMAT)
+    except (AttributeError, ValueError):
+        raise ValueError(f'Fecha no válida: {value}')
+
+def _normalize_or_none(value):
+    try:
+        return normalize_match_datetime(value)
+    except ValueError:
+        return None
+
+def _check_columns(columns):
+    missing = [column for column in REQUIRED_COLUMNS if column not in columns]
+    if missing:
+        raise ValueError(f"Faltan columnas en el CSV: {', '.join(missing)}")
+
+def _clean_chunk(chunk):
+    """Normaliza un bloque leído con pandas y separa las filas válidas de las rechazadas."""
+    import pandas as pd
+    _check_columns(chunk.columns)
+
+    chunk = chunk[REQUIRED_COLUMNS].copy()
+    for column in ('home_team_id', 'away_team_id'):
+        chunk[column] = chunk[column].str.strip()
+    chunk['match_datetime'] = chunk['match_datetime'].map(_normalize_or_none, na_action='ignore')
+    for column in ('home_score', 'away_score'):
+        chunk[column] = pd.to_numeric(chunk[column], errors='coerce')
+
+    valid = chunk.notna().all(axis=1) & (chunk['home_team_id'] != chunk['away_team_id'])
+    valid &= (chunk['home_score'] >= 0) & (chunk['away_score'] >= 0)
+    valid &= (chunk['home_score'] % 1 == 0) & (chunk['away_score'] % 1 == 0)
+    return chunk[valid], int((~valid).sum())
+
+def _pandas_chunks(file, chunksize):
+    """Bloques (filas leídas, filas válidas, filas rechazadas) leídos con pandas."""
+    import pandas as pd
+    try:
+        for chunk in pd.read_csv(file, chunksize=chunksize, dtype=str, skipinitialspace=True):
+            rows = len(chunk)
+            chunk, rejected = _clean_chunk(chunk)
+            yield rows, list(chunk.itertuples(index=False, name=None)), rejected
+    except pd.errors.EmptyDataError:
+        return
+
+def _clean_row(row, positions):
+    """
+    La fila normalizada, o None si le falta un campo, los equipos coinciden,
+    la fecha no es válida o un marcador no es un entero >= 0.
+    """
+    try:
+        home, away, match_datetime, home_score, away_score = [row[i].strip() for i in positions]
+        home_score, away_score = float(home_score), float(away_score)
+    except (IndexError, ValueError):
+        return None
+    match_datetime = _normalize_or_none(match_datetime)
+    if not home or not away or match_datetime is None or home == away:
+        return None
+    for score in (home_score, away_score):
+        if not math.isfinite(score) or score < 0 or score % 1 != 0:
+            return None
+    return home, away, match_datetime, home_score, away_score
+
+def _open_text(file):
+    """Devuelve (stream de texto, función para soltarlo) para una ruta o un fichero de texto o binario."""
+    if isinstance(file, (str, os.PathLike)):
+        stream = open(file, newline='', encoding='utf-8-sig')
+        return stream, stream.close
+    if isinstance(file, io.TextIOBase):
+        return file, lambda: None
+    # `detach` evita que el wrapper cierre el fichero subido al liberarse.
+    stream = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+    return stream, stream.detach
+
+def _csv_chunks(file, chunksize):
+    """Los mismos bloques que `_pandas_chunks`, con el módulo `csv` de la biblioteca estándar."""
+    stream, release = _open_text(file)
+    try:
+        reader = csv.reader(stream, skipinitialspace=True)
+        header = next((row for row in reader if row), None)
+        if header is None:
+            return
+        _check_columns(header)
+        positions = [header.index(column) for column in REQUIRED_COLUMNS]
+        rows, valid = 0, []
+        for row in reader:
+            if not row:
+                continue
+            rows += 1
+            cleaned = _clean_row(row, positions)
+            if cleaned is not None:
+                valid.append(cleaned)
+            if rows == chunksize:
+                yield rows, valid, rows - len(valid)
+                rows, valid = 0, []
+        if rows:
+            yield rows, valid, rows - len(valid)
+    finally:
+        release()
+
+def _resolve_teams(db, names, team_mapping):
+    """Crea los equipos nuevos y completa `team_mapping` con una sola consulta por bloque."""
+    unknown = [name for name in set(names) if name not in team_mapping]
+    if not unknown:
+        return
+    db.executemany("INSERT OR IGNORE INTO teams (team_name) VALUES (?)", [(name,) for name in unknown])
+    placeholders = ', '.join('?' * len(unknown))
+    for row in db.execute(f"SELECT team_id, team_name FROM teams WHERE team_name IN ({placeholders})", unknown):
+        team_mapping[row['team_name']] = row['team_id']
+
+def ingest_results(db, file, chunksize=CHUNK_SIZE, on_duplicate='skip', reader='csv', progress=None):
+    """
+    Carga resultados históricos desde un CSV por bloques de `chunksize` filas.
+
+    Cada bloque se escribe en su propia transacción con `executemany`, de modo que
+    el lock de escritura se libera entre bloques y la memoria queda acotada.
+    Las filas duplicadas (restricción `uq_match`) se omiten o, con
+    `on_duplicate='update'`, corrigen el marcador del partido ya completado.
+    `reader` elige cómo se lee el CSV ('csv' o 'pandas'); ambos validan igual.
+    En las estadísticas, `rejected` cuenta las filas que no pasan la validación y
+    `skipped` las duplicadas que no se escribieron: todas con 'skip' y, con 'update',
+    las de partidos que no están completados.
+    Si se da `progress`, se llama con las estadísticas acumuladas tras cada bloque.
+    Devuelve un diccionario con las estadísticas de la carga.
+    """
+    if on_duplicate not in ('skip', 'update'):
+        raise ValueError(f"on_duplicate no válido: {on_duplicate}")
+    if reader not in READERS:
+        raise ValueError(f"reader no válido: {reader}")
+    insert_sql = INSERT_UPSERT_SQL if on_duplicate == 'update' else INSERT_SKIP_SQL
+    chunks = _pandas_chunks if reader == 'pandas' else _csv_chunks
+
+    stats = {'rows': 0, 'inserted': 0, 'updated': 0, 'skipped': 0, 'rejected': 0, 'seconds': 0.0, 'rows_per_sec': 0.0}
+    team_mapping = {}
+    started = time.perf_counter()
+
+    for n_rows, valid, rejected in chunks(file, chunksize):
+        stats['rows'] += n_rows
+        stats['rejected'] += rejected
+        if not valid:
+            continue
+        valid.sort(key=lambda row: row[2])
+
+        with db:
+            _resolve_teams(db, [team for row in valid for team in row[:2]], team_mapping)
+            rows = [
+                (team_mapping[home], team_mapping[away], match_datetime, int(home_score), int(away_score))
+                for home, away, match_datetime, home_score, away_score in valid
+            ]
+            last_match_id = db.execute("SELECT COALESCE(MAX(match_id), 0) FROM matches").fetchone()[0]
+            changes_before = db.total_changes
+            db.executemany(insert_sql, rows)
+            changed = db.total_changes - changes_before
+
+            new_results = db.execute(
+                "SELECT match_datetime, match_id FROM matches WHERE match_id > ? ORDER BY match_datetime ASC, match_id ASC",
+                (last_match_id,)
+            ).fetchall()
+            # Los ratings se repiten desde el partido más antiguo afectado: el primero
+            # nuevo o, si se corrigió algún marcador, el primero del bloque.
+            points = [tuple(new_results[0])] if new_results else []
+            if changed > len(new_results):
+                points.append((rows[0][2], 0))
+            if points:
+                odds_calculator.apply_results_from(db, *min(points))
+
+        stats['inserted'] += len(new_results)
+        stats['updated'] += changed - len(new_results)
+        stats['skipped'] += len(rows) - changed
+        if progress is not None:
+            progress(stats)
+
+    stats['seconds'] = time.perf_counter() - started
+    if stats['seconds'] > 0:
+        stats['rows_per_sec'] = stats['rows'] / stats['seconds']
+    return stats
@@ -0,0 +1,336 @@
+import hashlib
+import json
+import logging
+import os
+import signal
+import socket
+import tempfile
+import time
+import click
+from flask import current_app
+import board_cache
+import database
+import events
+import goal_model
+import ingestion
+import odds_calculator
+import settlement
+
+DEFAULT_CONFIG = {
+    # Segundos entre consultas a la cola cuando no hay trabajos.
+    'JOBS_POLL_INTERVAL': 1.0,
+    # Un trabajo RUNNING cuyo worker no da señales en este tiempo (murió o se
+    # reinició) vuelve a la cola. Los trabajos son idempotentes: repetirlos es seguro.
+    'JOBS_LEASE_SECONDS': 900,
+    'JOBS_MAX_ATTEMPTS': 3,
+    # Ejecutar el trabajo en la misma petición que lo encola, sin `run-worker`
+    # (desarrollo y tests).
+    'JOBS_RUN_INLINE': False,
+}
+
+RECENT_JOBS = 20
+LABELS = {
+    'add_match': 'Programar partido',
+    'settle_match': 'Liquidar partido',
+    'cancel_match': 'Cancelar partido',
+    'ingest_results': 'Cargar resultados',
+    'reprice': 'Recalcular cuotas',
+}
+STATUS_LABELS = {'QUEUED': 'en cola', 'RUNNING': 'en curso', 'DONE': 'terminado', 'FAILED': 'fallido'}
+
+logger = logging.getLogger('apuestas.jobs')
+
+ENQUEUE_SQL = """
+    INSERT INTO jobs (kind, payload, dedupe_key, lock_key, created_by) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (dedupe_key) WHERE status != 'FAILED' DO NOTHING
+"""
+
+# Los trabajos cuyo worker dejó de renovar la concesión vuelven a la cola, o
+# fallan si ya agotaron los intentos.
+REQUEUE_STALE_SQL = """
+    UPDATE jobs
+    SET status = CASE WHEN attempts >= ? THEN 'FAILED' ELSE 'QUEUED' END,
+        error = CASE WHEN attempts >= ? THEN 'El worker dejó de responder.' ELSE error END,
+        finished_at = CASE WHEN attempts >= ? THEN CURRENT_TIMESTAMP END,
+        lease_until = NULL
+    WHERE status = 'RUNNING' AND lease_until < datetime('now')
+"""
+
+# Reclama el trabajo en cola más antiguo cuyo `lock_key` no tenga otro trabajo
+# en curso ni otro anterior todavía en cola: así dos liquidaciones del mismo
+# partido nunca corren a la vez y se ejecutan en el orden en que se pidieron.
+CLAIM_SQL = """
+    UPDATE jobs
+    SET status = 'RUNNING', attempts = attempts + 1, worker = ?, lease_until = datetime('now', ?),
+        started_at = CURRENT_TIMESTAMP, finished_at = NULL, progress = NULL, error = NULL
+    WHERE job_id = (
+        SELECT j.job_id FROM jobs j
+        WHERE j.status = 'QUEUED' {only}
+          AND (j.lock_key IS NULL OR NOT EXISTS (
+              SELECT 1 FROM jobs other
+              WHERE other.lock_key = j.lock_key
+                AND (other.status = 'RUNNING' OR (other.status = 'QUEUED' AND other.job_id < j.job_id))))
+        ORDER BY j.job_id
+        LIMIT 1
+    )
+    RETURNING *
+"""
+
+# `attempts` hace de testigo: si la concesión caducó y otro worker reclamó el
+# trabajo, el worker anterior ya no puede cerrarlo.
+OWNED = "job_id = ? AND status = 'RUNNING' AND attempts = ?"
+
+class LeaseLost(Exception):
+    """El trabajo ya no pertenece a este worker (su concesión caducó)."""
+
+def _job(row):
+    job = dict(row)
+    for name in ('payload', 'progress', 'result'):
+        if job[name] is not None:
+            job[name] = json.loads(job[name])
+    return job
+
+def get_job(db, job_id):
+    row = db.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+    return _job(row) if row else None
+
+def recent_jobs(db, limit=RECENT_JOBS):
+    """Los últimos trabajos encolados, del más reciente al más antiguo."""
+    # Los ids son consecutivos: el rango por clave primaria evita recorrer la tabla.
+    rows = db.execute("SELECT * FROM jobs WHERE job_id > (SELECT COALESCE(MAX(job_id), 0) FROM jobs) - ? ORDER BY job_id DESC",
+                      (limit,)).fetchall()
+    return [_job(row) for row in rows]
+
+def enqueue(db, kind, payload, dedupe_key=None, lock_key=None, user_id=None):
+    """
+    Encola un trabajo y devuelve (trabajo, creado). Si ya hay uno con la misma
+    `dedupe_key` que no haya fallado, devuelve ese y `creado` es False.
+    No hace commit: se ejecuta dentro de la transacción del llamador.
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f'Tipo de trabajo desconocido: {kind}')
+    cursor = db.execute(ENQUEUE_SQL, (kind, json.dumps(payload), dedupe_key, lock_key, user_id))
+    if cursor.rowcount:
+        return get_job(db, cursor.lastrowid), True
+    row = db.execute("SELECT * FROM jobs WHERE dedupe_key = ? AND status != 'FAILED'", (dedupe_key,)).fetchone()
+    return _job(row), False
+
+def claim(db, worker, job_id=None):
+    """Reclama el siguiente trabajo ejecutable (o `job_id`, si se puede ya) y lo devuelve, o None."""
+    config = current_app.config
+    max_attempts = config['JOBS_MAX_ATTEMPTS']
+    with db:
+        db.execute(REQUEUE_STALE_SQL, (max_attempts, max_attempts, max_attempts))
+        sql = CLAIM_SQL.format(only='AND j.job_id = ?' if job_id is not None else '')
+        params = (worker, f"+{config['JOBS_LEASE_SECONDS']} seconds") + ((job_id,) if job_id is not None else ())
+        row = db.execute(sql, params).fetchone()
+        if row is not None:
+            events.publish_job(db, row['job_id'])
+    return _job(row) if row else None
+
+def report_progress(db, job, progress):
+    """Guarda el progreso (y renueva la concesión) en su propia transacción."""
+    with db:
+        cursor = db.execute(f"UPDATE jobs SET progress = ?, lease_until = datetime('now', ?) WHERE {OWNED}",
+                            (json.dumps(progress), f"+{current_app.config['JOBS_LEASE_SECONDS']} seconds",
+                             job['job_id'], job['attempts']))
+        if not cursor.rowcount:
+            raise LeaseLost(job['job_id'])
+        events.publish_job(db, job['job_id'])
+
+def finish(db, job, result):
+    """
+    Marca el trabajo como terminado. No hace commit: los manejadores lo llaman
+    dentro de la transacción de su trabajo, de modo que el trabajo y su cierre
+    se confirman juntos y un reintento nunca repite algo ya hecho.
+    """
+    cursor = db.execute(f"UPDATE jobs SET status = 'DONE', result = ?, finished_at = CURRENT_TIMESTAMP, lease_until = NULL WHERE {OWNED}",
+                        (json.dumps(result), job['job_id'], job['attempts']))
+    if not cursor.rowcount:
+        raise LeaseLost(job['job_id'])
+    events.publish_job(db, job['job_id'])
+
+def _fail(db, job, error, retry):
+    status = 'QUEUED' if retry else 'FAILED'
+    db.execute(f"UPDATE jobs SET status = ?, error = ?, finished_at = CASE WHEN ? THEN NULL ELSE CURRENT_TIMESTAMP END, "
+               f"lease_until = NULL WHERE {OWNED}", (status, error, retry, job['job_id'], job['attempts']))
+    events.publish_job(db, job['job_id'])
+
+# Los recálculos de cuotas se ejecutan de uno en uno (ver `_enqueue_reprice`).
+REPRICE_LOCK = 'reprice'
+
+def _enqueue_reprice(db, job):
+    """
+    Tras registrar resultados: encola el recálculo de cuotas como trabajo aparte,
+    para que el ajuste del modelo no alargue la transacción de los resultados.
+    Si ya hay uno en cola se reutiliza: aún no ha leído nada y verá también
+    estos resultados. No hace commit. Devuelve el job_id del recálculo.
+    """
+    queued = db.execute("SELECT job_id FROM jobs WHERE lock_key = ? AND status = 'QUEUED'", (REPRICE_LOCK,)).fetchone()
+    if queued is not None:
+        return queued['job_id']
+    reprice, _ = enqueue(db, 'reprice', {}, f"reprice:{job['job_id']}", REPRICE_LOCK, job['created_by'])
+    return reprice['job_id']
+
+def _run_follow_up(db, job_id):
+    """Con JOBS_RUN_INLINE, el trabajo encolado por otro se ejecuta también aquí, tras su commit."""
+    if current_app.config['JOBS_RUN_INLINE']:
+        run_now(db, job_id)
+
+def _reprice(db, job):
+    engine = current_app.config['ODDS_ENGINE']
+    model = None
+    if engine == 'goals':
+        # El ajuste (SciPy) solo lee: corre fuera de la transacción y sin el lock
+        # de escritura. Arranca desde el ajuste guardado: unas pocas iteraciones.
+        model = goal_model.fit_completed(db)
+    with db:
+        if model is not None:
+            goal_model.store_model(db, model)
+        repriced = odds_calculator.reprice_scheduled_matches(db, engine=engine)
+        board_cache.bump_version(db)
+        finish(db, job, {'repriced': repriced})
+
+def _add_match(db, job):
+    payload = job['payload']
+    with db:
+        match_id = db.execute("INSERT INTO matches (home_team_id, away_team_id, match_datetime) VALUES (?, ?, ?)",
+                              (payload['home_team_id'], payload['away_team_id'],
+                               ingestion.normalize_match_datetime(payload['match_datetime']))).lastrowid
+        odds_calculator.generate_and_store_odds(db, match_id, payload['home_team_id'], payload['away_team_id'],
+                                                engine=current_app.config['ODDS_ENGINE'])
+        board_cache.bump_version(db)
+        finish(db, job, {'match_id': match_id})
+
+def _settle_match(db, job):
+    payload = job['payload']
+    with db:
+        stats = settlement.settle_match(db, payload['match_id'], payload['home_score'], payload['away_score'])
+        reprice_id = _enqueue_reprice(db, job)
+        board_cache.bump_version(db)
+        finish(db, job, stats)
+    _run_follow_up(db, reprice_id)
+
+def _cancel_match(db, job):
+    payload = job['payload']
+    with db:
+        stats = settlement.cancel_match(db, payload['match_id'])
+        board_cache.bump_version(db)
+        finish(db, job, stats)
+
+def _ingest_results(db, job):
+    # Cada bloque se confirma por separado; repetir la carga tras un corte es
+    # seguro porque los duplicados se omiten (o se vuelven a corregir igual).
+    payload = job['payload']
+    try:
+        stats = ingestion.ingest_results(db, payload['path'], on_duplicate=payload['on_duplicate'],
+                                         progress=lambda stats: report_progress(db, job, stats))
+        if stats['rows'] == 0:
+            raise ValueError('El archivo CSV está vacío.')
+    except ValueError:
+        # El archivo no es válido: reintentarlo no sirve de nada.
+        os.remove(payload['path'])
+        raise
+    with db:
+        reprice_id = _enqueue_reprice(db, job)
+        board_cache.bump_version(db)
+        finish(db, job, stats)
+    os.remove(payload['path'])
+    _run_follow_up(db, reprice_id)
+
+HANDLERS = {
+    'add_match': _add_match,
+    'settle_match': _settle_match,
+    'cancel_match': _cancel_match,
+    'ingest_results': _ingest_results,
+    'reprice': _reprice,
+}
+
+def run_job(db, job):
+    """
+    Ejecuta un trabajo ya reclamado y devuelve su estado final. Un ValueError
+    (datos no válidos, partido ya liquidado) lo marca como fallido; cualquier
+    otro error lo devuelve a la cola hasta agotar JOBS_MAX_ATTEMPTS.
+    """
+    try:
+        HANDLERS[job['kind']](db, job)
+    except LeaseLost:
+        logger.warning('El trabajo %s se reasignó a otro worker', job['job_id'])
+    except Exception as e:
+        if db.in_transaction:
+            db.rollback()
+        retry = not isinstance(e, ValueError) and job['attempts'] < current_app.config['JOBS_MAX_ATTEMPTS']
+        if not isinstance(e, ValueError):
+            logger.exception('Error en el trabajo %s (%s)', job['job_id'], job['kind'])
+        with db:
+            _fail(db, job, str(e), retry)
+    return get_job(db, job['job_id'])
+
+def run_now(db, job_id):
+    """Ejecuta `job_id` en este proceso si se puede reclamar ya (JOBS_RUN_INLINE)."""
+    job = claim(db, worker_name(), job_id)
+    if job is None:
+        return get_job(db, job_id)
+    return run_job(db, job)
+
+def save_upload(stream, folder, on_duplicate):
+    """
+    Guarda un CSV subido en `folder` con un nombre derivado de su contenido y
+    devuelve la ruta: la misma subida repetida da la misma ruta y la misma `dedupe_key`.
+    """
+    os.makedirs(folder, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, partial = tempfile.mkstemp(dir=folder, suffix='.part')
+    with os.fdopen(fd, 'wb') as out:
+        for chunk in iter(lambda: stream.read(1 << 16), b''):
+            digest.update(chunk)
+            out.write(chunk)
+    path = os.path.join(folder, f'{digest.hexdigest()}-{on_duplicate}.csv')
+    os.replace(partial, path)
+    return path
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+def _stop(signum, frame):
+    raise KeyboardInterrupt
+
+@click.command('run-worker')
+@click.option('--once', is_flag=True, help='Procesa los trabajos pendientes y termina.')
+@click.option('--poll-interval', type=float, default=None, help='Segundos entre consultas (por defecto JOBS_POLL_INTERVAL).')
+def run_worker_command(once, poll_interval):
+    """Ejecuta los trabajos en segundo plano de la cola."""
+    db = database.get_db()
+    worker = worker_name()
+    poll_interval = poll_interval or current_app.config['JOBS_POLL_INTERVAL']
+    # SIGTERM (reinicio del proceso) se trata como Ctrl+C: el trabajo en curso vuelve a la cola.
+    signal.signal(signal.SIGTERM, _stop)
+    click.echo(f'Worker {worker} processing jobs (poll every {poll_interval}s).')
+    job = None
+    try:
+        while True:
+            job = claim(db, worker)
+            if job is None:
+                if once:
+                    break
+                time.sleep(poll_interval)
+                continue
+            started = time.perf_counter()
+            job = run_job(db, job)
+            click.echo(f"Job {job['job_id']} {job['kind']}: {job['status']} ({time.perf_counter() - started:.2f}s)"
+                       + (f" - {job['error']}" if job['error'] else ''))
+            job = None
+    except KeyboardInterrupt:
+        if db.in_transaction:
+            db.rollback()
+        if job is not None:
+            with db:
+                _fail(db, job, 'Worker detenido; el trabajo vuelve a la cola.', retry=True)
+        click.echo(f'Worker {worker} stopped.')
+
+def init_app(app):
+    for name, value in DEFAULT_CONFIG.items():
+        app.config.setdefault(name, value)
+    # Los CSV subidos esperan aquí a que el worker los procese.
+    app.config.setdefault('JOBS_UPLOAD_FOLDER', os.path.join(app.instance_path, 'uploads'))
+    app.cli.add_command(run_worker_command)
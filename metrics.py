@@ -0,0 +1,206 @@
+import bisect
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from flask import g, has_app_context, has_request_context, request
+
+# Cotas superiores (segundos) de los histogramas, como en Prometheus.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+SLOW_QUERY_LOG_SIZE = 50
+
+slow_query_logger = logging.getLogger('apuestas.slow_query')
+
+# Métricas de este worker. Cada proceso de gunicorn tiene las suyas: el endpoint
+# de Prometheus las etiqueta con el pid para que el servidor las sume.
+_lock = threading.Lock()
+_statements = {}
+_endpoints = {}
+_lock_wait = {'statements': 0, 'seconds': 0.0, 'errors': 0, 'buckets': [0] * (len(BUCKETS) + 1)}
+_slow_queries = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+
+@lru_cache(maxsize=1024)
+def normalize_sql(sql):
+    """Une espacios y colapsa las listas `IN (?, ?, ...)` para agrupar la misma consulta."""
+    sql = ' '.join(sql.split())
+    return re.sub(r'\(\?(?:, ?\?)+\)', '(?, ...)', sql)
+
+def _observe(buckets, seconds):
+    buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+
+def _record_statement(sql, seconds, opens_write, locked):
+    key = normalize_sql(sql)
+    with _lock:
+        stats = _statements.get(key)
+        if stats is None:
+            stats = _statements[key] = {'count': 0, 'seconds': 0.0, 'max': 0.0}
+        stats['count'] += 1
+        stats['seconds'] += seconds
+        stats['max'] = max(stats['max'], seconds)
+        if opens_write or locked:
+            _lock_wait['statements'] += 1
+            _lock_wait['seconds'] += seconds
+            _lock_wait['errors'] += locked
+            _observe(_lock_wait['buckets'], seconds)
+    if has_app_context():
+        current = g.get('_metrics')
+        if current is not None:
+            current['sql_count'] += 1
+            current['sql_seconds'] += seconds
+
+class InstrumentedConnection(sqlite3.Connection):
+    """
+    Conexión que cuenta y cronometra cada `execute`/`executemany`/`executescript`
+    (en un SELECT se mide hasta la primera fila, no el fetch).
+
+    SQLite no expone cuánto espera por un lock. Como aproximación, la sentencia de
+    escritura que abre la transacción es la que espera el lock de escritura hasta
+    `busy_timeout`, así que su tiempo cuenta como espera por lock, igual que las
+    sentencias que terminan en "database is locked".
+    """
+    slow_query_ms = None
+
+    def _timed(self, method, sql, parameters, explain_parameters):
+        opens_write = not self.in_transaction and sql.lstrip()[:7].upper().startswith(WRITE_STATEMENTS)
+        locked = False
+        started = time.perf_counter()
+        try:
+            return method(sql, parameters) if parameters is not None else method(sql)
+        except sqlite3.OperationalError as e:
+            locked = 'locked' in str(e)
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            _record_statement(sql, seconds, opens_write, locked)
+            if self.slow_query_ms is not None and seconds * 1000 >= self.slow_query_ms:
+                self._log_slow_query(sql, explain_parameters, seconds)
+
+    def execute(self, sql, parameters=()):
+        return self._timed(super().execute, sql, parameters, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        seq_of_parameters = list(seq_of_parameters)
+        return self._timed(super().executemany, sql, seq_of_parameters, seq_of_parameters[0] if seq_of_parameters else None)
+
+    def executescript(self, sql_script):
+        return self._timed(super().executescript, sql_script, None, None)
+
+    def _log_slow_query(self, sql, parameters, seconds):
+        plan = []
+        if parameters is not None:
+            try:
+                plan = [row[3] for row in super().execute('EXPLAIN QUERY PLAN ' + sql, parameters).fetchall()]
+            except sqlite3.Error:
+                pass
+        entry = {'sql': normalize_sql(sql), 'ms': round(seconds * 1000, 2), 'plan': plan,
+                 'endpoint': request.endpoint if has_request_context() else None, 'at': time.time()}
+        with _lock:
+            _slow_queries.append(entry)
+        slow_query_logger.warning('Consulta lenta (%.1f ms) en %s: %s\n    %s', entry['ms'], entry['endpoint'], entry['sql'], '\n    '.join(plan))
+
+def _before_request():
+    g._metrics = {'endpoint': request.endpoint or 'unmatched', 'started': time.perf_counter(), 'sql_count': 0, 'sql_seconds': 0.0}
+
+def _teardown(exc=None):
+    current = g.pop('_metrics', None)
+    if current is None:
+        return
+    seconds = time.perf_counter() - current['started']
+    with _lock:
+        stats = _endpoints.get(current['endpoint'])
+        if stats is None:
+            stats = _endpoints[current['endpoint']] = {'count': 0, 'seconds': 0.0, 'sql_count': 0, 'sql_seconds': 0.0,
+                                                       'buckets': [0] * (len(BUCKETS) + 1)}
+        stats['count'] += 1
+        stats['seconds'] += seconds
+        stats['sql_count'] += current['sql_count']
+        stats['sql_seconds'] += current['sql_seconds']
+        _observe(stats['buckets'], seconds)
+
+def _quantile(buckets, count, fraction):
+    """Cota superior del bucket que contiene el cuantil (None si cae en +Inf)."""
+    seen = 0
+    for bound, n in zip(BUCKETS + (None,), buckets):
+        seen += n
+        if seen >= fraction * count:
+            return bound
+    return None
+
+def snapshot(top=25):
+    """Copia de las métricas de este worker lista para la plantilla."""
+    with _lock:
+        endpoints = [
+            {'endpoint': name, 'count': s['count'], 'mean_ms': 1000 * s['seconds'] / s['count'],
+             'p50_ms': _ms(_quantile(s['buckets'], s['count'], 0.5)), 'p95_ms': _ms(_quantile(s['buckets'], s['count'], 0.95)),
+             'sql_per_request': s['sql_count'] / s['count'], 'sql_ms_per_request': 1000 * s['sql_seconds'] / s['count']}
+            for name, s in _endpoints.items()
+        ]
+        statements = sorted(({'sql': sql, **s} for sql, s in _statements.items()), key=lambda s: s['seconds'], reverse=True)[:top]
+        lock_wait = {name: _lock_wait[name] for name in ('statements', 'seconds', 'errors')}
+        lock_wait['p95_ms'] = _ms(_quantile(_lock_wait['buckets'], _lock_wait['statements'], 0.95))
+        slow_queries = list(reversed(_slow_queries))
+    return {'pid': os.getpid(), 'endpoints': sorted(endpoints, key=lambda e: e['count'], reverse=True),
+            'statements': statements, 'lock_wait': lock_wait, 'slow_queries': slow_queries}
+
+def _ms(seconds):
+    return None if seconds is None else seconds * 1000
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+def render_prometheus():
+    """Métricas de este worker en el formato de texto de Prometheus."""
+    pid = os.getpid()
+    lines = []
+
+    def histogram(name, labels, buckets, total_seconds, count):
+        cumulative = 0
+        for bound, n in zip(BUCKETS, buckets):
+            cumulative += n
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {count}')
+        lines.append(f'{name}_sum{{{labels}}} {total_seconds}')
+        lines.append(f'{name}_count{{{labels}}} {count}')
+
+    with _lock:
+        lines += ['# HELP apuestas_request_duration_seconds Latencia de las peticiones por endpoint.',
+                  '# TYPE apuestas_request_duration_seconds histogram']
+        for endpoint, s in sorted(_endpoints.items()):
+            histogram('apuestas_request_duration_seconds', f'endpoint="{_label(endpoint)}",pid="{pid}"', s['buckets'], s['seconds'], s['count'])
+        lines += ['# HELP apuestas_request_sql_statements_total Sentencias SQL ejecutadas por endpoint.',
+                  '# TYPE apuestas_request_sql_statements_total counter']
+        lines += [f'apuestas_request_sql_statements_total{{endpoint="{_label(e)}",pid="{pid}"}} {s["sql_count"]}' for e, s in sorted(_endpoints.items())]
+        lines += ['# HELP apuestas_request_sql_seconds_total Tiempo en SQL por endpoint.',
+                  '# TYPE apuestas_request_sql_seconds_total counter']
+        lines += [f'apuestas_request_sql_seconds_total{{endpoint="{_label(e)}",pid="{pid}"}} {s["sql_seconds"]}' for e, s in sorted(_endpoints.items())]
+        lines += ['# HELP apuestas_sql_statements_total Ejecuciones por sentencia normalizada.',
+                  '# TYPE apuestas_sql_statements_total counter']
+        lines += [f'apuestas_sql_statements_total{{statement="{_label(sql)}",pid="{pid}"}} {s["count"]}' for sql, s in sorted(_statements.items())]
+        lines += ['# HELP apuestas_sql_seconds_total Tiempo por sentencia normalizada.',
+                  '# TYPE apuestas_sql_seconds_total counter']
+        lines += [f'apuestas_sql_seconds_total{{statement="{_label(sql)}",pid="{pid}"}} {s["seconds"]}' for sql, s in sorted(_statements.items())]
+        lines += ['# HELP apuestas_sql_lock_wait_seconds Espera aproximada por el lock de escritura (sentencia que abre la transacción).',
+                  '# TYPE apuestas_sql_lock_wait_seconds histogram']
+        histogram('apuestas_sql_lock_wait_seconds', f'pid="{pid}"', _lock_wait['buckets'], _lock_wait['seconds'], _lock_wait['statements'])
+        lines += ['# HELP apuestas_sql_lock_errors_total Sentencias que fallaron con "database is locked".',
+                  '# TYPE apuestas_sql_lock_errors_total counter',
+                  f'apuestas_sql_lock_errors_total{{pid="{pid}"}} {_lock_wait["errors"]}']
+    return '\n'.join(lines) + '\n'
+
+def reset():
+    """Vacía las métricas de este worker."""
+    with _lock:
+        _statements.clear()
+        _endpoints.clear()
+        _slow_queries.clear()
+        _lock_wait.update({'statements': 0, 'seconds': 0.0, 'errors': 0, 'buckets': [0] * (len(BUCKETS) + 1)})
+
+def init_app(app):
+    app.config.setdefault('METRICS_TOKEN', None)
+    app.before_request(_before_request)
+    app.teardown_appcontext(_teardown)
@@ -0,0 +1,20 @@
+-- Índices para las consultas de las rutas calientes.
+
+-- Tablero de `index` y `admin`: WHERE status = 'SCHEDULED' ORDER BY match_datetime.
+CREATE INDEX IF NOT EXISTS idx_matches_status_datetime ON matches (status, match_datetime);
+
+-- Cuotas por partido.
+CREATE INDEX IF NOT EXISTS idx_odds_match_id ON odds (match_id);
+
+-- Historial de `profile`: WHERE user_id = ? ORDER BY created_at DESC.
+CREATE INDEX IF NOT EXISTS idx_bets_user_created ON bets (user_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_combo_bets_user_created ON combo_bets (user_id, created_at);
+
+-- Liquidación y cancelación: WHERE match_id = ? AND status = 'ACTIVE'.
+CREATE INDEX IF NOT EXISTS idx_bets_match_status ON bets (match_id, status);
+
+-- Selecciones de una combinada.
+CREATE INDEX IF NOT EXISTS idx_bets_combo_bet_id ON bets (combo_bet_id);
+
+-- Movimientos de un usuario.
+CREATE INDEX IF NOT EXISTS idx_transactions_user_id ON transactions (user_id);
@@ -0,0 +1,9 @@
+-- Contadores de versión de datos compartidos entre workers.
+-- `board` cambia cada vez que se añade, liquida o cancela un partido.
+CREATE TABLE IF NOT EXISTS data_versions (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0,
+    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT OR IGNORE INTO data_versions (name) VALUES ('board');
@@ -0,0 +1,17 @@
+-- Cuotas versionadas: cada recálculo añade una fila nueva y `matches.current_odds_id`
+-- apunta a la vigente. Las apuestas guardan la versión que tomaron.
+ALTER TABLE odds ADD COLUMN version INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE odds ADD COLUMN created_at TEXT;
+ALTER TABLE matches ADD COLUMN current_odds_id INTEGER REFERENCES odds (odds_id);
+ALTER TABLE bets ADD COLUMN odds_id INTEGER REFERENCES odds (odds_id);
+
+-- Las filas repetidas que ya existieran pasan a ser versiones sucesivas.
+UPDATE odds SET version = (
+    SELECT COUNT(*) FROM odds older WHERE older.match_id = odds.match_id AND older.odds_id <= odds.odds_id
+);
+UPDATE matches SET current_odds_id = (
+    SELECT MAX(odds_id) FROM odds WHERE odds.match_id = matches.match_id
+);
+
+DROP INDEX IF EXISTS idx_odds_match_id;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_odds_match_version ON odds (match_id, version);
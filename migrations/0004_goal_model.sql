@@ -0,0 +1,19 @@
+-- Parámetros ajustados del modelo de goles (Poisson con corrección Dixon-Coles).
+-- Se guardan para poner precio sin reajustar y para arrancar el siguiente ajuste
+-- desde la solución anterior.
+CREATE TABLE IF NOT EXISTS goal_model_params (
+    team_id INTEGER PRIMARY KEY,
+    attack REAL NOT NULL,
+    defence REAL NOT NULL,
+    FOREIGN KEY (team_id) REFERENCES teams (team_id)
+);
+
+CREATE TABLE IF NOT EXISTS goal_model_state (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    home_advantage REAL NOT NULL,
+    rho REAL NOT NULL,
+    n_matches INTEGER NOT NULL,
+    log_likelihood REAL NOT NULL,
+    iterations INTEGER NOT NULL,
+    fitted_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
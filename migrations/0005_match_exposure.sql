@@ -0,0 +1,29 @@
+-- Exposición de la casa por partido y resultado, mantenida al apostar, liquidar y cancelar.
+-- Solo cuenta apuestas ACTIVE; las selecciones de combinadas van aparte porque su pago
+-- depende del resto de selecciones.
+CREATE TABLE IF NOT EXISTS match_exposure (
+    match_id INTEGER NOT NULL,
+    bet_type TEXT NOT NULL,
+    bet_count INTEGER NOT NULL DEFAULT 0,
+    total_stake REAL NOT NULL DEFAULT 0,
+    total_potential_payout REAL NOT NULL DEFAULT 0,
+    combo_count INTEGER NOT NULL DEFAULT 0,
+    combo_stake REAL NOT NULL DEFAULT 0,
+    combo_potential_payout REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (match_id, bet_type),
+    FOREIGN KEY (match_id) REFERENCES matches (match_id)
+);
+
+DELETE FROM match_exposure;
+INSERT INTO match_exposure (match_id, bet_type, bet_count, total_stake, total_potential_payout, combo_count, combo_stake, combo_potential_payout)
+SELECT b.match_id, b.bet_type,
+       SUM(b.combo_bet_id IS NULL),
+       SUM(CASE WHEN b.combo_bet_id IS NULL THEN b.wager_amount ELSE 0 END),
+       SUM(CASE WHEN b.combo_bet_id IS NULL THEN b.potential_payout ELSE 0 END),
+       SUM(b.combo_bet_id IS NOT NULL),
+       SUM(CASE WHEN b.combo_bet_id IS NOT NULL THEN c.total_wager ELSE 0 END),
+       SUM(CASE WHEN b.combo_bet_id IS NOT NULL THEN c.potential_payout ELSE 0 END)
+FROM bets b
+LEFT JOIN combo_bets c ON c.combo_bet_id = b.combo_bet_id
+WHERE b.status = 'ACTIVE' AND (b.combo_bet_id IS NULL OR c.status = 'ACTIVE')
+GROUP BY b.match_id, b.bet_type;
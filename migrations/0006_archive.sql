@@ -0,0 +1,18 @@
+-- Archivo de apuestas liquidadas: las filas antiguas pasan a una base aparte
+-- (ver archive.py) y aquí solo quedan los totales por usuario.
+CREATE TABLE IF NOT EXISTS user_archive_totals (
+    user_id INTEGER PRIMARY KEY,
+    bets INTEGER NOT NULL DEFAULT 0,
+    combo_bets INTEGER NOT NULL DEFAULT 0,
+    transactions INTEGER NOT NULL DEFAULT 0,
+    total_wagered REAL NOT NULL DEFAULT 0,
+    total_won REAL NOT NULL DEFAULT 0,
+    -- Suma de los movimientos archivados: balance = movimientos vivos + ledger_amount.
+    ledger_amount REAL NOT NULL DEFAULT 0,
+    updated_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users (user_id)
+);
+
+-- El archivado busca los movimientos de cada apuesta o combinada que mueve.
+CREATE INDEX IF NOT EXISTS idx_transactions_bet_id ON transactions (bet_id) WHERE bet_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_transactions_combo_bet_id ON transactions (combo_bet_id) WHERE combo_bet_id IS NOT NULL;
@@ -0,0 +1,11 @@
+-- Cambios publicados para los clientes conectados por SSE (ver events.py).
+-- Se escriben en la misma transacción que el cambio; cada worker lee los nuevos
+-- con una sola consulta periódica y los reparte a sus clientes.
+-- `user_id` NULL = evento para todos (el tablero).
+CREATE TABLE IF NOT EXISTS events (
+    event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER,
+    event TEXT NOT NULL,
+    data TEXT NOT NULL,
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,29 @@
+-- Cola de trabajos en segundo plano (ver jobs.py): las acciones pesadas del
+-- administrador se encolan aquí y las ejecuta `flask run-worker`.
+-- `dedupe_key`: una misma acción encolada dos veces devuelve el trabajo existente
+-- (salvo que haya fallado). `lock_key`: los trabajos con la misma clave se ejecutan
+-- de uno en uno y en orden. `attempts` sirve también de testigo: solo quien tiene
+-- el último intento puede cerrar el trabajo. Sin AUTOINCREMENT: los trabajos no
+-- se borran y un INSERT descartado por `dedupe_key` no deja huecos en los ids.
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    dedupe_key TEXT,
+    lock_key TEXT,
+    status TEXT NOT NULL DEFAULT 'QUEUED' CHECK (status IN ('QUEUED', 'RUNNING', 'DONE', 'FAILED')),
+    progress TEXT,
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    created_by INTEGER REFERENCES users (user_id),
+    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    started_at TEXT,
+    finished_at TEXT,
+    lease_until TEXT
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_dedupe_key ON jobs (dedupe_key) WHERE status != 'FAILED';
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, job_id);
+CREATE INDEX IF NOT EXISTS idx_jobs_lock_key ON jobs (lock_key, status, job_id) WHERE lock_key IS NOT NULL;
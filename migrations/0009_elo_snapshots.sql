@@ -0,0 +1,21 @@
+-- Ratings Elo de ambos equipos antes y después de cada partido completado (ver
+-- odds_calculator.py). `seq` es la posición del partido en la repetición del
+-- historial, en orden (match_datetime, match_id): un resultado atrasado o
+-- corregido solo repite desde su posición en adelante, y los ratings a una
+-- fecha son el último snapshot de cada equipo hasta ella.
+-- Se llena en la migración 0011 y se mantiene con cada resultado; `flask rebuild-elo` la reconstruye.
+CREATE TABLE IF NOT EXISTS elo_snapshots (
+    seq INTEGER PRIMARY KEY,
+    match_id INTEGER NOT NULL UNIQUE REFERENCES matches (match_id),
+    match_datetime TEXT NOT NULL,
+    home_team_id INTEGER NOT NULL,
+    away_team_id INTEGER NOT NULL,
+    home_elo_before REAL NOT NULL,
+    away_elo_before REAL NOT NULL,
+    home_elo_after REAL NOT NULL,
+    away_elo_after REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_elo_snapshots_datetime ON elo_snapshots (match_datetime, match_id);
+CREATE INDEX IF NOT EXISTS idx_elo_snapshots_home ON elo_snapshots (home_team_id);
+CREATE INDEX IF NOT EXISTS idx_elo_snapshots_away ON elo_snapshots (away_team_id);
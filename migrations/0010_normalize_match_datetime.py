@@ -0,0 +1,51 @@
+"""
+Lleva todas las fechas de partido a 'YYYY-MM-DD HH:MM:SS' (ingestion.DATETIME_FORMAT).
+
+Los partidos creados desde el formulario guardaban la fecha del input
+datetime-local ('2024-05-01T18:30') y los del CSV tal como venían. Las fechas
+se comparan como texto ('T' ordena después de ' '), así que la repetición Elo,
+los ratings a una fecha y el archivo los ordenaban mal.
+
+Si al normalizar dos partidos de los mismos equipos quedan con la misma fecha
+(`uq_match`), son el mismo partido cargado dos veces: se conserva el que tiene
+apuestas o resultado y se borran los otros con sus cuotas. Si más de uno tiene
+apuestas o resultado no se puede decidir solo: la migración falla y los lista.
+"""
+from collections import defaultdict
+
+def _in_use(row):
+    return row['status'] != 'SCHEDULED' or row['has_bets']
+
+def upgrade(db):
+    rows = db.execute(
+        """
+        SELECT m.match_id, m.home_team_id, m.away_team_id, m.match_datetime, m.status,
+               datetime(m.match_datetime) AS normalized,
+               EXISTS (SELECT 1 FROM bets b WHERE b.match_id = m.match_id) AS has_bets
+        FROM matches m
+        WHERE datetime(m.match_datetime) IS NOT NULL
+        ORDER BY m.match_id
+        """).fetchall()
+    groups = defaultdict(list)
+    for row in rows:
+        groups[(row['home_team_id'], row['away_team_id'], row['normalized'])].append(row)
+
+    updates, duplicates, conflicts = [], [], []
+    for group in groups.values():
+        keep = group[0]
+        if len(group) > 1:
+            in_use = [row for row in group if _in_use(row)]
+            if len(in_use) > 1:
+                conflicts.append(' y '.join(f"{row['match_id']} ('{row['match_datetime']}')" for row in in_use))
+                continue
+            keep = in_use[0] if in_use else next((row for row in group if row['match_datetime'] == row['normalized']), keep)
+            duplicates += [(row['match_id'],) for row in group if row is not keep]
+        if keep['match_datetime'] != keep['normalized']:
+            updates.append((keep['normalized'], keep['match_id']))
+    if conflicts:
+        raise ValueError('Partidos duplicados con la misma fecha normalizada y con apuestas o resultado: '
+                         + '; '.join(conflicts) + '. Corrige a mano la fecha o los equipos de uno de ellos y vuelve a migrar.')
+
+    for table in ('odds', 'match_exposure', 'matches'):
+        db.executemany(f"DELETE FROM {table} WHERE match_id = ?", duplicates)
+    db.executemany("UPDATE matches SET match_datetime = ? WHERE match_id = ?", updates)
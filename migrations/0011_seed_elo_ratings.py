@@ -0,0 +1,12 @@
+"""
+Llena `team_elo_ratings` y `elo_snapshots` repitiendo el historial completo.
+
+Una base anterior a la serie tiene partidos completados pero ninguna fila en
+esas tablas, y sin ellas cada equipo vale 1500 y los partidos nuevos se
+cotizan como parejos. Se repite aquí una sola vez al migrar; a partir de ahí
+cada resultado solo repite desde su posición (ver odds_calculator.apply_results_from).
+"""
+import odds_calculator
+
+def upgrade(db):
+    odds_calculator._rebuild(db)
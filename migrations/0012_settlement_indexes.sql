@@ -0,0 +1,11 @@
+-- Liquidación y cancelación cambian el estado de todas las apuestas del partido:
+-- con `status` en el índice, cada UPDATE movía además cada entrada del índice.
+-- Al liquidar se leen todas las apuestas del partido igualmente, así que basta
+-- con indexar `match_id`.
+DROP INDEX IF EXISTS idx_bets_match_status;
+CREATE INDEX IF NOT EXISTS idx_bets_match_id ON bets (match_id);
+
+-- Selecciones de combinadas de un partido sin recorrer sus apuestas simples:
+-- WHERE match_id = ? AND combo_bet_id IS NOT NULL (settlement._collect_affected_combos,
+-- exposure y los eventos de cuenta).
+CREATE INDEX IF NOT EXISTS idx_bets_match_combo ON bets (match_id, combo_bet_id) WHERE combo_bet_id IS NOT NULL;
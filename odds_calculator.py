@@ -1,77 +1,208 @@
 import sqlite3
-import pandas as pd
-import math
+import click
+import database
+import goal_model
+
+# NumPy solo se importa al calcular cuotas (ver `match_probabilities`): los
+# workers que solo sirven páginas no lo cargan.
 
 K_FACTOR = 32
 HOME_ADVANTAGE = 100
 MARGIN = 0.05
+DRAW_PROBABILITY = 0.25
+INITIAL_ELO = 1500.0
+ENGINES = ('elo', 'goals')
+
+def expected_home_score(elo_home, elo_away, home_advantage=HOME_ADVANTAGE):
+    """Puntuación esperada del local según Elo. Acepta escalares o arrays."""
+    return 1 / (1 + 10 ** ((elo_away - elo_home - home_advantage) / 400))
+
+def update_elo_pair(elo_home, elo_away, home_score, away_score):
+    """Aplica un resultado a los ratings de local y visitante y devuelve los nuevos."""
+    expected_home_win = expected_home_score(elo_home, elo_away)
+
+    if home_score > away_score:
+        actual_result = 1.0
+    elif away_score > home_score:
+        actual_result = 0.0
+    else:
+        actual_result = 0.5
+
+    new_home = elo_home + K_FACTOR * (actual_result - expected_home_win)
+    new_away = elo_away + K_FACTOR * ((1 - actual_result) - (1 - expected_home_win))
+    return new_home, new_away
+
+# Partidos completados en el orden de la repetición del historial.
+COMPLETED_MATCHES_SQL = """
+    SELECT match_id, match_datetime, home_team_id, away_team_id, home_score, away_score
+    FROM matches
+    WHERE status = 'COMPLETED' {where}
+    ORDER BY match_datetime ASC, match_id ASC
+"""
+
+INSERT_SNAPSHOT_SQL = """
+    INSERT INTO elo_snapshots (match_id, match_datetime, home_team_id, away_team_id,
+                               home_elo_before, away_elo_before, home_elo_after, away_elo_after)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
 
-def calculate_elo_ratings(db):
+# Rating de cada equipo tras su último partido con seq <= ?: una búsqueda por
+# índice para su último partido como local y otra como visitante.
+RATINGS_AT_SQL = """
+    SELECT t.team_id, s.home_team_id, s.home_elo_after, s.away_elo_after
+    FROM (
+        SELECT team_id, MAX(
+            COALESCE((SELECT MAX(seq) FROM elo_snapshots WHERE home_team_id = teams.team_id AND seq <= ?), 0),
+            COALESCE((SELECT MAX(seq) FROM elo_snapshots WHERE away_team_id = teams.team_id AND seq <= ?), 0)) AS seq
+        FROM teams
+    ) t
+    JOIN elo_snapshots s ON s.seq = t.seq
+"""
+
+def _replay(rows, elo_ratings):
     """
-    Calcula los rankings Elo de todos los equipos basándose en los partidos completados.
-    Inicializa todos los equipos con un rating de 1500.
+    Aplica en orden los partidos `rows` sobre `elo_ratings`, que se modifica, y
+    devuelve un snapshot por partido con los ratings de antes y de después.
     """
-    teams_cursor = db.execute("SELECT team_id FROM teams")
-    elo_ratings = {row['team_id']: 1500.0 for row in teams_cursor.fetchall()}
-    
-    cursor = db.execute("SELECT home_team_id, away_team_id, home_score, away_score FROM matches WHERE status = 'COMPLETED' ORDER BY match_datetime ASC")
-    completed_matches = cursor.fetchall()
-
-    for row in completed_matches:
+    snapshots = []
+    for row in rows:
         home_team, away_team = row['home_team_id'], row['away_team_id']
-        home_score, away_score = row['home_score'], row['away_score']
+        home_before, away_before = elo_ratings.get(home_team, INITIAL_ELO), elo_ratings.get(away_team, INITIAL_ELO)
+        elo_ratings[home_team], elo_ratings[away_team] = update_elo_pair(
+            home_before, away_before, row['home_score'], row['away_score'])
+        snapshots.append((row['match_id'], row['match_datetime'], home_team, away_team,
+                          home_before, away_before, elo_ratings[home_team], elo_ratings[away_team]))
+    return snapshots
+
+def calculate_elo_ratings(db, until=None):
+    """
+    Calcula los rankings Elo de todos los equipos basándose en los partidos completados
+    (hasta `until` inclusive, si se da). Inicializa todos los equipos con un rating de 1500.
+    Recorre todo el historial: úsese solo para reconstruir o comprobar `team_elo_ratings`.
+    """
+    teams_cursor = db.execute("SELECT team_id FROM teams")
+    elo_ratings = {row['team_id']: INITIAL_ELO for row in teams_cursor.fetchall()}
+    where, params = ('AND match_datetime <= ?', (until,)) if until is not None else ('', ())
+    _replay(db.execute(COMPLETED_MATCHES_SQL.format(where=where), params).fetchall(), elo_ratings)
+    return elo_ratings
 
-        elo_home = elo_ratings.get(home_team, 1500)
-        elo_away = elo_ratings.get(away_team, 1500)
+def get_stored_elo_ratings(db, team_ids):
+    """Lee los ratings persistidos de los equipos dados; los que no tienen fila valen 1500."""
+    team_ids = list(set(team_ids))
+    elo_ratings = {team_id: INITIAL_ELO for team_id in team_ids}
+    if not team_ids:
+        return elo_ratings
+    placeholders = ', '.join('?' * len(team_ids))
+    rows = db.execute(f"SELECT team_id, elo_rating FROM team_elo_ratings WHERE team_id IN ({placeholders})", team_ids).fetchall()
+    for row in rows:
+        elo_ratings[row['team_id']] = row['elo_rating']
+    return elo_ratings
 
-        expected_home_win = 1 / (1 + math.pow(10, (elo_away - elo_home - HOME_ADVANTAGE) / 400))
+def store_elo_ratings(db, elo_ratings):
+    """Guarda (insert o update) los ratings dados en `team_elo_ratings`."""
+    db.executemany(
+        "INSERT INTO team_elo_ratings (team_id, elo_rating) VALUES (?, ?) "
+        "ON CONFLICT(team_id) DO UPDATE SET elo_rating = excluded.elo_rating",
+        list(elo_ratings.items())
+    )
 
-        if home_score > away_score:
-            actual_result = 1.0
-        elif away_score > home_score:
-            actual_result = 0.0
-        else:
-            actual_result = 0.5
+def _ratings_at(db, seq):
+    """Ratings tras el partido `seq` de la repetición, de los equipos que ya habían jugado."""
+    elo_ratings = {}
+    for row in db.execute(RATINGS_AT_SQL, (seq, seq)):
+        elo_ratings[row['team_id']] = row['home_elo_after'] if row['home_team_id'] == row['team_id'] else row['away_elo_after']
+    return elo_ratings
 
-        elo_ratings[home_team] = elo_home + K_FACTOR * (actual_result - expected_home_win)
-        elo_ratings[away_team] = elo_away + K_FACTOR * ((1 - actual_result) - (1 - expected_home_win))
-    
+def _rebuild(db):
+    """Repite todo el historial y reescribe `elo_snapshots` y `team_elo_ratings`. No hace commit."""
+    elo_ratings = {row['team_id']: INITIAL_ELO for row in db.execute("SELECT team_id FROM teams").fetchall()}
+    snapshots = _replay(db.execute(COMPLETED_MATCHES_SQL.format(where='')).fetchall(), elo_ratings)
+    db.execute("DELETE FROM elo_snapshots")
+    db.executemany(INSERT_SNAPSHOT_SQL, snapshots)
+    db.execute("DELETE FROM team_elo_ratings")
+    store_elo_ratings(db, elo_ratings)
     return elo_ratings
 
-def get_elo_based_probabilities(home_team_id, away_team_id, elo_ratings):
+def apply_results_from(db, match_datetime, match_id=0):
     """
-    Calcula las probabilidades de victoria, empate y derrota
-    basadas en los rankings Elo de los equipos.
+    Aplica a los ratings los partidos completados desde (match_datetime, match_id)
+    en adelante: uno recién liquidado, los nuevos de un CSV o un marcador corregido.
+    Parte del snapshot anterior a ese punto, borra los snapshots siguientes y
+    repite solo desde ahí; si el punto es posterior al último partido aplicado,
+    solo se añaden los nuevos. Lee y escribe únicamente los equipos que juegan
+    desde ese punto. Los snapshots del historial previo los crea la migración 0011.
+    No hace commit: se ejecuta dentro de la transacción del llamador.
+    Devuelve el número de partidos aplicados.
     """
-    elo_home = elo_ratings.get(home_team_id, 1500)
-    elo_away = elo_ratings.get(away_team_id, 1500)
+    start = db.execute(
+        "SELECT seq FROM elo_snapshots WHERE (match_datetime, match_id) >= (?, ?) ORDER BY match_datetime, match_id LIMIT 1",
+        (match_datetime, match_id)).fetchone()
+    rows = db.execute(COMPLETED_MATCHES_SQL.format(where='AND (match_datetime, match_id) >= (?, ?)'),
+                      (match_datetime, match_id)).fetchall()
+    team_ids = {team_id for row in rows for team_id in (row['home_team_id'], row['away_team_id'])}
+    if start is None:
+        elo_ratings = get_stored_elo_ratings(db, team_ids)
+    else:
+        elo_ratings = _ratings_at(db, start['seq'] - 1)
+        db.execute("DELETE FROM elo_snapshots WHERE seq >= ?", (start['seq'],))
+    db.executemany(INSERT_SNAPSHOT_SQL, _replay(rows, elo_ratings))
+    store_elo_ratings(db, {team_id: elo_ratings[team_id] for team_id in team_ids})
+    return len(rows)
 
-    expected_home_win = 1 / (1 + math.pow(10, (elo_away - elo_home - HOME_ADVANTAGE) / 400))
-    expected_away_win = 1 - expected_home_win
+def rebuild_elo_ratings(db):
+    """
+    Reconstruye `team_elo_ratings` y `elo_snapshots` repitiendo todo el historial.
+    Devuelve (ratings, desviación máxima respecto a lo que había guardado).
+    """
+    stored = {row['team_id']: row['elo_rating'] for row in db.execute("SELECT team_id, elo_rating FROM team_elo_ratings").fetchall()}
+    with db:
+        replayed = _rebuild(db)
+    max_drift = max((abs(rating - stored.get(team_id, INITIAL_ELO)) for team_id, rating in replayed.items()), default=0.0)
+    return replayed, max_drift
 
-    prob_draw = 0.25 
-    
-    total_win_prob = expected_home_win + expected_away_win
-    
-    if total_win_prob > 0:
-        prob_home_win = (expected_home_win / total_win_prob) * (1 - prob_draw)
-        prob_away_win = (expected_away_win / total_win_prob) * (1 - prob_draw)
-    else:
-        prob_home_win = 0.33
-        prob_away_win = 0.33
-        prob_draw = 0.34
+def get_ratings_as_of(db, as_of):
+    """
+    Ratings de todos los equipos tras los partidos completados hasta `as_of`
+    ('YYYY-MM-DD HH:MM:SS', inclusive), leídos de los snapshots sin repetir el
+    historial. Los equipos que aún no habían jugado valen 1500.
+    """
+    elo_ratings = {row['team_id']: INITIAL_ELO for row in db.execute("SELECT team_id FROM teams").fetchall()}
+    last = db.execute("SELECT seq FROM elo_snapshots WHERE match_datetime <= ? ORDER BY match_datetime DESC, match_id DESC LIMIT 1",
+                      (as_of,)).fetchone()
+    if last is not None:
+        elo_ratings.update(_ratings_at(db, last['seq']))
+    return elo_ratings
+
+def elo_probabilities(elo_home, elo_away, home_advantage=HOME_ADVANTAGE, prob_draw=DRAW_PROBABILITY):
+    """
+    Probabilidades de victoria local, empate y victoria visitante a partir de los
+    ratings. Acepta escalares o arrays de NumPy (un elemento por partido o por
+    combinación de parámetros).
+    """
+    expected_home_win = expected_home_score(elo_home, elo_away, home_advantage)
+    expected_away_win = 1 - expected_home_win
 
+    # expected_home_win + expected_away_win == 1, así que basta con repartir 1 - prob_draw.
     return {
-        'home_win': prob_home_win,
+        'home_win': expected_home_win * (1 - prob_draw),
         'draw': prob_draw,
-        'away_win': prob_away_win
+        'away_win': expected_away_win * (1 - prob_draw)
     }
 
-def convert_to_odds(probabilities):
-    """Convierte las probabilidades en cuotas con un margen."""
-    prob_home = probabilities['home_win'] * (1 + MARGIN)
-    prob_draw = probabilities['draw'] * (1 + MARGIN)
-    prob_away = probabilities['away_win'] * (1 + MARGIN)
+def get_elo_based_probabilities(home_team_id, away_team_id, elo_ratings):
+    """
+    Calcula las probabilidades de victoria, empate y derrota
+    basadas en los rankings Elo de los equipos.
+    """
+    elo_home = elo_ratings.get(home_team_id, INITIAL_ELO)
+    elo_away = elo_ratings.get(away_team_id, INITIAL_ELO)
+    return elo_probabilities(elo_home, elo_away)
+
+def convert_to_odds(probabilities, margin=MARGIN):
+    """Convierte las probabilidades en cuotas con un margen. Funciona igual con arrays."""
+    prob_home = probabilities['home_win'] * (1 + margin)
+    prob_draw = probabilities['draw'] * (1 + margin)
+    prob_away = probabilities['away_win'] * (1 + margin)
 
     return {
         'odds_home': 1 / prob_home,
@@ -79,19 +210,102 @@ def convert_to_odds(probabilities):
         'odds_away': 1 / prob_away
     }
 
-def generate_and_store_odds(db, match_id, home_team_id, away_team_id):
-    """Genera y almacena las cuotas de un partido usando Elo."""
-    elo_ratings = calculate_elo_ratings(db)
-    
-    probabilities = get_elo_based_probabilities(home_team_id, away_team_id, elo_ratings)
-    odds_to_store = convert_to_odds(probabilities)
+INSERT_ODDS_VERSION_SQL = """
+    INSERT INTO odds (match_id, odds_home, odds_draw, odds_away, version, created_at)
+    SELECT ?, ?, ?, ?, COALESCE(MAX(version), 0) + 1, CURRENT_TIMESTAMP FROM odds WHERE match_id = ?
+"""
+
+def store_odds(db, match_id, odds):
+    """
+    Guarda una nueva versión de las cuotas de un partido y la marca como actual.
+    Las versiones anteriores se conservan para las apuestas que las tomaron.
+    Devuelve el odds_id de la nueva versión.
+    """
+    odds_id = db.execute(INSERT_ODDS_VERSION_SQL, (match_id, odds['odds_home'], odds['odds_draw'], odds['odds_away'], match_id)).lastrowid
+    db.execute("UPDATE matches SET current_odds_id = ? WHERE match_id = ?", (odds_id, match_id))
+    return odds_id
+
+def match_probabilities(db, home_team_ids, away_team_ids, engine='elo'):
+    """
+    Probabilidades 1X2 de varios partidos como arrays de NumPy con el motor dado:
+    'elo' (ratings persistidos, empate fijo) o 'goals' (modelo de goles guardado).
+    """
+    if engine == 'goals':
+        return goal_model.get_goal_probabilities(db, home_team_ids, away_team_ids)
+    if engine != 'elo':
+        raise ValueError(f'Motor de cuotas desconocido: {engine}')
+    import numpy as np
+    elo_ratings = get_stored_elo_ratings(db, list(home_team_ids) + list(away_team_ids))
+    elo_home = np.array([elo_ratings[team_id] for team_id in home_team_ids], dtype=float)
+    elo_away = np.array([elo_ratings[team_id] for team_id in away_team_ids], dtype=float)
+    probabilities = elo_probabilities(elo_home, elo_away)
+    probabilities['draw'] = np.broadcast_to(probabilities['draw'], elo_home.shape)
+    return probabilities
+
+def generate_and_store_odds(db, match_id, home_team_id, away_team_id, engine='elo'):
+    """Genera y almacena las cuotas de un partido con el motor dado (ver `match_probabilities`)."""
+    probabilities = match_probabilities(db, [home_team_id], [away_team_id], engine)
+    odds_to_store = {key: float(value[0]) for key, value in convert_to_odds(probabilities).items()}
     
     try:
-        db.execute(
-            "INSERT INTO odds (match_id, odds_home, odds_draw, odds_away) VALUES (?, ?, ?, ?)",
-            (match_id, odds_to_store['odds_home'], odds_to_store['odds_draw'], odds_to_store['odds_away'])
-        )
-        db.commit()
+        store_odds(db, match_id, odds_to_store)
         print(f"Cuotas generadas y guardadas para el partido {match_id}")
     except sqlite3.IntegrityError as e:
-        print(f"Error de integridad al guardar las cuotas: {e}")
\ No newline at end of file
+        print(f"Error de integridad al guardar las cuotas: {e}")
+
+def reprice_scheduled_matches(db, tolerance=1e-9, engine='elo'):
+    """
+    Recalcula de una vez las cuotas de todos los partidos programados con los
+    ratings o parámetros actuales del motor: una consulta para partidos y cuotas
+    vigentes, una para los ratings, el cálculo vectorizado en NumPy y un
+    `executemany` con las nuevas versiones. Solo se versionan los partidos cuyas cuotas cambian.
+    No hace commit. Devuelve el número de partidos con cuotas nuevas.
+    """
+    rows = db.execute(
+        """
+        SELECT m.match_id, m.home_team_id, m.away_team_id, o.odds_home, o.odds_draw, o.odds_away
+        FROM matches m LEFT JOIN odds o ON o.odds_id = m.current_odds_id
+        WHERE m.status = 'SCHEDULED'
+        """).fetchall()
+    if not rows:
+        return 0
+
+    import numpy as np
+    match_ids = np.array([row['match_id'] for row in rows])
+    current = np.array([[row['odds_home'], row['odds_draw'], row['odds_away']] for row in rows], dtype=float)
+
+    probabilities = match_probabilities(db, [row['home_team_id'] for row in rows], [row['away_team_id'] for row in rows], engine)
+    odds = convert_to_odds(probabilities)
+    new = np.column_stack([odds[key] for key in ('odds_home', 'odds_draw', 'odds_away')])
+    # NaN en `current` (partido sin cuotas) nunca es "close", así que también se guarda.
+    changed = ~np.isclose(new, current, rtol=0, atol=tolerance).all(axis=1)
+    if not changed.any():
+        return 0
+
+    db.executemany(INSERT_ODDS_VERSION_SQL, [
+        (int(match_id), float(home), float(draw), float(away), int(match_id))
+        for match_id, (home, draw, away) in zip(match_ids[changed], new[changed])
+    ])
+    db.executemany(
+        "UPDATE matches SET current_odds_id = (SELECT MAX(odds_id) FROM odds WHERE odds.match_id = matches.match_id) WHERE match_id = ?",
+        [(int(match_id),) for match_id in match_ids[changed]])
+    return int(changed.sum())
+
+@click.command('rebuild-elo')
+@click.option('--check', is_flag=True, help='Solo compara con la repetición completa, sin escribir.')
+def rebuild_elo_command(check):
+    """Reconcilia team_elo_ratings y elo_snapshots con una repetición completa del historial."""
+    db = database.get_db()
+    if check:
+        replayed = calculate_elo_ratings(db)
+        stored = get_stored_elo_ratings(db, replayed.keys())
+        max_drift = max((abs(replayed[t] - stored[t]) for t in replayed), default=0.0)
+        click.echo(f'Max drift vs full replay: {max_drift:.6f} over {len(replayed)} teams.')
+        return
+    ratings, max_drift = rebuild_elo_ratings(db)
+    snapshots = db.execute("SELECT COUNT(*) FROM elo_snapshots").fetchone()[0]
+    click.echo(f'Rebuilt Elo ratings for {len(ratings)} teams and {snapshots} match snapshots (max drift corrected: {max_drift:.6f}).')
+
+def init_app(app):
+    app.config.setdefault('ODDS_ENGINE', 'elo')
+    app.cli.add_command(rebuild_elo_command)
\ No newline at end of file
@@ -0,0 +1,148 @@
+import multiprocessing
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app
+from werkzeug.security import check_password_hash, generate_password_hash
+
+DEFAULT_CONFIG = {
+    # Procesos que calculan hashes pbkdf2 por worker; 0 = en el propio hilo de la petición.
+    'PASSWORD_HASH_WORKERS': 2,
+    # Hashes en curso o en cola por worker antes de rechazar con 503.
+    'PASSWORD_HASH_QUEUE_LIMIT': 8,
+    'PASSWORD_HASH_TIMEOUT': 10,
+    # Intentos de login/registro por ventana antes de rechazar con 429, sin calcular el hash.
+    'LOGIN_ATTEMPT_WINDOW': 60,
+    'LOGIN_ATTEMPTS_PER_IP': 30,
+    'LOGIN_ATTEMPTS_PER_EMAIL': 5,
+}
+
+class HashingBusy(Exception):
+    """La cola de hashes está llena: mejor rechazar que dejar sin CPU al resto de rutas."""
+
+class AttemptLimiter:
+    """
+    Ventana deslizante de intentos por clave (IP o email) en memoria del worker.
+    Los límites son por proceso; con varios workers el límite efectivo se multiplica,
+    a cambio de no escribir en la base durante una avalancha de logins.
+    """
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._attempts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit, window, now=None):
+        """Cuenta un intento para `key`; devuelve False (sin contarlo) si ya superó `limit` en `window` segundos."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            attempts = self._attempts.get(key)
+            if attempts is None:
+                attempts = self._attempts[key] = deque()
+                if len(self._attempts) > self.max_keys:
+                    self._attempts.popitem(last=False)
+            self._attempts.move_to_end(key)
+            while attempts and attempts[0] <= now - window:
+                attempts.popleft()
+            if len(attempts) >= limit:
+                return False
+            attempts.append(now)
+            return True
+
+    def reset(self, key):
+        with self._lock:
+            self._attempts.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._attempts.clear()
+
+limiter = AttemptLimiter()
+
+_pool = None
+_pool_pid = None
+_pending = 0
+_pending_lock = threading.Lock()
+
+def _executor(workers):
+    """Pool de este proceso; se crea al primer uso para no heredarlo en el fork de gunicorn."""
+    global _pool, _pool_pid
+    with _pending_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+            _pool_pid = os.getpid()
+        return _pool
+
+def _discard(pool):
+    """Tras la muerte de un proceso del pool (BrokenProcessPool) el siguiente uso crea uno nuevo."""
+    global _pool
+    with _pending_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False)
+
+def _release(future=None):
+    global _pending
+    with _pending_lock:
+        _pending -= 1
+
+def _submit(workers, function, *args):
+    pool = _executor(workers)
+    try:
+        return pool, pool.submit(function, *args)
+    except BrokenProcessPool:
+        _discard(pool)
+        pool = _executor(workers)
+        return pool, pool.submit(function, *args)
+
+def _run(function, *args):
+    global _pending
+    config = current_app.config
+    workers = config['PASSWORD_HASH_WORKERS']
+    if not workers:
+        return function(*args)
+    with _pending_lock:
+        if _pending >= config['PASSWORD_HASH_QUEUE_LIMIT']:
+            raise HashingBusy()
+        _pending += 1
+    try:
+        pool, future = _submit(workers, function, *args)
+    except BaseException:
+        _release()
+        raise
+    # El hueco se libera cuando el hash termina de verdad, no cuando la petición deja
+    # de esperarlo: tras un timeout la tarea sigue ocupando el pool.
+    future.add_done_callback(_release)
+    try:
+        return future.result(timeout=config['PASSWORD_HASH_TIMEOUT'])
+    except TimeoutError:
+        raise HashingBusy()
+    except BrokenProcessPool:
+        _discard(pool)
+        raise HashingBusy()
+
+def hash_password(password):
+    return _run(generate_password_hash, password)
+
+def check_password(password_hash, password):
+    return _run(check_password_hash, password_hash, password)
+
+def allow_attempt(remote_addr, email=None):
+    """Aplica los límites por IP y por email antes de gastar CPU en un hash."""
+    config = current_app.config
+    window = config['LOGIN_ATTEMPT_WINDOW']
+    if not limiter.hit(f'ip:{remote_addr}', config['LOGIN_ATTEMPTS_PER_IP'], window):
+        return False
+    if email is not None and not limiter.hit(f'email:{email.strip().lower()}', config['LOGIN_ATTEMPTS_PER_EMAIL'], window):
+        return False
+    return True
+
+def login_succeeded(email):
+    """Un login correcto no debe consumir intentos del propio usuario."""
+    limiter.reset(f'email:{email.strip().lower()}')
+
+def init_app(app):
+    for name, value in DEFAULT_CONFIG.items():
+        app.config.setdefault(name, value)
@@ -1,9 +1,18 @@
 DROP TABLE IF EXISTS transactions;
 DROP TABLE IF EXISTS bets;
+DROP TABLE IF EXISTS combo_bets;
+DROP TABLE IF EXISTS match_exposure;
 DROP TABLE IF EXISTS odds;
+DROP TABLE IF EXISTS elo_snapshots;
 DROP TABLE IF EXISTS matches;
+DROP TABLE IF EXISTS goal_model_params;
+DROP TABLE IF EXISTS goal_model_state;
 DROP TABLE IF EXISTS team_elo_ratings;
 DROP TABLE IF EXISTS teams;
+DROP TABLE IF EXISTS user_archive_totals;
+DROP TABLE IF EXISTS events;
+DROP TABLE IF EXISTS jobs;
+DROP TABLE IF EXISTS data_versions;
 DROP TABLE IF EXISTS users;
 
 CREATE TABLE users (
@@ -47,6 +56,8 @@ CREATE TABLE bets (
     user_id INTEGER NOT NULL,
     match_id INTEGER NOT NULL,
     bet_type TEXT NOT NULL,
+    -- En las selecciones de una combinada (combo_bet_id no nulo) es el monto de toda
+    -- la combinada, repetido en cada selección: no sumar junto con las apuestas simples.
     wager_amount REAL NOT NULL,
     odds_at_placement REAL NOT NULL,
     potential_payout REAL NOT NULL,
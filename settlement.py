@@ -0,0 +1,195 @@
+import events
+import exposure
+import odds_calculator
+
+def match_result(home_score, away_score):
+    """Devuelve el tipo de apuesta ganadora para un marcador."""
+    if home_score > away_score:
+        return 'HOME_WIN'
+    elif home_score < away_score:
+        return 'AWAY_WIN'
+    return 'DRAW'
+
+def _get_scheduled_match(db, match_id):
+    match = db.execute("SELECT * FROM matches WHERE match_id = ?", (match_id,)).fetchone()
+    if match is None:
+        raise ValueError(f'El partido {match_id} no existe.')
+    if match['status'] != 'SCHEDULED':
+        raise ValueError(f'El partido {match_id} ya está {match["status"]}.')
+    return match
+
+# Combinadas todavía abiertas con alguna selección en el partido que se liquida o
+# cancela. Sus ids se calculan una sola vez por partido (ver `_collect_affected_combos`).
+AFFECTED_COMBOS = """
+    combo_bets.status = 'ACTIVE'
+    AND combo_bets.combo_bet_id IN (SELECT combo_bet_id FROM temp.affected_combos)
+"""
+
+def _collect_affected_combos(db, match_id):
+    """
+    Guarda en la tabla temporal `affected_combos` las combinadas con una selección
+    en el partido, antes de cambiar el estado de sus apuestas. Solo lee las
+    selecciones de combinadas del partido (índice parcial de la migración 0012),
+    no todas sus apuestas simples. La tabla es de la conexión y se vacía en cada llamada.
+    Se llama después de la primera escritura en la base: si la transacción empezara
+    leyendo, no podría pasar a escribir cuando otro la modificara entretanto (WAL).
+    """
+    db.execute("CREATE TEMP TABLE IF NOT EXISTS affected_combos (combo_bet_id INTEGER PRIMARY KEY)")
+    db.execute("DELETE FROM temp.affected_combos")
+    db.execute("INSERT INTO temp.affected_combos SELECT combo_bet_id FROM bets WHERE match_id = ? AND combo_bet_id IS NOT NULL", (match_id,))
+
+def _resolve_combos(db, match_id):
+    """
+    Etapa de combinadas tras liquidar o cancelar las selecciones de un partido.
+
+    Una combinada se da por perdida en cuanto pierde una selección; al dejar de
+    estar ACTIVE, las liquidaciones posteriores ya no la vuelven a examinar.
+    Se paga una sola vez `combo_bets.potential_payout` cuando ya no quedan
+    selecciones pendientes ni perdidas.
+    """
+    lost = db.execute(
+        f"""
+        UPDATE combo_bets SET status = 'LOST'
+        WHERE {AFFECTED_COMBOS}
+        AND EXISTS (SELECT 1 FROM bets l WHERE l.combo_bet_id = combo_bets.combo_bet_id AND l.match_id = ? AND l.status = 'LOST')
+        """, (match_id,)).rowcount
+
+    completed = f"""
+        {AFFECTED_COMBOS}
+        AND NOT EXISTS (SELECT 1 FROM bets l WHERE l.combo_bet_id = combo_bets.combo_bet_id AND l.status IN ('ACTIVE', 'LOST'))
+    """
+    db.execute(
+        f"""
+        INSERT INTO transactions (user_id, combo_bet_id, transaction_type, amount)
+        SELECT user_id, combo_bet_id, 'COMBO_WINNINGS', potential_payout
+        FROM combo_bets
+        WHERE {completed}
+        """)
+    db.execute(
+        f"""
+        UPDATE users SET token_balance = token_balance + winnings.total
+        FROM (
+            SELECT user_id, SUM(potential_payout) AS total
+            FROM combo_bets
+            WHERE {completed}
+            GROUP BY user_id
+        ) AS winnings
+        WHERE users.user_id = winnings.user_id
+        """)
+    won = db.execute(f"UPDATE combo_bets SET status = 'WON' WHERE {completed}").rowcount
+    return {'combos_won': won, 'combos_lost': lost}
+
+def settle_match(db, match_id, home_score, away_score):
+    """
+    Liquida un partido con SQL por conjuntos: un INSERT…SELECT para las ganancias,
+    un UPDATE agregado por usuario para los balances y un UPDATE para marcar las
+    apuestas. El número de sentencias no depende del número de apuestas.
+    Las selecciones de combinadas no se pagan por separado: las resuelve
+    `_resolve_combos`. Al final se actualiza la exposición de los partidos afectados
+    y se avisa a los usuarios con apuestas en el partido.
+    No hace commit: se ejecuta dentro de la transacción del llamador.
+    Devuelve el número de apuestas y combinadas ganadas y perdidas.
+    """
+    match = _get_scheduled_match(db, match_id)
+    result = match_result(home_score, away_score)
+
+    # La primera sentencia escribe en la base: la transacción toma el lock de
+    # escritura antes de leer nada (ver `_collect_affected_combos`).
+    db.execute("UPDATE matches SET home_score = ?, away_score = ?, status = 'COMPLETED' WHERE match_id = ?", (home_score, away_score, match_id))
+    _collect_affected_combos(db, match_id)
+    # Si hay partidos posteriores ya completados, sus ratings se repiten desde este.
+    odds_calculator.apply_results_from(db, match['match_datetime'], match_id)
+
+    db.execute(
+        """
+        INSERT INTO transactions (user_id, bet_id, transaction_type, amount)
+        SELECT user_id, bet_id, 'WINNINGS', potential_payout
+        FROM bets
+        WHERE match_id = ? AND status = 'ACTIVE' AND bet_type = ? AND combo_bet_id IS NULL
+        """, (match_id, result))
+    db.execute(
+        """
+        UPDATE users SET token_balance = token_balance + winnings.total
+        FROM (
+            SELECT user_id, SUM(potential_payout) AS total
+            FROM bets
+            WHERE match_id = ? AND status = 'ACTIVE' AND bet_type = ? AND combo_bet_id IS NULL
+            GROUP BY user_id
+        ) AS winnings
+        WHERE users.user_id = winnings.user_id
+        """, (match_id, result))
+    won = db.execute("UPDATE bets SET status = 'WON' WHERE match_id = ? AND status = 'ACTIVE' AND bet_type = ?", (match_id, result)).rowcount
+    lost = db.execute("UPDATE bets SET status = 'LOST' WHERE match_id = ? AND status = 'ACTIVE'", (match_id,)).rowcount
+    combos = _resolve_combos(db, match_id)
+    exposure.refresh_after_result(db, match_id)
+    events.publish_match_accounts(db, match_id, result)
+    return {'won': won, 'lost': lost, **combos}
+
+def cancel_match(db, match_id):
+    """
+    Cancela un partido y devuelve lo apostado con el mismo esquema por conjuntos
+    que `settle_match`. En las combinadas la selección anulada cuenta con cuota 1:
+    se descuenta de la ganancia potencial y, si todas quedan anuladas, se devuelve
+    la apuesta. No hace commit. Devuelve el número de apuestas reembolsadas.
+    """
+    _get_scheduled_match(db, match_id)
+    db.execute("UPDATE matches SET status = 'CANCELLED' WHERE match_id = ?", (match_id,))
+    _collect_affected_combos(db, match_id)
+
+    db.execute(
+        f"""
+        UPDATE combo_bets
+        SET potential_payout = potential_payout / (
+            SELECT l.odds_at_placement FROM bets l
+            WHERE l.combo_bet_id = combo_bets.combo_bet_id AND l.match_id = ?
+        )
+        WHERE {AFFECTED_COMBOS}
+        """, (match_id,))
+
+    db.execute(
+        """
+        INSERT INTO transactions (user_id, bet_id, transaction_type, amount)
+        SELECT user_id, bet_id, 'BET_REFUND', wager_amount
+        FROM bets
+        WHERE match_id = ? AND status = 'ACTIVE' AND combo_bet_id IS NULL
+        """, (match_id,))
+    db.execute(
+        """
+        UPDATE users SET token_balance = token_balance + refunds.total
+        FROM (
+            SELECT user_id, SUM(wager_amount) AS total
+            FROM bets
+            WHERE match_id = ? AND status = 'ACTIVE' AND combo_bet_id IS NULL
+            GROUP BY user_id
+        ) AS refunds
+        WHERE users.user_id = refunds.user_id
+        """, (match_id,))
+    refunded = db.execute("UPDATE bets SET status = 'CANCELLED' WHERE match_id = ? AND status = 'ACTIVE'", (match_id,)).rowcount
+
+    voided = f"""
+        {AFFECTED_COMBOS}
+        AND NOT EXISTS (SELECT 1 FROM bets l WHERE l.combo_bet_id = combo_bets.combo_bet_id AND l.status != 'CANCELLED')
+    """
+    db.execute(
+        f"""
+        INSERT INTO transactions (user_id, combo_bet_id, transaction_type, amount)
+        SELECT user_id, combo_bet_id, 'COMBO_REFUND', total_wager
+        FROM combo_bets
+        WHERE {voided}
+        """)
+    db.execute(
+        f"""
+        UPDATE users SET token_balance = token_balance + refunds.total
+        FROM (
+            SELECT user_id, SUM(total_wager) AS total
+            FROM combo_bets
+            WHERE {voided}
+            GROUP BY user_id
+        ) AS refunds
+        WHERE users.user_id = refunds.user_id
+        """)
+    db.execute(f"UPDATE combo_bets SET status = 'CANCELLED' WHERE {voided}")
+    combos = _resolve_combos(db, match_id)
+    exposure.refresh_after_result(db, match_id)
+    events.publish_match_accounts(db, match_id, None)
+    return {'refunded': refunded, **combos}
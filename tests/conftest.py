@@ -0,0 +1,79 @@
+import os
+import shutil
+import pytest
+from app import app as flask_app
+import database
+import odds_calculator
+import wallet
+
+@pytest.fixture
+def app(tmp_path):
+    """La aplicación sobre una base nueva en `tmp_path`; la configuración se restaura al terminar."""
+    original = dict(flask_app.config)
+    flask_app.config.update(
+        TESTING=True,
+        DATABASE=str(tmp_path / 'apuestas.sqlite'),
+        ARCHIVE_DATABASE=str(tmp_path / 'archive.sqlite'),
+        JOBS_UPLOAD_FOLDER=str(tmp_path / 'uploads'),
+        JOBS_RUN_INLINE=True,
+        PASSWORD_HASH_WORKERS=0,
+    )
+    with flask_app.app_context():
+        database.init_db()
+    yield flask_app
+    database.close_pooled_connections()
+    flask_app.config.clear()
+    flask_app.config.update(original)
+
+@pytest.fixture
+def pre_series_db(tmp_path):
+    """Copia de la base versionada del repositorio: el esquema anterior a las migraciones (user_version 0)."""
+    path = tmp_path / 'pre_series.sqlite'
+    shutil.copy(os.path.join(os.path.dirname(database.__file__), 'apuestas.sqlite'), path)
+    db = database.connect(str(path))
+    yield db
+    db.close()
+
+@pytest.fixture
+def db(app):
+    with app.app_context():
+        yield database.get_db()
+
+@pytest.fixture
+def add_user(db):
+    """Crea un usuario con `balance` tokens y su transacción inicial; devuelve su id."""
+    def add_user(name, balance=100.0):
+        with db:
+            user_id = db.execute("INSERT INTO users (username, email, password_hash, token_balance) VALUES (?, ?, 'x', ?)",
+                                 (name, f'{name}@test', balance)).lastrowid
+            db.execute("INSERT INTO transactions (user_id, transaction_type, amount) VALUES (?, 'INITIAL', ?)", (user_id, balance))
+        return user_id
+    return add_user
+
+@pytest.fixture
+def add_match(db):
+    """Crea un partido programado con cuotas 2.0 / 3.0 / 4.0 (creando los equipos si hace falta); devuelve su id."""
+    def add_match(home, away, match_datetime='2030-01-01 12:00:00', odds=(2.0, 3.0, 4.0)):
+        with db:
+            db.executemany("INSERT OR IGNORE INTO teams (team_name) VALUES (?)", [(home,), (away,)])
+            home_id, away_id = [db.execute("SELECT team_id FROM teams WHERE team_name = ?", (name,)).fetchone()[0] for name in (home, away)]
+            match_id = db.execute("INSERT INTO matches (home_team_id, away_team_id, match_datetime) VALUES (?, ?, ?)",
+                                  (home_id, away_id, match_datetime)).lastrowid
+            odds_calculator.store_odds(db, match_id, dict(zip(('odds_home', 'odds_draw', 'odds_away'), odds)))
+        return match_id
+    return add_match
+
+@pytest.fixture
+def client_for(app):
+    """Cliente de pruebas con la sesión iniciada como el usuario dado."""
+    def client_for(user_id):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['user_id'] = user_id
+        return client
+    return client_for
+
+@pytest.fixture
+def ledger_mismatches(db):
+    """Usuarios cuyo balance es negativo o no cuadra con sus movimientos (ver `wallet.ledger_mismatches`)."""
+    return lambda: wallet.ledger_mismatches(db)
@@ -0,0 +1,47 @@
+import pytest
+import archive
+import betslip
+import settlement
+
+def place(db, user_id, singles=(), combos=()):
+    with db:
+        return betslip.place_betslip(db, user_id, {'singles': list(singles), 'combos': list(combos)})
+
+@pytest.fixture
+def archived_user(app, db, add_user, add_match):
+    """Usuario con una simple ganada, una perdida y una combinada ganada en partidos de 2020, ya archivadas."""
+    ana = add_user('ana')
+    a, b = add_match('A1', 'A2', '2020-01-01 12:00:00'), add_match('B1', 'B2', '2020-01-02 12:00:00')
+    place(db, ana, singles=[(a, 'HOME_WIN', 10.0), (a, 'DRAW', 5.0)], combos=[([(a, 'HOME_WIN'), (b, 'AWAY_WIN')], 2.0)])
+    # Un partido futuro que no se archiva.
+    place(db, ana, singles=[(add_match('C1', 'C2'), 'DRAW', 1.0)])
+    for match_id, score in ((a, (1, 0)), (b, (0, 1))):
+        with db:
+            settlement.settle_match(db, match_id, *score)
+    stats = archive.archive_settled(db, app.config['ARCHIVE_DATABASE'], older_than_days=30)
+    assert (stats['bets'], stats['combo_bets']) == (4, 1)
+    return ana
+
+def test_archive_totals_sum_the_moved_rows(db, archived_user):
+    totals = archive.get_totals(db, archived_user)
+    assert (totals['bets'], totals['combo_bets'], totals['transactions']) == (2, 1, 5)
+    assert totals['total_wagered'] == pytest.approx(10.0 + 5.0 + 2.0)
+    assert totals['total_won'] == pytest.approx(10.0 * 2.0 + 2.0 * 2.0 * 4.0)
+    assert totals['ledger_amount'] == pytest.approx(-17.0 + 20.0 + 16.0)
+    assert db.execute("SELECT COUNT(*) FROM bets WHERE user_id = ?", (archived_user,)).fetchone()[0] == 1
+
+def test_archived_movements_still_balance_the_ledger(db, archived_user, ledger_mismatches):
+    assert ledger_mismatches() == []
+
+def test_archiving_again_moves_nothing(app, db, archived_user):
+    stats = archive.archive_settled(db, app.config['ARCHIVE_DATABASE'], older_than_days=30)
+    assert (stats['bets'], stats['combo_bets'], stats['transactions']) == (0, 0, 0)
+    assert archive.get_totals(db, archived_user)['bets'] == 2
+
+def test_profile_lists_the_archived_history(archived_user, client_for):
+    client = client_for(archived_user)
+    assert b'Ver historial archivado' in client.get('/profile').data
+    assert len(client.get('/api/profile/bets', query_string={'archived': 1}).json['items']) == 2
+    combos = client.get('/api/profile/combo_bets', query_string={'archived': 1}).json['items']
+    assert len(combos) == 1 and len(combos[0]['selections']) == 2
+    assert client.get('/profile', query_string={'archived': 1}).status_code == 200
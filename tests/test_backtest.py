@@ -0,0 +1,19 @@
+import pytest
+import backtest
+import odds_calculator
+
+def test_history_replays_in_the_same_order_as_the_stored_ratings(db, add_match):
+    # Partidos a la misma hora que comparten equipo: el orden entre ellos cambia los ratings.
+    results = [('A', 'B', (3, 0)), ('B', 'C', (0, 2)), ('C', 'A', (1, 1)), ('A', 'C', (0, 1))]
+    with db:
+        for home, away, score in results:
+            match_id = add_match(home, away, '2024-05-01 18:30:00')
+            db.execute("UPDATE matches SET status = 'COMPLETED', home_score = ?, away_score = ? WHERE match_id = ?", (*score, match_id))
+
+    history = backtest.load_history(db)
+    grid = backtest.build_grid({'k_factor': [odds_calculator.K_FACTOR], 'home_advantage': [odds_calculator.HOME_ADVANTAGE],
+                                'draw_probability': [odds_calculator.DRAW_PROBABILITY], 'margin': [odds_calculator.MARGIN]})
+    ratings = backtest.replay_grid(history, grid)['ratings'][0]
+
+    expected = odds_calculator.calculate_elo_ratings(db)
+    assert dict(zip(history['team_ids'], ratings)) == pytest.approx({team_id: expected[team_id] for team_id in history['team_ids']})
@@ -0,0 +1,45 @@
+import board_cache
+import wallet
+
+def test_index_is_revalidated_with_its_etag(app, db, add_match):
+    add_match('Local', 'Visitante')
+    client = app.test_client()
+    etag = client.get('/').headers['ETag']
+    assert client.get('/', headers={'If-None-Match': etag}).status_code == 304
+
+    with db:
+        board_cache.bump_version(db)
+    response = client.get('/', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+
+def test_balance_change_invalidates_the_users_index(db, add_user, client_for):
+    user_id = add_user('ana')
+    client = client_for(user_id)
+    etag = client.get('/').headers['ETag']
+    assert client.get('/', headers={'If-None-Match': etag}).status_code == 304
+
+    with db:
+        wallet.credit(db, user_id, 5.0)
+    assert client.get('/', headers={'If-None-Match': etag}).status_code == 200
+
+def test_board_fragment_is_revalidated_with_its_etag(app, db):
+    client = app.test_client()
+    etag = client.get('/board').headers['ETag']
+    assert client.get('/board', headers={'If-None-Match': etag}).status_code == 304
+    with db:
+        board_cache.bump_version(db)
+    assert client.get('/board', headers={'If-None-Match': etag}).status_code == 200
+
+def test_board_is_only_queried_again_when_the_version_changes(app, db, add_match):
+    client = app.test_client()
+    add_match('Local', 'Visitante')
+    assert b'Local' in client.get('/board').data
+
+    # Sin cambiar la versión se sirve la caché, aunque la base haya cambiado.
+    add_match('Nuevo', 'Rival')
+    assert b'Nuevo' not in client.get('/board').data
+
+    with db:
+        board_cache.bump_version(db)
+    assert b'Nuevo' in client.get('/board').data
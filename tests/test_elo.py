@@ -0,0 +1,98 @@
+import io
+import random
+import pytest
+import database
+import ingestion
+import odds_calculator
+import settlement
+
+def results_csv(rows):
+    lines = ['home_team_id,away_team_id,match_datetime,home_score,away_score']
+    lines += [f'{home},{away},{match_datetime},{home_score},{away_score}' for home, away, match_datetime, home_score, away_score in rows]
+    return io.BytesIO('\n'.join(lines).encode())
+
+def random_results(rng, n, year, teams=6):
+    rows = []
+    for _ in range(n):
+        home, away = rng.sample(range(teams), 2)
+        rows.append((f'Equipo {home}', f'Equipo {away}', f'{year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} {rng.randint(10, 21)}:00:00',
+                     rng.randint(0, 4), rng.randint(0, 4)))
+    return rows
+
+def stored_ratings(db):
+    return {row['team_id']: row['elo_rating'] for row in db.execute("SELECT team_id, elo_rating FROM team_elo_ratings")}
+
+def snapshots(db):
+    return [tuple(row) for row in db.execute("SELECT * FROM elo_snapshots ORDER BY seq")]
+
+def assert_matches_full_rebuild(db):
+    incremental, incremental_snapshots = stored_ratings(db), snapshots(db)
+    full = odds_calculator.calculate_elo_ratings(db)
+    assert incremental == pytest.approx(full)
+    odds_calculator.rebuild_elo_ratings(db)
+    assert snapshots(db) == incremental_snapshots
+
+def test_backdated_results_replay_to_the_full_rebuild(db, add_match):
+    rng = random.Random(0)
+    ingestion.ingest_results(db, results_csv(random_results(rng, 120, 2021)), chunksize=40)
+    assert_matches_full_rebuild(db)
+
+    # Una temporada anterior llega después, en bloques, y corrige marcadores ya cargados.
+    older = random_results(rng, 60, 2020)
+    ingestion.ingest_results(db, results_csv(older), chunksize=25)
+    assert_matches_full_rebuild(db)
+    corrections = [(home, away, match_datetime, (home_score + 1) % 5, away_score) for home, away, match_datetime, home_score, away_score in older[:10]]
+    stats = ingestion.ingest_results(db, results_csv(corrections), on_duplicate='update', chunksize=4)
+    assert stats['updated'] == 10
+    assert_matches_full_rebuild(db)
+
+    # Un partido atrasado se liquida después de otros posteriores.
+    match_id = add_match('Equipo 0', 'Equipo 1', '2021-06-15 12:00:00')
+    with db:
+        settlement.settle_match(db, match_id, 3, 0)
+    assert_matches_full_rebuild(db)
+
+def test_backdated_result_keeps_earlier_snapshots(db, add_match):
+    rng = random.Random(1)
+    ingestion.ingest_results(db, results_csv(random_results(rng, 50, 2021)))
+    cutoff = '2021-07-01 00:00:00'
+    before = [row for row in snapshots(db) if row[2] < cutoff]
+
+    match_id = add_match('Equipo 2', 'Equipo 3', cutoff)
+    with db:
+        settlement.settle_match(db, match_id, 0, 2)
+
+    assert [row for row in snapshots(db) if row[2] < cutoff] == before
+    assert_matches_full_rebuild(db)
+
+def test_ratings_as_of_match_a_replay_until_that_date(app, db, add_match):
+    rng = random.Random(2)
+    ingestion.ingest_results(db, results_csv(random_results(rng, 80, 2021)))
+    for as_of in ('2020-12-31 23:59:59', '2021-03-10 15:00:00', '2021-08-01 00:00:00', '2022-01-01 00:00:00'):
+        assert odds_calculator.get_ratings_as_of(db, as_of) == pytest.approx(odds_calculator.calculate_elo_ratings(db, until=as_of))
+
+    response = app.test_client().get('/api/ratings', query_string={'as_of': '2021-08-01'})
+    expected = odds_calculator.calculate_elo_ratings(db, until='2021-08-01 23:59:59')
+    assert {row['team_id']: row['elo_rating'] for row in response.get_json()['ratings']} == pytest.approx(expected)
+    assert app.test_client().get('/api/ratings', query_string={'as_of': 'ayer'}).status_code == 400
+
+def test_migrating_a_database_with_history_seeds_the_ratings(pre_series_db):
+    db = pre_series_db
+    db.executemany("INSERT INTO teams (team_name) VALUES (?)", [('Fuerte',), ('Débil',)])
+    strong, weak = [db.execute("SELECT team_id FROM teams WHERE team_name = ?", (name,)).fetchone()[0] for name in ('Fuerte', 'Débil')]
+    db.executemany("INSERT INTO matches (home_team_id, away_team_id, match_datetime, status, home_score, away_score) VALUES (?, ?, ?, 'COMPLETED', ?, ?)",
+                   [(strong, weak, f'2020-01-{day:02d} 18:00:00', 2, 0) if day % 2 else (weak, strong, f'2020-01-{day:02d} 18:00:00', 0, 1)
+                    for day in range(1, 21)])
+    db.commit()
+
+    database.migrate_db(db)
+
+    assert stored_ratings(db) == pytest.approx(odds_calculator.calculate_elo_ratings(db))
+    assert len(snapshots(db)) == 20
+    match_id = db.execute("INSERT INTO matches (home_team_id, away_team_id, match_datetime) VALUES (?, ?, '2030-01-01 18:00:00')",
+                          (strong, weak)).lastrowid
+    odds_calculator.generate_and_store_odds(db, match_id, strong, weak)
+    odds = db.execute("SELECT o.* FROM matches m JOIN odds o ON o.odds_id = m.current_odds_id WHERE m.match_id = ?", (match_id,)).fetchone()
+    even = odds_calculator.convert_to_odds(odds_calculator.elo_probabilities(odds_calculator.INITIAL_ELO, odds_calculator.INITIAL_ELO))
+    assert odds['odds_home'] < even['odds_home'] - 0.3
+    assert odds['odds_away'] > even['odds_away'] + 1
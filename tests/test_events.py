@@ -0,0 +1,62 @@
+import pytest
+import events
+
+@pytest.mark.parametrize('url', ['/login', '/register'])
+def test_pages_without_live_changes_do_not_open_a_stream(app, url):
+    assert b'EventSource' not in app.test_client().get(url).data
+
+@pytest.mark.parametrize('url', ['/', '/profile', '/admin'])
+def test_live_pages_open_a_stream(db, client_for, url):
+    admin_id = db.execute("SELECT user_id FROM users WHERE is_admin = 1").fetchone()[0]
+    response = client_for(admin_id).get(url)
+    assert response.status_code == 200
+    assert b'EventSource' in response.data
+
+@pytest.fixture
+def broker(app, db):
+    """Broker sin hilo de sondeo efectivo: las pruebas llaman a `poll` ellas mismas."""
+    app.config.update(EVENTS_POLL_INTERVAL=3600, EVENTS_KEEPALIVE_SECONDS=0.01, EVENTS_MAX_CLIENTS=2)
+    broker = events.get_broker()
+    broker.poll(db)
+    return broker
+
+def publish(db, *published):
+    with db:
+        for event, data, user_id in published:
+            events.publish(db, event, data, user_id)
+
+def test_format_event():
+    event = {'event_id': 7, 'event': 'board', 'data': '{}'}
+    assert events.format_event(event) == 'id: 7\nevent: board\ndata: {}\n\n'
+
+def test_poll_delivers_shared_and_own_events_only(db, add_user, broker):
+    ana, bea = add_user('ana'), add_user('bea')
+    stream = events.stream(ana)
+    assert next(stream).startswith('retry:')
+
+    publish(db, ('board', {}, None), ('account', {'balance': 1}, bea), ('account', {'balance': 2}, ana))
+    assert broker.poll(db) == 3
+    board, own = next(stream), next(stream)
+    assert 'event: board' in board
+    assert 'event: account' in own and '"balance": 2' in own
+    assert next(stream) == ': keepalive\n\n'
+
+    # Al reconectar con Last-Event-ID recibe lo que se perdió, sin lo de otros usuarios.
+    board_id = int(board.split('\n')[0].removeprefix('id: '))
+    reconnected = events.stream(ana, last_event_id=board_id)
+    assert next(reconnected).startswith('retry:')
+    assert next(reconnected) == own
+    stream.close()
+    reconnected.close()
+
+def test_stream_is_refused_when_the_worker_is_full(app, broker, client_for, add_user):
+    streams = [events.stream(None) for _ in range(app.config['EVENTS_MAX_CLIENTS'])]
+    for stream in streams:
+        next(stream)
+    response = client_for(add_user('ana')).get('/events')
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '30'
+
+    streams[0].close()
+    assert events.stream(None) is not None
+    streams[1].close()
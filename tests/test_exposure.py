@@ -0,0 +1,48 @@
+import pytest
+import betslip
+import exposure
+import settlement
+
+def place(db, user_id, singles=(), combos=()):
+    with db:
+        return betslip.place_betslip(db, user_id, {'singles': list(singles), 'combos': list(combos)})
+
+def stored(db, match_id, bet_type):
+    row = db.execute("SELECT * FROM match_exposure WHERE match_id = ? AND bet_type = ?", (match_id, bet_type)).fetchone()
+    return dict(row) if row else None
+
+def test_placing_bets_adds_to_the_aggregates(db, add_user, add_match):
+    ana, bea = add_user('ana'), add_user('bea')
+    a, b = add_match('A1', 'A2'), add_match('B1', 'B2')
+    place(db, ana, singles=[(a, 'HOME_WIN', 10.0), (a, 'DRAW', 5.0)])
+    place(db, bea, singles=[(a, 'HOME_WIN', 4.0)], combos=[([(a, 'AWAY_WIN'), (b, 'HOME_WIN')], 3.0)])
+
+    home = stored(db, a, 'HOME_WIN')
+    assert (home['bet_count'], home['total_stake'], home['total_potential_payout']) == (2, 14.0, pytest.approx(28.0))
+    away = stored(db, a, 'AWAY_WIN')
+    assert (away['bet_count'], away['combo_count'], away['combo_stake']) == (0, 1, 3.0)
+    assert away['combo_potential_payout'] == pytest.approx(3.0 * 4.0 * 2.0)
+    assert stored(db, b, 'HOME_WIN')['combo_count'] == 1
+
+    # Peor caso de A: que gane el local (28 pagados) menos los 19 apostados en simples.
+    assert exposure.get_exposure(db)[a]['worst_case'] == pytest.approx(28.0 - 19.0)
+    assert exposure.find_drift(db) == []
+
+def test_results_keep_the_aggregates_in_sync(db, add_user, add_match):
+    ana = add_user('ana')
+    a, b, c = add_match('A1', 'A2'), add_match('B1', 'B2'), add_match('C1', 'C2')
+    place(db, ana, singles=[(a, 'HOME_WIN', 10.0)],
+          combos=[([(a, 'HOME_WIN'), (b, 'DRAW')], 5.0), ([(a, 'DRAW'), (c, 'HOME_WIN')], 2.0)])
+
+    # Al cancelar B la combinada sigue viva con la selección a cuota 1.
+    with db:
+        settlement.cancel_match(db, b)
+    assert stored(db, a, 'HOME_WIN')['combo_potential_payout'] == pytest.approx(5.0 * 2.0)
+    assert exposure.find_drift(db) == []
+
+    # Al liquidar A desaparece su exposición y la de las combinadas que perdieron en él.
+    with db:
+        settlement.settle_match(db, a, 1, 0)
+    assert db.execute("SELECT COUNT(*) FROM match_exposure WHERE match_id = ?", (a,)).fetchone()[0] == 0
+    assert stored(db, c, 'HOME_WIN') is None
+    assert exposure.find_drift(db) == []
@@ -0,0 +1,48 @@
+import pytest
+import history
+
+@pytest.fixture
+def bettor(db, add_user, add_match):
+    """Usuario con 5 apuestas simples, creadas una por minuto."""
+    user_id = add_user('historial')
+    match_id = add_match('Local', 'Visitante')
+    with db:
+        db.executemany("INSERT INTO bets (user_id, match_id, bet_type, wager_amount, odds_at_placement, potential_payout, created_at) "
+                       "VALUES (?, ?, 'HOME_WIN', 1, 2.0, 2.0, ?)",
+                       [(user_id, match_id, f'2030-01-01 10:0{minute}:00') for minute in range(5)])
+    return user_id
+
+@pytest.mark.parametrize('url', ['/api/profile/bets', '/api/profile/combo_bets'])
+@pytest.mark.parametrize('limit', ['abc', '1.5', ''])
+def test_non_numeric_limit_is_rejected(client_for, bettor, url, limit):
+    assert client_for(bettor).get(url, query_string={'limit': limit}).status_code == 400
+
+@pytest.mark.parametrize('limit', ['0', '-2'])
+def test_limit_below_one_returns_a_single_item(client_for, bettor, limit):
+    response = client_for(bettor).get('/api/profile/bets', query_string={'limit': limit})
+    assert response.status_code == 200
+    assert len(response.json['items']) == 1
+    assert response.json['next_cursor'] is not None
+
+def test_limit_is_capped(client_for, bettor, monkeypatch):
+    monkeypatch.setattr(history, 'MAX_PAGE_SIZE', 3)
+    response = client_for(bettor).get('/api/profile/bets', query_string={'limit': '1000'})
+    assert len(response.json['items']) == 3
+
+def test_cursor_walks_every_bet_once_newest_first(client_for, bettor, db):
+    client = client_for(bettor)
+    seen, cursor = [], None
+    while True:
+        response = client.get('/api/profile/bets', query_string={'limit': 2, 'before': cursor or ''})
+        assert len(response.json['items']) <= 2
+        seen += [item['bet_id'] for item in response.json['items']]
+        cursor = response.json['next_cursor']
+        if cursor is None:
+            break
+    expected = [row[0] for row in db.execute("SELECT bet_id FROM bets WHERE user_id = ? ORDER BY created_at DESC", (bettor,))]
+    assert seen == expected and len(seen) == 5
+
+@pytest.mark.parametrize('url', ['/api/profile/bets', '/api/profile/combo_bets'])
+def test_invalid_cursor_is_rejected(client_for, bettor, url):
+    assert client_for(bettor).get(url, query_string={'before': '2030-01-01|abc'}).status_code == 400
+    assert client_for(bettor).get(url, query_string={'before': 'sin-separador'}).status_code == 400
@@ -0,0 +1,24 @@
+import io
+import ingestion
+
+CSV = """home_team_id,away_team_id,match_datetime,home_score,away_score
+Local,Visitante,2024-05-01 18:30:00,1,0
+Visitante,Local,2024-06-01 18:30:00,2,2
+Local,Visitante,no es una fecha,1,0
+Local,Visitante,2024-07-01 18:30:00,-1,0
+"""
+
+def ingest(db, text, **kwargs):
+    return ingestion.ingest_results(db, io.BytesIO(text.encode()), **kwargs)
+
+def test_duplicates_are_skipped_not_rejected(db):
+    first = ingest(db, CSV)
+    assert (first['rows'], first['inserted'], first['skipped'], first['rejected']) == (4, 2, 0, 2)
+
+    again = ingest(db, CSV)
+    assert (again['inserted'], again['updated'], again['skipped'], again['rejected']) == (0, 0, 2, 2)
+
+def test_updated_duplicates_are_not_skipped(db):
+    ingest(db, CSV)
+    corrected = ingest(db, CSV.replace('2024-05-01 18:30:00,1,0', '2024-05-01 18:30:00,3,0'), on_duplicate='update')
+    assert (corrected['inserted'], corrected['updated'], corrected['skipped'], corrected['rejected']) == (0, 2, 0, 2)
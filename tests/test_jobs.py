@@ -0,0 +1,46 @@
+import pytest
+import goal_model
+import jobs
+
+def enqueue_and_run(db, kind, payload, **kwargs):
+    with db:
+        job, _ = jobs.enqueue(db, kind, payload, **kwargs)
+    return jobs.run_now(db, job['job_id'])
+
+@pytest.fixture
+def goals_engine(app, db, add_match):
+    """Motor de goles con un ajuste ya guardado sobre unos pocos resultados."""
+    app.config['ODDS_ENGINE'] = 'goals'
+    results = [('A', 'B', 2, 0), ('B', 'C', 1, 1), ('C', 'A', 0, 3), ('A', 'C', 1, 0), ('B', 'A', 0, 2), ('C', 'B', 2, 2)]
+    for day, (home, away, home_score, away_score) in enumerate(results, start=1):
+        match_id = add_match(home, away, f'2024-01-{day:02d} 18:00:00')
+        with db:
+            db.execute("UPDATE matches SET status = 'COMPLETED', home_score = ?, away_score = ? WHERE match_id = ?",
+                       (home_score, away_score, match_id))
+    with db:
+        goal_model.refit(db, cold=True)
+
+def test_goal_model_refit_runs_after_the_settlement_commits(db, add_match, goals_engine, monkeypatch):
+    fixture = add_match('A', 'B', '2030-01-01 18:00:00')
+    match_id = add_match('B', 'C', '2024-02-01 18:00:00')
+    fitted_in_transaction = []
+    fit = goal_model.fit
+    monkeypatch.setattr(goal_model, 'fit', lambda *args: fitted_in_transaction.append(db.in_transaction) or fit(*args))
+    odds_before = db.execute("SELECT current_odds_id FROM matches WHERE match_id = ?", (fixture,)).fetchone()[0]
+
+    job = enqueue_and_run(db, 'settle_match', {'match_id': match_id, 'home_score': 0, 'away_score': 4})
+
+    assert job['status'] == 'DONE'
+    reprice = db.execute("SELECT * FROM jobs WHERE kind = 'reprice'").fetchone()
+    assert reprice['status'] == 'DONE'
+    assert fitted_in_transaction == [False]
+    assert db.execute("SELECT current_odds_id FROM matches WHERE match_id = ?", (fixture,)).fetchone()[0] != odds_before
+
+def test_queued_reprice_is_reused(app, db, add_match):
+    app.config['JOBS_RUN_INLINE'] = False
+    first, second = add_match('A', 'B'), add_match('C', 'D')
+    for match_id in (first, second):
+        with db:
+            job, _ = jobs.enqueue(db, 'settle_match', {'match_id': match_id, 'home_score': 1, 'away_score': 0})
+        jobs.run_job(db, jobs.claim(db, 'test', job['job_id']))
+    assert db.execute("SELECT COUNT(*) FROM jobs WHERE kind = 'reprice' AND status = 'QUEUED'").fetchone()[0] == 1
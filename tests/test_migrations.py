@@ -0,0 +1,79 @@
+import os
+import sqlite3
+import pytest
+import database
+
+def add_teams(db, *names):
+    db.executemany("INSERT INTO teams (team_name) VALUES (?)", [(name,) for name in names])
+    return [db.execute("SELECT team_id FROM teams WHERE team_name = ?", (name,)).fetchone()[0] for name in names]
+
+def add_match(db, home, away, match_datetime, status='SCHEDULED', score=(None, None)):
+    return db.execute("INSERT INTO matches (home_team_id, away_team_id, match_datetime, status, home_score, away_score) VALUES (?, ?, ?, ?, ?, ?)",
+                      (home, away, match_datetime, status, *score)).lastrowid
+
+def test_normalizing_match_datetimes_merges_unused_duplicates(pre_series_db):
+    db = pre_series_db
+    home, away = add_teams(db, 'Local', 'Visitante')
+    form = add_match(db, home, away, '2024-05-01T18:30')
+    csv = add_match(db, home, away, '2024-05-01 18:30:00', 'COMPLETED', (1, 0))
+    db.execute("INSERT INTO odds (match_id, odds_home, odds_draw, odds_away) VALUES (?, 2, 3, 4)", (form,))
+    lone = add_match(db, away, home, '2024-06-01T20:00')
+    db.commit()
+
+    database.migrate_db(db)
+
+    rows = db.execute("SELECT match_id, match_datetime FROM matches ORDER BY match_id").fetchall()
+    assert [tuple(row) for row in rows] == [(csv, '2024-05-01 18:30:00'), (lone, '2024-06-01 20:00:00')]
+    assert db.execute("SELECT COUNT(*) FROM odds WHERE match_id = ?", (form,)).fetchone()[0] == 0
+    assert db.execute("SELECT COUNT(*) FROM elo_snapshots").fetchone()[0] == 1
+
+def test_normalizing_match_datetimes_reports_duplicates_in_use(pre_series_db):
+    db = pre_series_db
+    home, away = add_teams(db, 'Local', 'Visitante')
+    first = add_match(db, home, away, '2024-05-01T18:30', 'COMPLETED', (2, 2))
+    second = add_match(db, home, away, '2024-05-01 18:30:00', 'COMPLETED', (1, 0))
+    db.commit()
+
+    with pytest.raises(ValueError, match=f"{first} \\('2024-05-01T18:30'\\) y {second}"):
+        database.migrate_db(db)
+
+    assert db.execute('PRAGMA user_version').fetchone()[0] == 9
+    assert db.execute("SELECT match_datetime FROM matches WHERE match_id = ?", (first,)).fetchone()[0] == '2024-05-01T18:30'
+
+def schema_objects(db):
+    return {tuple(row) for row in db.execute("SELECT type, name FROM sqlite_master WHERE name NOT LIKE 'sqlite_%'")}
+
+def test_fresh_and_pre_series_databases_migrate_to_the_same_schema(tmp_path, pre_series_db):
+    latest = database.list_migrations()[-1][0]
+    fresh = database.connect(str(tmp_path / 'fresh.sqlite'))
+    with open(os.path.join(os.path.dirname(database.__file__), 'schema.sql'), encoding='utf8') as f:
+        fresh.executescript(f.read())
+    assert fresh.execute('PRAGMA user_version').fetchone()[0] == 0
+
+    for db in (fresh, pre_series_db):
+        assert database.migrate_db(db)[-1] == latest
+        assert db.execute('PRAGMA user_version').fetchone()[0] == latest
+        assert database.migrate_db(db) == []
+    assert schema_objects(fresh) == schema_objects(pre_series_db)
+    assert {('table', 'elo_snapshots'), ('table', 'match_exposure'), ('index', 'idx_bets_match_combo')} <= schema_objects(fresh)
+    fresh.close()
+
+@pytest.mark.parametrize('name, broken, error', [
+    ('0002_broken.sql', "CREATE TABLE partial (id INTEGER);\nINSERT INTO missing VALUES (1);\n", sqlite3.OperationalError),
+    ('0002_broken.py', "def upgrade(db):\n    db.execute('CREATE TABLE partial (id INTEGER)')\n    raise ValueError('falla a mitad')\n", ValueError),
+])
+def test_failed_migration_is_rolled_back(tmp_path, name, broken, error):
+    directory = tmp_path / 'migrations'
+    directory.mkdir()
+    (directory / '0001_ok.sql').write_text("CREATE TABLE applied (id INTEGER);\n")
+    (directory / name).write_text(broken)
+    (directory / '0003_never.sql').write_text("CREATE TABLE never (id INTEGER);\n")
+    db = database.connect(str(tmp_path / 'broken.sqlite'))
+
+    with pytest.raises(error):
+        database.migrate_db(db, str(directory))
+
+    assert not db.in_transaction
+    assert db.execute('PRAGMA user_version').fetchone()[0] == 1
+    assert {name for _, name in schema_objects(db)} == {'applied'}
+    db.close()
@@ -0,0 +1,67 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import pytest
+import passwords
+
+@pytest.fixture
+def hashing(app, monkeypatch):
+    """Pool de hilos en lugar de procesos: mismas colas y límites, sin arrancar intérpretes."""
+    app.config.update(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_QUEUE_LIMIT=1, PASSWORD_HASH_TIMEOUT=0.05)
+    pool = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(passwords, '_executor', lambda workers: pool)
+    monkeypatch.setattr(passwords, '_pending', 0)
+    passwords.limiter.clear()
+    with app.app_context():
+        yield
+    pool.shutdown(wait=True)
+
+def test_full_queue_is_rejected_without_hashing(app, hashing, monkeypatch):
+    monkeypatch.setattr(passwords, '_pending', app.config['PASSWORD_HASH_QUEUE_LIMIT'])
+    with pytest.raises(passwords.HashingBusy):
+        passwords.hash_password('secreto')
+
+def test_full_queue_answers_login_with_503(app, hashing, add_user, monkeypatch):
+    add_user('ana')
+    monkeypatch.setattr(passwords, '_pending', app.config['PASSWORD_HASH_QUEUE_LIMIT'])
+    response = app.test_client().post('/login', data={'email': 'ana@test', 'password': 'secreto'})
+    assert response.status_code == 503
+
+def test_slot_is_released_when_the_hash_finishes_not_on_timeout(app, hashing):
+    release = threading.Event()
+    with pytest.raises(passwords.HashingBusy):
+        passwords._run(release.wait)
+    # La tarea sigue en el pool tras el timeout: el hueco sigue ocupado.
+    assert passwords._pending == 1
+    with pytest.raises(passwords.HashingBusy):
+        passwords._run(str, 'otra')
+
+    release.set()
+    passwords._executor(1).submit(lambda: None).result()
+    assert passwords._pending == 0
+    app.config['PASSWORD_HASH_TIMEOUT'] = 10
+    assert passwords.check_password(passwords.hash_password('secreto'), 'secreto')
+    assert passwords._pending == 0
+
+def test_broken_pool_is_replaced(monkeypatch):
+    class Broken:
+        shutdown_called = False
+        def submit(self, function, *args):
+            raise BrokenProcessPool()
+        def shutdown(self, wait=True):
+            self.shutdown_called = True
+
+    broken, healthy = Broken(), ThreadPoolExecutor(max_workers=1)
+    pools = iter([broken, healthy])
+    monkeypatch.setattr(passwords, '_executor', lambda workers: next(pools))
+    pool, future = passwords._submit(1, str, 'x')
+    assert pool is healthy and future.result() == 'x'
+    assert broken.shutdown_called
+    healthy.shutdown()
+
+def test_attempt_limiter_uses_a_sliding_window():
+    limiter = passwords.AttemptLimiter()
+    assert [limiter.hit('ip', 2, 60, now=t) for t in (0, 1, 2)] == [True, True, False]
+    assert limiter.hit('ip', 2, 60, now=60.5)
+    limiter.reset('ip')
+    assert limiter.hit('ip', 1, 60, now=61)
@@ -0,0 +1,150 @@
+"""
+Recorre todas las rutas contra una base sintética y falla si alguna sentencia
+hace un SCAN completo de una tabla grande. Las sentencias se capturan en
+`metrics.InstrumentedConnection`, con sus placeholders, y cada consulta distinta
+se examina una sola vez por endpoint con EXPLAIN QUERY PLAN y sus parámetros.
+"""
+import io
+import random
+import re
+import pytest
+from flask import has_request_context, request
+from werkzeug.security import generate_password_hash
+import archive
+import database
+import metrics
+import odds_calculator
+
+# Tablas que crecen con el uso: un SCAN completo sobre ellas en una ruta es una regresión.
+LARGE_TABLES = {'matches', 'odds', 'bets', 'combo_bets', 'transactions', 'jobs', 'elo_snapshots'}
+
+TRACED_STATEMENTS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+def seed(db, n_teams=20, n_completed=2000, n_scheduled=20, n_users=50, bets_per_match=20, seed=0):
+    """Llena una base vacía con suficientes filas como para que un SCAN sea visible."""
+    rng = random.Random(seed)
+    db.execute("UPDATE users SET password_hash = ? WHERE email = 'admin@uni.edu'", (generate_password_hash('admin'),))
+    db.executemany("INSERT INTO teams (team_name) VALUES (?)", [(f'Equipo {i}',) for i in range(n_teams)])
+    db.executemany("INSERT INTO users (username, email, password_hash) VALUES (?, ?, 'x')",
+                   [(f'user{i}', f'user{i}@uni.edu') for i in range(n_users)])
+    team_ids = [row[0] for row in db.execute("SELECT team_id FROM teams")]
+    user_ids = [row[0] for row in db.execute("SELECT user_id FROM users")]
+
+    completed = []
+    for i in range(n_completed):
+        home, away = rng.sample(team_ids, 2)
+        completed.append((home, away, f'2020-01-01 00:00:{i:06d}', rng.randint(0, 4), rng.randint(0, 4)))
+    db.executemany("INSERT INTO matches (home_team_id, away_team_id, match_datetime, home_score, away_score, status) VALUES (?, ?, ?, ?, ?, 'COMPLETED')", completed)
+
+    for i in range(n_scheduled):
+        home, away = rng.sample(team_ids, 2)
+        match_id = db.execute("INSERT INTO matches (home_team_id, away_team_id, match_datetime) VALUES (?, ?, ?)",
+                              (home, away, f'2030-01-01 00:{i:02d}:00')).lastrowid
+        odds_calculator.store_odds(db, match_id, {'odds_home': 2.0, 'odds_draw': 3.0, 'odds_away': 4.0})
+        for _ in range(bets_per_match):
+            db.execute("INSERT INTO bets (user_id, match_id, bet_type, wager_amount, odds_at_placement, potential_payout) VALUES (?, ?, 'HOME_WIN', 1, 2.0, 2.0)",
+                       (rng.choice(user_ids), match_id))
+    db.commit()
+
+def table_aliases(sql):
+    """Mapea cada alias (o nombre) usado tras FROM/JOIN/UPDATE/INTO al nombre real de la tabla."""
+    aliases = {}
+    pattern = r'(?:FROM|JOIN|UPDATE|INTO)\s+(?:\w+\.)?(\w+)(?:\s+(?:AS\s+)?(?!WHERE|JOIN|ON|SET|ORDER|GROUP|LIMIT|LEFT|INNER|VALUES|DEFAULT)(\w+))?'
+    for table, alias in re.findall(pattern, sql, flags=re.IGNORECASE):
+        aliases[table] = table
+        if alias:
+            aliases[alias] = table
+    return aliases
+
+def plan_violations(db, sql, parameters):
+    """Devuelve las líneas de EXPLAIN QUERY PLAN que recorren entera una tabla grande."""
+    aliases = table_aliases(sql)
+    violations = []
+    for row in db.execute('EXPLAIN QUERY PLAN ' + sql, parameters).fetchall():
+        detail = row[3]
+        words = detail.split()
+        if words[0] == 'SCAN' and aliases.get(words[1]) in LARGE_TABLES:
+            violations.append(detail)
+    return violations
+
+def exercise_routes(app, client):
+    """Recorre todas las rutas de la aplicación con una sesión de administrador."""
+    def call(method, url, **kwargs):
+        with app.app_context():
+            return getattr(client, method)(url, **kwargs)
+
+    db = database.get_db()
+    scheduled = [row[0] for row in db.execute("SELECT match_id FROM matches WHERE status = 'SCHEDULED' ORDER BY match_id")]
+    team_ids = [row[0] for row in db.execute("SELECT team_id FROM teams ORDER BY team_id LIMIT 2")]
+
+    call('post', '/register', data={'username': 'nuevo', 'email': 'nuevo@uni.edu', 'password': 'x'})
+    call('post', '/login', data={'email': 'admin@uni.edu', 'password': 'admin'})
+    call('get', '/')
+    call('get', '/board')
+    call('post', f'/bet/{scheduled[0]}', data={'wager_amount': 1, 'bet_type': 'HOME_WIN'})
+    call('post', '/combo_bet', data={'selection': [f'{scheduled[0]}-HOME_WIN', f'{scheduled[1]}-DRAW'], 'combo_wager': 1})
+    call('post', '/api/betslip', json={
+        'singles': [{'match_id': match_id, 'bet_type': 'DRAW', 'wager': 1} for match_id in scheduled[:3]],
+        'combos': [{'selections': [{'match_id': scheduled[2], 'bet_type': 'HOME_WIN'}, {'match_id': scheduled[3], 'bet_type': 'AWAY_WIN'}], 'wager': 1}],
+    })
+    call('get', '/profile')
+    call('get', '/profile', query_string={'bets_before': '2100-01-01 00:00:00|1000000', 'combos_before': '2100-01-01 00:00:00|1000000'})
+    call('get', '/api/profile/bets', query_string={'limit': 5})
+    call('get', '/api/profile/combo_bets', query_string={'before': '2100-01-01 00:00:00|1000000'})
+    call('get', '/admin')
+    call('get', '/admin/metrics')
+    call('get', '/metrics')
+    call('post', '/admin-actions', data={'action': 'add_team', 'team_name': 'Equipo Nuevo'})
+    call('post', '/admin-actions', data={'action': 'add_match', 'home_team_id': team_ids[0], 'away_team_id': team_ids[1], 'match_datetime': '2031-01-01T10:00'})
+    call('post', '/admin-actions', data={'action': 'settle_match', 'match_id': scheduled[0], 'home_score': 1, 'away_score': 0})
+    call('post', '/admin-actions', data={'action': 'cancel_match', 'match_id': scheduled[1]})
+    # El mismo desenlace pedido otra vez devuelve el trabajo existente.
+    call('post', '/admin-actions', data={'action': 'cancel_match', 'match_id': scheduled[0]})
+    call('get', '/admin/jobs/1')
+    call('post', '/admin-actions', data={'action': 'add_tokens', 'user_id': 2, 'amount': 5})
+    call('post', '/admin-actions', data={'action': 'subtract_tokens', 'user_id': 2, 'amount': 5})
+    csv = b'home_team_id,away_team_id,match_datetime,home_score,away_score\nEquipo 0,Equipo 1,2019-01-01 10:00:00,1,1\n'
+    call('post', '/admin/upload', data={'file': (io.BytesIO(csv), 'resultados.csv')}, content_type='multipart/form-data')
+    call('get', '/api/ratings', query_string={'as_of': '2019-01-01'})
+    call('get', '/api/ratings', query_string={'as_of': '2100-01-01 00:00:00'})
+    # Con un corte en el futuro se archiva lo recién liquidado y el historial archivado tiene filas.
+    archive.archive_settled(db, app.config['ARCHIVE_DATABASE'], older_than_days=-36500)
+    call('get', '/profile', query_string={'archived': 1})
+    call('get', '/api/profile/bets', query_string={'archived': 1, 'before': '2100-01-01 00:00:00|1000000'})
+    call('get', '/api/profile/combo_bets', query_string={'archived': 1})
+    call('get', '/logout')
+
+@pytest.fixture
+def captured(app, monkeypatch):
+    """[(endpoint, sql, parámetros)] de cada sentencia ejecutada dentro de una petición."""
+    captured = []
+    timed = metrics.InstrumentedConnection._timed
+
+    def capture(self, method, sql, parameters, explain_parameters):
+        if has_request_context():
+            captured.append((request.endpoint, sql, explain_parameters))
+        return timed(self, method, sql, parameters, explain_parameters)
+
+    with app.app_context():
+        seed(database.get_db())
+    monkeypatch.setattr(metrics.InstrumentedConnection, '_timed', capture)
+    with app.app_context():
+        exercise_routes(app, app.test_client())
+    monkeypatch.undo()
+    return captured
+
+def test_routes_use_indexes_on_large_tables(app, captured):
+    statements = {}
+    for endpoint, sql, parameters in captured:
+        # Un `executemany` con la lista vacía no ejecuta nada ni trae parámetros para el EXPLAIN.
+        if sql.lstrip().upper().startswith(TRACED_STATEMENTS) and parameters is not None:
+            statements.setdefault((endpoint, metrics.normalize_sql(sql)), (sql, parameters))
+    assert len({endpoint for endpoint, _ in statements}) >= 18
+
+    with app.app_context():
+        db = database.get_db()
+        archive.attach(db, app.config['ARCHIVE_DATABASE'])
+        failures = [f'[{endpoint}] {" | ".join(violations)}\n    {key}'
+                    for (endpoint, key), (sql, parameters) in sorted(statements.items())
+                    for violations in [plan_violations(db, sql, parameters)] if violations]
+    assert not failures, '\n'.join(failures)
@@ -0,0 +1,78 @@
+import json
+import pytest
+import betslip
+import settlement
+
+def place(db, user_id, singles=(), combos=()):
+    with db:
+        return betslip.place_betslip(db, user_id, {'singles': list(singles), 'combos': list(combos)})
+
+def balance(db, user_id):
+    return db.execute("SELECT token_balance FROM users WHERE user_id = ?", (user_id,)).fetchone()[0]
+
+def combo_status(db, combo_bet_id):
+    return tuple(db.execute("SELECT status, potential_payout FROM combo_bets WHERE combo_bet_id = ?", (combo_bet_id,)).fetchone())
+
+def test_settle_pays_winning_singles_once(db, add_user, add_match, ledger_mismatches):
+    ana, bea = add_user('ana'), add_user('bea')
+    match_id = add_match('Local', 'Visitante')
+    place(db, ana, singles=[(match_id, 'HOME_WIN', 10.0)])
+    place(db, bea, singles=[(match_id, 'DRAW', 10.0), (match_id, 'AWAY_WIN', 5.0)])
+
+    with db:
+        stats = settlement.settle_match(db, match_id, 2, 1)
+
+    assert (stats['won'], stats['lost']) == (1, 2)
+    assert balance(db, ana) == pytest.approx(100 - 10 + 10 * 2.0)
+    assert balance(db, bea) == pytest.approx(100 - 15)
+    assert db.execute("SELECT COUNT(*) FROM bets WHERE status = 'ACTIVE'").fetchone()[0] == 0
+    with pytest.raises(ValueError):
+        settlement.settle_match(db, match_id, 0, 0)
+    assert ledger_mismatches() == []
+
+def test_cancel_refunds_singles_and_voids_combo_legs(db, add_user, add_match, ledger_mismatches):
+    ana, bea = add_user('ana'), add_user('bea')
+    a, b, c = add_match('A1', 'A2'), add_match('B1', 'B2'), add_match('C1', 'C2')
+    place(db, ana, singles=[(a, 'HOME_WIN', 10.0), (b, 'HOME_WIN', 7.0)],
+          combos=[([(a, 'DRAW'), (c, 'HOME_WIN')], 10.0)])
+    placed = place(db, bea, singles=[(a, 'DRAW', 10.0)],
+                   combos=[([(a, 'HOME_WIN'), (b, 'DRAW')], 10.0), ([(b, 'AWAY_WIN'), (c, 'DRAW')], 4.0)])
+    voided_leg, all_voided = [combo['combo_bet_id'] for combo in placed['combos']]
+
+    # B cancelado: la simple se devuelve y en las combinadas la selección cuenta con cuota 1.
+    with db:
+        assert settlement.cancel_match(db, b)['refunded'] == 3
+    assert balance(db, ana) == pytest.approx(100 - 27 + 7)
+    assert combo_status(db, voided_leg) == ('ACTIVE', pytest.approx(10.0 * 2.0))
+    assert combo_status(db, all_voided) == ('ACTIVE', pytest.approx(4.0 * 3.0))
+
+    # A termina 1-0: gana la combinada con la selección anulada y pierde la de ana.
+    with db:
+        stats = settlement.settle_match(db, a, 1, 0)
+    assert (stats['combos_won'], stats['combos_lost']) == (1, 1)
+    assert combo_status(db, voided_leg) == ('WON', pytest.approx(20.0))
+
+    # C cancelado: la combinada con todas sus selecciones anuladas devuelve lo apostado.
+    with db:
+        settlement.cancel_match(db, c)
+    assert combo_status(db, all_voided)[0] == 'CANCELLED'
+
+    assert balance(db, ana) == pytest.approx(100 - 10 - 7 - 10 + 20 + 7)
+    assert balance(db, bea) == pytest.approx(100 - 10 - 10 - 4 + 20 + 4)
+    assert db.execute("SELECT COUNT(*) FROM transactions WHERE transaction_type = 'COMBO_WINNINGS'").fetchone()[0] == 1
+    assert ledger_mismatches() == []
+
+def test_settle_publishes_one_account_event_per_user(db, add_user, add_match):
+    ana, bea = add_user('ana'), add_user('bea')
+    a, b = add_match('A1', 'A2'), add_match('B1', 'B2')
+    place(db, ana, singles=[(a, 'HOME_WIN', 1.0)] * 5)
+    combo_id = place(db, bea, singles=[(a, 'DRAW', 1.0)], combos=[([(a, 'HOME_WIN'), (b, 'DRAW')], 2.0)])['combos'][0]['combo_bet_id']
+
+    with db:
+        settlement.settle_match(db, a, 1, 0)
+
+    rows = db.execute("SELECT user_id, data FROM events WHERE event = 'account' AND data ->> 'match_id' = ? ORDER BY user_id", (a,)).fetchall()
+    assert [row['user_id'] for row in rows] == [ana, bea]
+    events = {row['user_id']: json.loads(row['data']) for row in rows}
+    assert events[ana] == {'balance': pytest.approx(balance(db, ana)), 'match_id': a, 'result': 'HOME_WIN', 'combos': []}
+    assert events[bea]['combos'] == [{'combo_bet_id': combo_id, 'status': 'ACTIVE', 'potential_payout': pytest.approx(2.0 * 2.0 * 3.0)}]
@@ -0,0 +1,83 @@
+import random
+import threading
+import time
+import pytest
+import database
+import settlement
+import wallet
+
+def test_concurrent_debits_never_overdraw(app, db, add_user):
+    user_id = add_user('ana', balance=100.0)
+    results = []
+
+    def spend():
+        connection = database.connect(app.config['DATABASE'], app.config)
+        try:
+            for _ in range(10):
+                with connection:
+                    results.append(wallet.debit(connection, user_id, 7.0))
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=spend) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results.count(True) == 100 // 7
+    assert db.execute("SELECT token_balance FROM users WHERE user_id = ?", (user_id,)).fetchone()[0] == 100 - 7 * (100 // 7)
+
+@pytest.mark.parametrize('amount', [0, -5])
+def test_debit_rejects_non_positive_amounts(db, add_user, amount):
+    user_id = add_user('ana')
+    with pytest.raises(ValueError):
+        wallet.debit(db, user_id, amount)
+
+def test_concurrent_bets_keep_balances_and_close_with_the_match(app, db, add_user, add_match, ledger_mismatches):
+    """Apuestas simples, combinadas y boletos desde varios hilos mientras se cancela un partido."""
+    user_ids = [add_user(f'user{i}', balance=300.0) for i in range(3)]
+    match_ids = [add_match(f'Local {i}', f'Visitante {i}') for i in range(4)]
+    cancelled = match_ids[0]
+
+    def bettor(seed):
+        rng = random.Random(seed)
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['user_id'] = rng.choice(user_ids)
+        for _ in range(30):
+            roll = rng.random()
+            first, second = rng.sample(match_ids, 2)
+            if roll < 0.5:
+                client.post(f'/bet/{first}', data={'wager_amount': rng.randint(1, 40), 'bet_type': 'HOME_WIN'})
+            elif roll < 0.8:
+                client.post('/api/betslip', json={
+                    'singles': [{'match_id': match_id, 'bet_type': 'DRAW', 'wager': rng.randint(1, 10)} for match_id in match_ids],
+                    'combos': [{'selections': [{'match_id': first, 'bet_type': 'HOME_WIN'}, {'match_id': second, 'bet_type': 'DRAW'}],
+                                'wager': rng.randint(1, 20)}],
+                })
+            else:
+                client.post('/combo_bet', data={'selection': [f'{first}-DRAW', f'{second}-AWAY_WIN'], 'combo_wager': rng.randint(1, 40)})
+        database.close_pooled_connections()
+
+    def cancel():
+        # Se cancela con apuestas ya colocadas en el partido y otras todavía en curso.
+        connection = database.connect(app.config['DATABASE'], app.config)
+        try:
+            while connection.execute("SELECT COUNT(*) FROM bets WHERE match_id = ?", (cancelled,)).fetchone()[0] < 10:
+                time.sleep(0.001)
+            with connection:
+                settlement.cancel_match(connection, cancelled)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=bettor, args=(seed,)) for seed in range(8)]
+    for thread in threads:
+        thread.start()
+    cancel()
+    for thread in threads:
+        thread.join()
+
+    assert ledger_mismatches() == []
+    assert db.execute("SELECT COUNT(*) FROM bets WHERE match_id = ? AND status = 'ACTIVE'", (cancelled,)).fetchone()[0] == 0
+    assert db.execute("SELECT COUNT(*) FROM bets WHERE match_id = ? AND status = 'CANCELLED'", (cancelled,)).fetchone()[0] >= 10
@@ -0,0 +1,35 @@
+def debit(db, user_id, amount):
+    """
+    Descuenta `amount` del balance solo si alcanza, en una única sentencia.
+    El propio UPDATE comprueba el saldo, así que dos peticiones concurrentes no
+    pueden gastar el mismo dinero. Devuelve True si se descontó.
+    """
+    if amount <= 0:
+        raise ValueError('El monto debe ser positivo.')
+    cursor = db.execute(
+        "UPDATE users SET token_balance = token_balance - ? WHERE user_id = ? AND token_balance >= ?",
+        (amount, user_id, amount))
+    return cursor.rowcount == 1
+
+def credit(db, user_id, amount):
+    """Suma `amount` al balance sin leerlo antes. Devuelve False si el usuario no existe."""
+    if amount <= 0:
+        raise ValueError('El monto debe ser positivo.')
+    cursor = db.execute("UPDATE users SET token_balance = token_balance + ? WHERE user_id = ?", (amount, user_id))
+    return cursor.rowcount == 1
+
+# Balance de cada usuario frente a la suma de sus movimientos: los vivos y los ya
+# movidos a la base de archivo (`user_archive_totals.ledger_amount`).
+LEDGER_SQL = """
+    SELECT u.user_id, u.token_balance, COALESCE(SUM(t.amount), 0) + COALESCE(a.ledger_amount, 0) AS ledger
+    FROM users u
+    LEFT JOIN transactions t ON t.user_id = u.user_id
+    LEFT JOIN user_archive_totals a ON a.user_id = u.user_id
+    WHERE u.is_admin = 0
+    GROUP BY u.user_id
+"""
+
+def ledger_mismatches(db, tolerance=1e-6):
+    """Usuarios cuyo balance es negativo o no cuadra con la suma de sus movimientos."""
+    rows = db.execute(LEDGER_SQL).fetchall()
+    return [dict(row) for row in rows if abs(row['token_balance'] - row['ledger']) > tolerance or row['token_balance'] < 0]